@@ -6,7 +6,7 @@
 使用Pine Script技術分析邏輯，專門針對台灣上市市場股票進行主力資金進場信號篩選
 """
 
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, g, Response, stream_with_context
 import requests
 import json
 import math
@@ -16,22 +16,104 @@ import logging
 import traceback
 from typing import Dict, List, Optional, Tuple, Any
 import time
+import os
+import sys
 import urllib3
 
+from indicators import calculate_pine_script_indicators_from_columns, classify_signal
+from history_store import HistoryStore
+from indicator_pool import IndicatorProcessPool
+from pipeline import Pipeline, Stage
+from fetch_scheduler import FetchScheduler, parse_codes, parse_weights
+from metrics import registry as metrics_registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+import upstream
+from upstream import upstream_get, upstream_stats, classify_exception, outcome_delta
+from profiler import profile_manager
+from memory_stats import deep_sizeof, process_memory, memory_tracker
+from log_utils import configure_logging, LogSampler, RunSummary
+from health_probe import HealthProber, Probe
+from stock_universe import StockUniverse
+import exporters
+from signal_archive import SignalArchive, FLAGS as SIGNAL_FLAGS
+from contextlib import contextmanager
+import hmac
+
 # 抑制SSL警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-# 設定日誌
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# 設定日誌（非同步輸出；逐股日誌為取樣的 DEBUG，每次執行另輸出一筆摘要）
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLE_EVERY = int(os.environ.get('LOG_SAMPLE_EVERY', '100'))
+configure_logging(getattr(logging, LOG_LEVEL, logging.INFO))
 logger = logging.getLogger(__name__)
+stock_log = LogSampler(logger, every=LOG_SAMPLE_EVERY)
 
 app = Flask(__name__)
 
+# 執行期指標（/api/metrics 以 Prometheus 格式輸出）
+STAGE_DURATION = metrics_registry.histogram(
+    'twse_screener_stage_duration_seconds', '各處理階段耗時（秒）', ['stage'])
+STAGE_RUNS = metrics_registry.counter(
+    'twse_screener_stage_runs_total', '各處理階段執行次數', ['stage', 'outcome'])
+HTTP_DURATION = metrics_registry.histogram(
+    'twse_screener_http_request_duration_seconds', 'API 路由處理耗時（秒）', ['route', 'method'])
+HTTP_REQUESTS = metrics_registry.counter(
+    'twse_screener_http_requests_total', 'API 路由請求數', ['route', 'method', 'status'])
+INDICATOR_STOCKS = metrics_registry.counter(
+    'twse_screener_indicator_stocks_total', '完成指標計算的股票數', ['mode'])
+SNAPSHOT_STOCKS = metrics_registry.gauge(
+    'twse_screener_snapshot_stocks', '目前快照中的股票數')
+SNAPSHOT_VERSION = metrics_registry.gauge(
+    'twse_screener_snapshot_version', '目前快照版本')
+SNAPSHOT_PARTIAL = metrics_registry.gauge(
+    'twse_screener_snapshot_partial', '目前快照是否為部分快照（1=是）')
+
+@contextmanager
+def observe_stage(stage):
+    """記錄一個處理階段的耗時與結果
+    
+    產生的 dict 可設定 run['outcome'] 以標記未拋出例外的失敗。
+    """
+    start = time.perf_counter()
+    run = {'outcome': 'success'}
+    try:
+        yield run
+    except Exception:
+        run['outcome'] = 'error'
+        raise
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - start, stage=stage)
+        STAGE_RUNS.inc(stage=stage, outcome=run['outcome'])
+
+# 上游資料來源位址（可指向本地替身伺服器做離線負載測試，見 loadtest/standin_server.py）
+YAHOO_BASE_URL = os.environ.get('YAHOO_BASE_URL', 'https://query1.finance.yahoo.com').rstrip('/')
+TWSE_OPENAPI_BASE_URL = os.environ.get('TWSE_OPENAPI_BASE_URL', 'https://openapi.twse.com.tw').rstrip('/')
+TWSE_BASE_URL = os.environ.get('TWSE_BASE_URL', 'https://www.twse.com.tw').rstrip('/')
+
+# 上游請求重試設定（逾時、429、5xx、連線錯誤時重試）
+upstream.max_retries = int(os.environ.get('UPSTREAM_MAX_RETRIES', '0'))
+upstream.retry_backoff = float(os.environ.get('UPSTREAM_RETRY_BACKOFF', '0.5'))
+
+# 管理端點（剖析等）的存取權杖；未設定時管理端點一律停用
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
 # 全域變數
 stocks_data = {}
 last_update_time = None
 data_date = None
 
+# 快照版本資訊：更新進行中會分段發布部分快照（partial=True）
+snapshot_meta = {
+    'version': 0,
+    'partial': False,
+    'coverage': 0,
+    'total': 0,
+    'published_at': None
+}
+
+# 最近一次完整快照：新交易日的部分快照涵蓋率不足時繼續提供，更新失敗時還原
+last_full_snapshot = {'stocks': {}, 'date': None}
+
 # 非同步更新狀態
 import threading
 update_status = {
@@ -45,6 +127,63 @@ update_status = {
 }
 update_lock = threading.Lock()
 
+# 本地歷史K線存放區（欄式 mmap 檔，多行程共用 page cache）
+HISTORY_STORE_PATH = os.environ.get(
+    'HISTORY_STORE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'history.bin')
+)
+HISTORY_MAX_DAYS = int(os.environ.get('HISTORY_MAX_DAYS', '120'))
+history_store = HistoryStore(HISTORY_STORE_PATH, max_days=HISTORY_MAX_DAYS)
+
+# 每日信號封存（只附加的 gzip 檔 + 日期 / 代碼索引），供 /api/signals/history 查詢
+SIGNAL_ARCHIVE_PATH = os.environ.get(
+    'SIGNAL_ARCHIVE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'signal_archive.gz')
+)
+signal_archive = SignalArchive(SIGNAL_ARCHIVE_PATH)
+
+# 指標計算執行模式：inline（請求執行緒內計算）或 process（行程池，避開 GIL）
+INDICATOR_EXECUTION_MODE = os.environ.get('INDICATOR_EXECUTION_MODE', 'inline')
+INDICATOR_PROCESS_WORKERS = int(os.environ.get('INDICATOR_PROCESS_WORKERS', '0')) or (os.cpu_count() or 1)
+INDICATOR_CHUNK_SIZE = int(os.environ.get('INDICATOR_CHUNK_SIZE', '50'))
+# process 模式下每次送往行程池至少湊滿的股票數與最長等待時間（下載較慢時避免每次只送一支）
+INDICATOR_MIN_BATCH = int(os.environ.get('INDICATOR_MIN_BATCH', '16'))
+INDICATOR_BATCH_LINGER_MS = float(os.environ.get('INDICATOR_BATCH_LINGER_MS', '100'))
+# 更新期間每完成 N 支股票發布一次部分快照（0 表示停用）
+PARTIAL_SNAPSHOT_EVERY = int(os.environ.get('PARTIAL_SNAPSHOT_EVERY', '100'))
+# 已有前一交易日的完整快照時，部分快照至少涵蓋其股票數的此比例才取代它
+PARTIAL_SNAPSHOT_MIN_COVERAGE = float(os.environ.get('PARTIAL_SNAPSHOT_MIN_COVERAGE', '0.8'))
+
+# 下載優先順序：自選清單 → 前一日成交量 → 近期信號候選股
+WATCHLIST_CODES = parse_codes(os.environ.get('WATCHLIST_CODES', ''))
+FETCH_PRIORITY_WEIGHTS = parse_weights(os.environ.get('FETCH_PRIORITY_WEIGHTS', ''))
+FAST_REFRESH_MIN_VOLUME = int(os.environ.get('FAST_REFRESH_MIN_VOLUME', '500000'))  # 股（500張）
+fetch_scheduler = FetchScheduler(
+    watchlist=WATCHLIST_CODES,
+    weights=FETCH_PRIORITY_WEIGHTS,
+    fast_min_volume=FAST_REFRESH_MIN_VOLUME
+)
+
+# 最近一次更新與篩選的執行摘要
+last_run_summaries = {}
+
+# 最近一次篩選的信號候選股（黃柱、突破或超賣），供下次更新優先下載
+recent_signal_codes = set()
+
+# 最近一次篩選的完整結果（依評分排序），供 /api/export/screen 匯出
+last_screen_results = []
+
+# 串流管線設定：各階段以有界佇列串接
+UPDATE_FETCH_WORKERS = int(os.environ.get('UPDATE_FETCH_WORKERS', '20'))
+SCREEN_FETCH_WORKERS = int(os.environ.get('SCREEN_FETCH_WORKERS', '4'))
+PIPELINE_QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', '64'))
+
+indicator_pool = IndicatorProcessPool(
+    workers=INDICATOR_PROCESS_WORKERS,
+    chunk_size=INDICATOR_CHUNK_SIZE,
+    store_path=HISTORY_STORE_PATH
+)
+
 # 台灣時區
 TW_TZ = pytz.timezone('Asia/Taipei')
 
@@ -86,1106 +225,35 @@ def convert_ad_date_to_roc(ad_date_str):
         return None
 
 # ====== 內建上市股票清單（2026-03-06 更新）======
-# 此清單用於 Render 等海外環境（TWSE API 被封鎖時的備用方案）
-BUILTIN_TWSE_STOCK_LIST = {
-    "1101": "台泥",
-    "1102": "亞泥",
-    "1103": "嘉泥",
-    "1104": "環泥",
-    "1108": "幸福",
-    "1109": "信大",
-    "1110": "東泥",
-    "1201": "味全",
-    "1203": "味王",
-    "1210": "大成",
-    "1213": "大飲",
-    "1215": "卜蜂",
-    "1216": "統一",
-    "1217": "愛之味",
-    "1218": "泰山",
-    "1219": "福壽",
-    "1220": "台榮",
-    "1225": "福懋油",
-    "1227": "佳格",
-    "1229": "聯華",
-    "1231": "聯華食",
-    "1232": "大統益",
-    "1233": "天仁",
-    "1234": "黑松",
-    "1235": "興泰",
-    "1236": "宏亞",
-    "1256": "鮮活果汁-KY",
-    "1301": "台塑",
-    "1303": "南亞",
-    "1304": "台聚",
-    "1305": "華夏",
-    "1307": "三芳",
-    "1308": "亞聚",
-    "1309": "台達化",
-    "1310": "台苯",
-    "1312": "國喬",
-    "1313": "聯成",
-    "1314": "中石化",
-    "1315": "達新",
-    "1316": "上曜",
-    "1319": "東陽",
-    "1321": "大洋",
-    "1323": "永裕",
-    "1324": "地球",
-    "1325": "恆大",
-    "1326": "台化",
-    "1337": "再生-KY",
-    "1338": "廣華-KY",
-    "1339": "昭輝",
-    "1340": "勝悅-KY",
-    "1341": "富林-KY",
-    "1342": "八貫",
-    "1402": "遠東新",
-    "1409": "新纖",
-    "1410": "南染",
-    "1413": "宏洲",
-    "1414": "東和",
-    "1416": "廣豐",
-    "1417": "嘉裕",
-    "1418": "東華",
-    "1419": "新紡",
-    "1423": "利華",
-    "1432": "大魯閣",
-    "1434": "福懋",
-    "1435": "中福",
-    "1436": "華友聯",
-    "1437": "勤益控",
-    "1438": "三地開發",
-    "1439": "雋揚",
-    "1440": "南紡",
-    "1441": "大東",
-    "1442": "名軒",
-    "1443": "立益物流",
-    "1444": "力麗",
-    "1445": "大宇",
-    "1446": "宏和",
-    "1447": "力鵬",
-    "1449": "佳和",
-    "1451": "年興",
-    "1452": "宏益",
-    "1453": "大將",
-    "1454": "台富",
-    "1455": "集盛",
-    "1456": "怡華",
-    "1457": "宜進",
-    "1459": "聯發",
-    "1460": "宏遠",
-    "1463": "強盛新",
-    "1464": "得力",
-    "1465": "偉全",
-    "1466": "聚隆",
-    "1467": "南緯",
-    "1468": "昶和",
-    "1470": "大統新創",
-    "1471": "首利",
-    "1472": "三洋實業",
-    "1473": "台南",
-    "1474": "弘裕",
-    "1475": "業旺",
-    "1476": "儒鴻",
-    "1477": "聚陽",
-    "1503": "士電",
-    "1504": "東元",
-    "1506": "正道",
-    "1512": "瑞利",
-    "1513": "中興電",
-    "1514": "亞力",
-    "1515": "力山",
-    "1516": "川飛",
-    "1517": "利奇",
-    "1519": "華城",
-    "1521": "大億",
-    "1522": "堤維西",
-    "1524": "耿鼎",
-    "1525": "江申",
-    "1526": "日馳",
-    "1527": "鑽全",
-    "1528": "恩德",
-    "1529": "樂事綠能",
-    "1530": "亞崴",
-    "1531": "高林股",
-    "1532": "勤美",
-    "1533": "車王電",
-    "1535": "中宇",
-    "1536": "和大",
-    "1537": "廣隆",
-    "1538": "正峰",
-    "1539": "巨庭",
-    "1540": "喬福",
-    "1541": "錩泰",
-    "1558": "伸興",
-    "1560": "中砂",
-    "1563": "巧新",
-    "1568": "倉佑",
-    "1582": "信錦",
-    "1583": "程泰",
-    "1587": "吉茂",
-    "1589": "永冠-KY",
-    "1590": "亞德客-KY",
-    "1597": "直得",
-    "1598": "岱宇",
-    "1603": "華電",
-    "1604": "聲寶",
-    "1605": "華新",
-    "1608": "華榮",
-    "1609": "大亞",
-    "1611": "中電",
-    "1612": "宏泰",
-    "1614": "三洋電",
-    "1615": "大山",
-    "1616": "億泰",
-    "1617": "榮星",
-    "1618": "合機",
-    "1623": "大東電",
-    "1626": "艾美特-KY",
-    "1702": "南僑",
-    "1707": "葡萄王",
-    "1708": "東鹼",
-    "1709": "和益",
-    "1710": "東聯",
-    "1711": "永光",
-    "1712": "興農",
-    "1713": "國化",
-    "1714": "和桐",
-    "1717": "長興",
-    "1718": "中纖",
-    "1720": "生達",
-    "1721": "三晃",
-    "1722": "台肥",
-    "1723": "中碳",
-    "1725": "元禎",
-    "1726": "永記",
-    "1727": "中華化",
-    "1730": "花仙子",
-    "1731": "美吾華",
-    "1732": "毛寶",
-    "1733": "五鼎",
-    "1734": "杏輝",
-    "1735": "日勝化",
-    "1736": "喬山",
-    "1737": "臺鹽",
-    "1752": "南光",
-    "1760": "寶齡富錦",
-    "1762": "中化生",
-    "1773": "勝一",
-    "1776": "展宇",
-    "1783": "和康生",
-    "1786": "科妍",
-    "1789": "神隆",
-    "1795": "美時",
-    "1802": "台玻",
-    "1805": "寶徠",
-    "1806": "冠軍",
-    "1808": "潤隆",
-    "1809": "中釉",
-    "1810": "和成",
-    "1817": "凱撒衛",
-    "1903": "士紙",
-    "1904": "正隆",
-    "1905": "華紙",
-    "1906": "寶隆",
-    "1907": "永豐餘",
-    "1909": "榮成",
-    "2002": "中鋼",
-    "2006": "東和鋼鐵",
-    "2007": "燁興",
-    "2008": "高興昌",
-    "2009": "第一銅",
-    "2010": "春源",
-    "2012": "春雨",
-    "2013": "中鋼構",
-    "2014": "中鴻",
-    "2015": "豐興",
-    "2017": "官田鋼",
-    "2020": "美亞",
-    "2022": "聚亨",
-    "2023": "燁輝",
-    "2024": "志聯",
-    "2025": "千興",
-    "2027": "大成鋼",
-    "2028": "威致",
-    "2029": "盛餘",
-    "2030": "彰源",
-    "2031": "新光鋼",
-    "2032": "新鋼",
-    "2033": "佳大",
-    "2034": "允強",
-    "2038": "海光",
-    "2049": "上銀",
-    "2059": "川湖",
-    "2062": "橋椿",
-    "2069": "運錩",
-    "2101": "南港",
-    "2102": "泰豐",
-    "2103": "台橡",
-    "2104": "國際中橡",
-    "2105": "正新",
-    "2106": "建大",
-    "2107": "厚生",
-    "2108": "南帝",
-    "2109": "華豐",
-    "2114": "鑫永銓",
-    "2115": "六暉-KY",
-    "2201": "裕隆",
-    "2204": "中華",
-    "2206": "三陽工業",
-    "2207": "和泰車",
-    "2208": "台船",
-    "2211": "長榮鋼",
-    "2227": "裕日車",
-    "2228": "劍麟",
-    "2231": "為升",
-    "2233": "宇隆",
-    "2236": "百達-KY",
-    "2239": "英利-KY",
-    "2241": "艾姆勒",
-    "2243": "宏旭-KY",
-    "2247": "汎德永業",
-    "2248": "華勝-KY",
-    "2250": "IKKA-KY",
-    "2254": "巨鎧精密-創",
-    "2258": "鴻華先進-創",
-    "2301": "光寶科",
-    "2302": "麗正",
-    "2303": "聯電",
-    "2305": "全友",
-    "2308": "台達電",
-    "2312": "金寶",
-    "2313": "華通",
-    "2314": "台揚",
-    "2316": "楠梓電",
-    "2317": "鴻海",
-    "2321": "東訊",
-    "2323": "中環",
-    "2324": "仁寶",
-    "2327": "國巨*",
-    "2328": "廣宇",
-    "2329": "華泰",
-    "2330": "台積電",
-    "2331": "精英",
-    "2332": "友訊",
-    "2337": "旺宏",
-    "2338": "光罩",
-    "2340": "台亞",
-    "2342": "茂矽",
-    "2344": "華邦電",
-    "2345": "智邦",
-    "2347": "聯強",
-    "2348": "海悅",
-    "2349": "錸德",
-    "2351": "順德",
-    "2352": "佳世達",
-    "2353": "宏碁",
-    "2354": "鴻準",
-    "2355": "敬鵬",
-    "2356": "英業達",
-    "2357": "華碩",
-    "2359": "所羅門",
-    "2360": "致茂",
-    "2362": "藍天",
-    "2363": "矽統",
-    "2364": "倫飛",
-    "2365": "昆盈",
-    "2367": "燿華",
-    "2368": "金像電",
-    "2369": "菱生",
-    "2371": "大同",
-    "2373": "震旦行",
-    "2374": "佳能",
-    "2375": "凱美",
-    "2376": "技嘉",
-    "2377": "微星",
-    "2379": "瑞昱",
-    "2380": "虹光",
-    "2382": "廣達",
-    "2383": "台光電",
-    "2385": "群光",
-    "2387": "精元",
-    "2388": "威盛",
-    "2390": "云辰",
-    "2392": "正崴",
-    "2393": "億光",
-    "2395": "研華",
-    "2397": "友通",
-    "2399": "映泰",
-    "2401": "凌陽",
-    "2402": "毅嘉",
-    "2404": "漢唐",
-    "2405": "輔信",
-    "2406": "國碩",
-    "2408": "南亞科",
-    "2409": "友達",
-    "2412": "中華電",
-    "2413": "環科",
-    "2414": "精技",
-    "2415": "錩新",
-    "2417": "圓剛",
-    "2419": "仲琦",
-    "2420": "新巨",
-    "2421": "建準",
-    "2423": "固緯",
-    "2424": "隴華",
-    "2425": "承啟",
-    "2426": "鼎元",
-    "2427": "三商電",
-    "2428": "興勤",
-    "2429": "銘旺科",
-    "2430": "燦坤",
-    "2431": "聯昌",
-    "2432": "倚天酷碁-創",
-    "2433": "互盛電",
-    "2434": "統懋",
-    "2436": "偉詮電",
-    "2438": "翔耀",
-    "2439": "美律",
-    "2440": "太空梭",
-    "2441": "超豐",
-    "2442": "新美齊",
-    "2444": "兆勁",
-    "2449": "京元電子",
-    "2450": "神腦",
-    "2451": "創見",
-    "2453": "凌群",
-    "2454": "聯發科",
-    "2455": "全新",
-    "2457": "飛宏",
-    "2458": "義隆",
-    "2459": "敦吉",
-    "2460": "建通",
-    "2461": "光群雷",
-    "2462": "良得電",
-    "2464": "盟立",
-    "2465": "麗臺",
-    "2466": "冠西電",
-    "2467": "志聖",
-    "2468": "華經",
-    "2471": "資通",
-    "2472": "立隆電",
-    "2474": "可成",
-    "2476": "鉅祥",
-    "2477": "美隆電",
-    "2478": "大毅",
-    "2480": "敦陽科",
-    "2481": "強茂",
-    "2482": "連宇",
-    "2483": "百容",
-    "2484": "希華",
-    "2485": "兆赫",
-    "2486": "一詮",
-    "2488": "漢平",
-    "2489": "瑞軒",
-    "2491": "吉祥全",
-    "2492": "華新科",
-    "2493": "揚博",
-    "2495": "普安",
-    "2496": "卓越",
-    "2497": "怡利電",
-    "2498": "宏達電",
-    "2501": "國建",
-    "2504": "國產",
-    "2505": "國揚",
-    "2506": "太設",
-    "2509": "全坤建",
-    "2511": "太子",
-    "2514": "龍邦",
-    "2515": "中工",
-    "2516": "新建",
-    "2520": "冠德",
-    "2524": "京城",
-    "2527": "宏璟",
-    "2528": "皇普",
-    "2530": "華建",
-    "2534": "宏盛",
-    "2535": "達欣工",
-    "2536": "宏普",
-    "2537": "聯上發",
-    "2538": "基泰",
-    "2539": "櫻花建",
-    "2540": "愛山林",
-    "2542": "興富發",
-    "2543": "皇昌",
-    "2545": "皇翔",
-    "2546": "根基",
-    "2547": "日勝生",
-    "2548": "華固",
-    "2597": "潤弘",
-    "2601": "益航",
-    "2603": "長榮",
-    "2605": "新興",
-    "2606": "裕民",
-    "2607": "榮運",
-    "2608": "嘉里大榮",
-    "2609": "陽明",
-    "2610": "華航",
-    "2611": "志信",
-    "2612": "中航",
-    "2613": "中櫃",
-    "2614": "東森",
-    "2615": "萬海",
-    "2616": "山隆",
-    "2617": "台航",
-    "2618": "長榮航",
-    "2630": "亞航",
-    "2633": "台灣高鐵",
-    "2634": "漢翔",
-    "2636": "台驊控股",
-    "2637": "慧洋-KY",
-    "2642": "宅配通",
-    "2645": "長榮航太",
-    "2646": "星宇航空",
-    "2701": "萬企",
-    "2702": "華園",
-    "2704": "國賓",
-    "2705": "六福",
-    "2706": "第一店",
-    "2707": "晶華",
-    "2712": "遠雄來",
-    "2722": "夏都",
-    "2723": "美食-KY",
-    "2727": "王品",
-    "2731": "雄獅",
-    "2739": "寒舍",
-    "2748": "雲品",
-    "2753": "八方雲集",
-    "2762": "世界健身-KY",
-    "2801": "彰銀",
-    "2812": "台中銀",
-    "2816": "旺旺保",
-    "2820": "華票",
-    "2832": "台產",
-    "2834": "臺企銀",
-    "2836": "高雄銀",
-    "2838": "聯邦銀",
-    "2845": "遠東銀",
-    "2849": "安泰銀",
-    "2850": "新產",
-    "2851": "中再保",
-    "2852": "第一保",
-    "2855": "統一證",
-    "2867": "三商壽",
-    "2880": "華南金",
-    "2881": "富邦金",
-    "2882": "國泰金",
-    "2883": "凱基金",
-    "2884": "玉山金",
-    "2885": "元大金",
-    "2886": "兆豐金",
-    "2887": "台新新光金",
-    "2889": "國票金",
-    "2890": "永豐金",
-    "2891": "中信金",
-    "2892": "第一金",
-    "2897": "王道銀行",
-    "2901": "欣欣",
-    "2903": "遠百",
-    "2904": "匯僑",
-    "2905": "三商",
-    "2906": "高林",
-    "2908": "特力",
-    "2910": "統領",
-    "2911": "麗嬰房",
-    "2912": "統一超",
-    "2913": "農林",
-    "2915": "潤泰全",
-    "2923": "鼎固-KY",
-    "2929": "淘帝-KY",
-    "2939": "永邑-KY",
-    "2945": "三商家購",
-    "3002": "歐格",
-    "3003": "健和興",
-    "3004": "豐達科",
-    "3005": "神基",
-    "3006": "晶豪科",
-    "3008": "大立光",
-    "3010": "華立",
-    "3011": "今皓",
-    "3013": "晟銘電",
-    "3014": "聯陽",
-    "3015": "全漢",
-    "3016": "嘉晶",
-    "3017": "奇鋐",
-    "3018": "隆銘綠能",
-    "3019": "亞光",
-    "3021": "鴻名",
-    "3022": "威強電",
-    "3023": "信邦",
-    "3024": "憶聲",
-    "3025": "星通",
-    "3026": "禾伸堂",
-    "3027": "盛達",
-    "3028": "增你強",
-    "3029": "零壹",
-    "3030": "德律",
-    "3031": "佰鴻",
-    "3032": "偉訓",
-    "3033": "威健",
-    "3034": "聯詠",
-    "3035": "智原",
-    "3036": "文曄",
-    "3037": "欣興",
-    "3038": "全台",
-    "3040": "遠見",
-    "3041": "揚智",
-    "3042": "晶技",
-    "3043": "科風",
-    "3044": "健鼎",
-    "3045": "台灣大",
-    "3046": "建碁",
-    "3047": "訊舟",
-    "3048": "益登",
-    "3049": "精金",
-    "3050": "鈺德",
-    "3051": "力特",
-    "3052": "夆典",
-    "3054": "立萬利",
-    "3055": "蔚華科",
-    "3056": "富華新",
-    "3057": "喬鼎",
-    "3058": "立德",
-    "3059": "華晶科",
-    "3060": "銘異",
-    "3062": "建漢",
-    "3090": "日電貿",
-    "3092": "鴻碩",
-    "3094": "聯傑",
-    "3130": "一零四",
-    "3135": "凌航",
-    "3138": "耀登",
-    "3149": "正達",
-    "3150": "鈺寶-創",
-    "3164": "景岳",
-    "3167": "大量",
-    "3168": "眾福科",
-    "3189": "景碩",
-    "3209": "全科",
-    "3229": "晟鈦",
-    "3231": "緯創",
-    "3257": "虹冠電",
-    "3266": "昇陽",
-    "3296": "勝德",
-    "3305": "昇貿",
-    "3308": "聯德",
-    "3311": "閎暉",
-    "3312": "弘憶股",
-    "3321": "同泰",
-    "3338": "泰碩",
-    "3346": "麗清",
-    "3356": "奇偶",
-    "3376": "新日興",
-    "3380": "明泰",
-    "3406": "玉晶光",
-    "3413": "京鼎",
-    "3416": "融程電",
-    "3419": "譁裕",
-    "3432": "台端",
-    "3437": "榮創",
-    "3443": "創意",
-    "3447": "展達",
-    "3450": "聯鈞",
-    "3454": "晶睿",
-    "3481": "群創",
-    "3494": "誠研",
-    "3501": "維熹",
-    "3504": "揚明光",
-    "3515": "華擎",
-    "3518": "柏騰",
-    "3528": "安馳",
-    "3530": "晶相光",
-    "3532": "台勝科",
-    "3533": "嘉澤",
-    "3535": "晶彩科",
-    "3543": "州巧",
-    "3545": "敦泰",
-    "3550": "聯穎",
-    "3557": "嘉威",
-    "3563": "牧德",
-    "3576": "聯合再生",
-    "3583": "辛耘",
-    "3588": "通嘉",
-    "3591": "艾笛森",
-    "3592": "瑞鼎",
-    "3593": "力銘",
-    "3596": "智易",
-    "3605": "宏致",
-    "3607": "谷崧",
-    "3617": "碩天",
-    "3622": "洋華",
-    "3645": "達邁",
-    "3652": "精聯",
-    "3653": "健策",
-    "3661": "世芯-KY",
-    "3665": "貿聯-KY",
-    "3669": "圓展",
-    "3673": "TPK-KY",
-    "3679": "新至陞",
-    "3686": "達能",
-    "3694": "海華",
-    "3701": "大眾控",
-    "3702": "大聯大",
-    "3703": "欣陸",
-    "3704": "合勤控",
-    "3705": "永信",
-    "3706": "神達",
-    "3708": "上緯投控",
-    "3711": "日月光投控",
-    "3712": "永崴投控",
-    "3714": "富采",
-    "3715": "定穎投控",
-    "3716": "中化控股",
-    "3717": "聯嘉投控",
-    "4104": "佳醫",
-    "4106": "雃博",
-    "4108": "懷特",
-    "4119": "旭富",
-    "4133": "亞諾法",
-    "4137": "麗豐-KY",
-    "4142": "國光生",
-    "4148": "全宇生技-KY",
-    "4155": "訊映",
-    "4164": "承業醫",
-    "4190": "佐登-KY",
-    "4306": "炎洲",
-    "4414": "如興",
-    "4426": "利勤",
-    "4438": "廣越",
-    "4439": "冠星-KY",
-    "4440": "宜新實業",
-    "4441": "振大環球",
-    "4526": "東台",
-    "4532": "瑞智",
-    "4536": "拓凱",
-    "4540": "全球傳動",
-    "4545": "銘鈺",
-    "4551": "智伸科",
-    "4552": "力達-KY",
-    "4555": "氣立",
-    "4557": "永新-KY",
-    "4560": "強信-KY",
-    "4562": "穎漢",
-    "4564": "元翎",
-    "4566": "時碩工業",
-    "4569": "六方科-KY",
-    "4571": "鈞興-KY",
-    "4572": "駐龍",
-    "4576": "大銀微系統",
-    "4581": "光隆精密-KY",
-    "4583": "台灣精銳",
-    "4585": "達明",
-    "4588": "玖鼎電力",
-    "4590": "富田-創",
-    "4720": "德淵",
-    "4722": "國精化",
-    "4736": "泰博",
-    "4737": "華廣",
-    "4739": "康普",
-    "4746": "台耀",
-    "4755": "三福化",
-    "4763": "材料*-KY",
-    "4764": "雙鍵",
-    "4766": "南寶",
-    "4770": "上品",
-    "4771": "望隼",
-    "4807": "日成-KY",
-    "4904": "遠傳",
-    "4906": "正文",
-    "4912": "聯德控股-KY",
-    "4915": "致伸",
-    "4916": "事欣科",
-    "4919": "新唐",
-    "4927": "泰鼎-KY",
-    "4930": "燦星網",
-    "4934": "太極",
-    "4935": "茂林-KY",
-    "4938": "和碩",
-    "4942": "嘉彰",
-    "4943": "康控-KY",
-    "4949": "有成精密",
-    "4952": "凌通",
-    "4956": "光鋐",
-    "4958": "臻鼎-KY",
-    "4960": "誠美材",
-    "4961": "天鈺",
-    "4967": "十銓",
-    "4968": "立積",
-    "4976": "佳凌",
-    "4977": "眾達-KY",
-    "4989": "榮科",
-    "4994": "傳奇",
-    "4999": "鑫禾",
-    "5007": "三星",
-    "5203": "訊連",
-    "5215": "科嘉-KY",
-    "5222": "全訊",
-    "5225": "東科-KY",
-    "5234": "達興材料",
-    "5243": "乙盛-KY",
-    "5244": "弘凱",
-    "5258": "虹堡",
-    "5269": "祥碩",
-    "5283": "禾聯碩",
-    "5284": "jpp-KY",
-    "5285": "界霖",
-    "5288": "豐祥-KY",
-    "5292": "華懋",
-    "5306": "桂盟",
-    "5388": "中磊",
-    "5434": "崇越",
-    "5469": "瀚宇博",
-    "5471": "松翰",
-    "5484": "慧友",
-    "5515": "建國",
-    "5519": "隆大",
-    "5521": "工信",
-    "5522": "遠雄",
-    "5525": "順天",
-    "5531": "鄉林",
-    "5533": "皇鼎",
-    "5534": "長虹",
-    "5538": "東明-KY",
-    "5546": "永固-KY",
-    "5607": "遠雄港",
-    "5608": "四維航",
-    "5706": "鳳凰",
-    "5871": "中租-KY",
-    "5876": "上海商銀",
-    "5880": "合庫金",
-    "5906": "台南-KY",
-    "5907": "大洋-KY",
-    "6005": "群益證",
-    "6024": "群益期",
-    "6108": "競國",
-    "6112": "邁達特",
-    "6115": "鎰勝",
-    "6116": "彩晶",
-    "6117": "迎廣",
-    "6120": "達運",
-    "6128": "上福",
-    "6133": "金橋",
-    "6136": "富爾特",
-    "6139": "亞翔",
-    "6141": "柏承",
-    "6142": "友勁",
-    "6152": "百一",
-    "6153": "嘉聯益",
-    "6155": "鈞寶",
-    "6164": "華興",
-    "6165": "浪凡",
-    "6166": "凌華",
-    "6168": "宏齊",
-    "6176": "瑞儀",
-    "6177": "達麗",
-    "6183": "關貿",
-    "6184": "大豐電",
-    "6189": "豐藝",
-    "6191": "精成科",
-    "6192": "巨路",
-    "6196": "帆宣",
-    "6197": "佳必琪",
-    "6201": "亞弘電",
-    "6202": "盛群",
-    "6205": "詮欣",
-    "6206": "飛捷",
-    "6209": "今國光",
-    "6213": "聯茂",
-    "6214": "精誠",
-    "6215": "和椿",
-    "6216": "居易",
-    "6224": "聚鼎",
-    "6225": "天瀚",
-    "6226": "光鼎",
-    "6230": "尼得科超眾",
-    "6235": "華孚",
-    "6239": "力成",
-    "6243": "迅杰",
-    "6257": "矽格",
-    "6269": "台郡",
-    "6271": "同欣電",
-    "6272": "驊陞",
-    "6277": "宏正",
-    "6278": "台表科",
-    "6281": "全國電",
-    "6282": "康舒",
-    "6283": "淳安",
-    "6285": "啟碁",
-    "6405": "悅城",
-    "6409": "旭隼",
-    "6412": "群電",
-    "6414": "樺漢",
-    "6415": "矽力*-KY",
-    "6416": "瑞祺電通",
-    "6426": "統新",
-    "6431": "光麗-KY",
-    "6438": "迅得",
-    "6442": "光聖",
-    "6443": "元晶",
-    "6446": "藥華藥",
-    "6449": "鈺邦",
-    "6451": "訊芯-KY",
-    "6456": "GIS-KY",
-    "6464": "台數科",
-    "6472": "保瑞",
-    "6477": "安集",
-    "6491": "晶碩",
-    "6504": "南六",
-    "6505": "台塑化",
-    "6515": "穎崴",
-    "6525": "捷敏-KY",
-    "6526": "達發",
-    "6531": "愛普*",
-    "6533": "晶心科",
-    "6534": "正瀚-創",
-    "6541": "泰福-KY",
-    "6550": "北極星藥業-KY",
-    "6552": "易華電",
-    "6558": "興能高",
-    "6573": "虹揚-KY",
-    "6579": "研揚",
-    "6581": "鋼聯",
-    "6582": "申豐",
-    "6585": "鼎基",
-    "6589": "台康生技",
-    "6591": "動力-KY",
-    "6592": "和潤企業",
-    "6598": "ABC-KY",
-    "6605": "帝寶",
-    "6606": "建德工業",
-    "6614": "資拓宏宇",
-    "6625": "必應",
-    "6641": "基士德-KY",
-    "6645": "金萬林-創",
-    "6655": "科定",
-    "6657": "華安",
-    "6658": "聯策",
-    "6666": "羅麗芬-KY",
-    "6668": "中揚光",
-    "6669": "緯穎",
-    "6670": "復盛應用",
-    "6671": "三能-KY",
-    "6672": "騰輝電子-KY",
-    "6674": "鋐寶科技",
-    "6689": "伊雲谷",
-    "6691": "洋基工程",
-    "6695": "芯鼎",
-    "6698": "旭暉應材",
-    "6706": "惠特",
-    "6715": "嘉基",
-    "6719": "力智",
-    "6722": "輝創",
-    "6742": "澤米",
-    "6743": "安普新",
-    "6753": "龍德造船",
-    "6754": "匯僑設計",
-    "6756": "威鋒電子",
-    "6757": "台灣虎航",
-    "6768": "志強-KY",
-    "6770": "力積電",
-    "6771": "平和環保-創",
-    "6776": "展碁國際",
-    "6781": "AES-KY",
-    "6782": "視陽",
-    "6789": "采鈺",
-    "6790": "永豐實",
-    "6792": "詠業",
-    "6794": "向榮生技",
-    "6796": "晉弘",
-    "6799": "來頡",
-    "6805": "富世達",
-    "6806": "森崴能源",
-    "6807": "峰源-KY",
-    "6830": "汎銓",
-    "6831": "邁科",
-    "6834": "天二科技",
-    "6835": "圓裕",
-    "6838": "台新藥",
-    "6854": "錼創科技-KY創",
-    "6861": "睿生光電",
-    "6862": "三集瑞-KY",
-    "6863": "永道-KY",
-    "6869": "雲豹能源",
-    "6873": "泓德能源",
-    "6885": "全福生技",
-    "6887": "寶綠特-KY",
-    "6890": "來億-KY",
-    "6901": "鑽石投資",
-    "6902": "GOGOLOOK",
-    "6906": "現觀科",
-    "6909": "創控",
-    "6914": "阜爾運通",
-    "6916": "華凌",
-    "6918": "愛派司",
-    "6919": "康霈*",
-    "6921": "嘉雨思-創",
-    "6923": "中台",
-    "6924": "榮惠-KY創",
-    "6928": "攸泰科技",
-    "6931": "青松健康",
-    "6933": "AMAX-KY",
-    "6934": "心誠鎂",
-    "6936": "永鴻生技",
-    "6937": "天虹",
-    "6944": "兆聯實業",
-    "6949": "沛爾生醫-創",
-    "6951": "青新-創",
-    "6952": "大武山",
-    "6955": "邦睿生技-創",
-    "6957": "裕慶-KY",
-    "6958": "日盛台駿",
-    "6962": "奕力-KY",
-    "6965": "中傑-KY",
-    "6969": "成信實業*-創",
-    "6988": "威力暘-創",
-    "6994": "富威電力",
-    "7610": "聯友金屬-創",
-    "7631": "聚賢研發-創",
-    "7705": "三商餐飲",
-    "7711": "永擎",
-    "7721": "微程式",
-    "7722": "LINEPAY",
-    "7730": "暉盛-創",
-    "7732": "金興精密",
-    "7736": "虎山",
-    "7740": "熙特爾-創",
-    "7749": "意騰-KY",
-    "7750": "新代",
-    "7765": "中華資安",
-    "7769": "鴻勁",
-    "7780": "大研生醫*",
-    "7786": "東方風能",
-    "7788": "松川精密",
-    "7791": "皇家可口",
-    "7795": "長廣",
-    "7799": "禾榮科",
-    "7823": "奧義賽博-KY創",
-    "8011": "台通",
-    "8016": "矽創",
-    "8021": "尖點",
-    "8028": "昇陽半導體",
-    "8033": "雷虎",
-    "8039": "台虹",
-    "8045": "達運光電",
-    "8046": "南電",
-    "8070": "長華*",
-    "8072": "陞泰",
-    "8081": "致新",
-    "8101": "華冠",
-    "8103": "瀚荃",
-    "8104": "錸寶",
-    "8105": "凌巨",
-    "8110": "華東",
-    "8112": "至上",
-    "8114": "振樺電",
-    "8131": "福懋科",
-    "8150": "南茂",
-    "8162": "微矽電子-創",
-    "8163": "達方",
-    "8201": "無敵",
-    "8210": "勤誠",
-    "8213": "志超",
-    "8215": "明基材",
-    "8222": "寶一",
-    "8249": "菱光",
-    "8261": "富鼎",
-    "8271": "宇瞻",
-    "8341": "日友",
-    "8367": "建新國際",
-    "8374": "羅昇",
-    "8404": "百和興業-KY",
-    "8411": "福貞-KY",
-    "8422": "可寧衛*",
-    "8429": "金麗-KY",
-    "8438": "昶昕",
-    "8442": "威宏-KY",
-    "8443": "阿瘦",
-    "8454": "富邦媒",
-    "8462": "柏文",
-    "8463": "潤泰材",
-    "8464": "億豐",
-    "8466": "美吉吉-KY",
-    "8467": "波力-KY",
-    "8473": "山林水",
-    "8476": "台境*",
-    "8478": "東哥遊艇",
-    "8481": "政伸",
-    "8482": "商億-KY",
-    "8487": "愛爾達-創",
-    "8488": "吉源-KY",
-    "8499": "鼎炫-KY",
-    "8926": "台汽電",
-    "8940": "新天地",
-    "8996": "高力",
-    "9802": "鈺齊-KY",
-    "9902": "台火",
-    "9904": "寶成",
-    "9905": "大華",
-    "9906": "欣巴巴",
-    "9907": "統一實",
-    "9908": "大台北",
-    "9910": "豐泰",
-    "9911": "櫻花",
-    "9912": "偉聯",
-    "9914": "美利達",
-    "9917": "中保科",
-    "9918": "欣天然",
-    "9919": "康那香",
-    "9921": "巨大",
-    "9924": "福興",
-    "9925": "新保",
-    "9926": "新海",
-    "9927": "泰銘",
-    "9928": "中視",
-    "9929": "秋雨",
-    "9930": "中聯資源",
-    "9931": "欣高",
-    "9933": "中鼎",
-    "9934": "成霖",
-    "9935": "慶豐富",
-    "9937": "全國",
-    "9938": "百和",
-    "9939": "宏全",
-    "9940": "信義",
-    "9941": "裕融",
-    "9942": "茂順",
-    "9943": "好樂迪",
-    "9944": "新麗",
-    "9945": "潤泰新",
-    "9946": "三發地產",
-    "9955": "佳龍",
-    "9958": "世紀鋼"
-}
-# ====== 上市股票清單（代碼 -> 名稱）======
-# 此清單用於 Yahoo Finance 批次下載，定期更新
-TWSE_STOCK_LIST = None  # 將在首次更新時從 Yahoo Finance 動態取得
+# 此清單用於 Render 等海外環境（TWSE API 被封鎖時的備用方案），
+# 存放於 twse_stock_list.json，只有在沒有股票清單快取時才會載入
+BUILTIN_STOCK_LIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'twse_stock_list.json')
+_builtin_stock_list = None
 
-def get_twse_stock_codes():
-    """取得上市股票代碼清單
-    
-    優先使用內建清單（避免 Render 等海外環境被 TWSE 封鎖），
-    將嘗試從 TWSE API 取得最新清單作為更新機制
-    """
-    global TWSE_STOCK_LIST
-    
-    # 如果已經有快取的清單，直接使用
-    if TWSE_STOCK_LIST:
-        return TWSE_STOCK_LIST
-    
+def load_builtin_stock_list():
+    """讀取內建上市股票清單（首次呼叫時才讀檔），回傳 {代碼: 名稱}"""
+    global _builtin_stock_list
+    if _builtin_stock_list is None:
+        with open(BUILTIN_STOCK_LIST_PATH, encoding='utf-8') as f:
+            _builtin_stock_list = json.load(f)
+    return _builtin_stock_list
+
+# ====== 上市股票清單（代碼 -> 名稱）======
+# 此清單用於 Yahoo Finance 批次下載：磁碟快取 + 背景更新，查詢時不對外連線
+def fetch_twse_stock_list():
+    """從 TWSE API 取得最新上市股票清單，回傳 (source, {代碼: 名稱})；都失敗時回傳 None"""
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
     }
     
-    # 嘗試從 TWSE API 取得最新股票清單（如果可用）
     twse_apis = [
-        'https://openapi.twse.com.tw/v1/exchangeReport/STOCK_DAY_ALL',
-        'https://www.twse.com.tw/rwd/zh/afterTrading/STOCK_DAY_ALL?response=json',
+        ('twse_openapi', f'{TWSE_OPENAPI_BASE_URL}/v1/exchangeReport/STOCK_DAY_ALL'),
+        ('twse_rwd', f'{TWSE_BASE_URL}/rwd/zh/afterTrading/STOCK_DAY_ALL?response=json'),
     ]
     
-    for api_url in twse_apis:
+    for source, api_url in twse_apis:
         try:
-            response = requests.get(api_url, headers=headers, timeout=10, verify=False)
+            response = upstream_get(source, api_url, headers=headers, timeout=10, verify=False)
             content_type = response.headers.get('Content-Type', '')
             if 'text/html' in content_type:
                 continue  # 被封鎖，跳過
@@ -1212,34 +280,57 @@ def get_twse_stock_codes():
                                 stock_list[code] = name
             
             if len(stock_list) > 500:
-                TWSE_STOCK_LIST = stock_list
                 logger.info(f"從 TWSE API 取得 {len(stock_list)} 支上市股票清單")
-                return stock_list
+                return source, stock_list
         except Exception as e:
             logger.warning(f"從 TWSE API 取得股票清單失敗: {e}")
             continue
     
-    # TWSE API 被封鎖或不可用，使用內建股票清單
-    logger.info(f"使用內建上市股票清單（{len(BUILTIN_TWSE_STOCK_LIST)} 支）")
-    TWSE_STOCK_LIST = BUILTIN_TWSE_STOCK_LIST.copy()
-    return TWSE_STOCK_LIST
+    return None
+
+STOCK_UNIVERSE_PATH = os.environ.get(
+    'STOCK_UNIVERSE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'stock_universe.json')
+)
+STOCK_UNIVERSE_TTL = int(os.environ.get('STOCK_UNIVERSE_TTL', str(24 * 3600)))
+DISCOVERY_MAX_PROBES = int(os.environ.get('DISCOVERY_MAX_PROBES', '100'))
+DISCOVERY_WORKERS = int(os.environ.get('DISCOVERY_WORKERS', '10'))
+stock_universe = StockUniverse(
+    STOCK_UNIVERSE_PATH,
+    fetch=fetch_twse_stock_list,
+    fallback=lambda: dict(load_builtin_stock_list()),
+    ttl=STOCK_UNIVERSE_TTL
+)
+
+def get_twse_stock_codes():
+    """取得上市股票代碼清單
+    
+    依序使用記憶體、磁碟快取（STOCK_UNIVERSE_PATH）與內建清單，不會等待網路；
+    快取過期或只有內建清單時，在背景從 TWSE API 取得最新清單供下次更新使用。
+    """
+    return stock_universe.get()
 
-def discover_twse_stocks_via_yahoo():
-    """透過 Yahoo Finance API 動態探測有效的上市股票代碼"""
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+def discover_twse_stocks_via_yahoo(max_probes=None):
+    """透過 Yahoo Finance API 探測股票清單中缺少的上市股票代碼
     
-    # 產生常見的上市股票代碼範圍
-    candidate_codes = []
-    for i in range(1101, 9999):
-        candidate_codes.append(str(i))
+    只探測 stock_universe.discovery_candidates() 挑出的少量候選代碼（最近變動的區段、
+    區段尾端與小空隙），找到的股票併入股票清單快取，不存在的代碼記錄下來避免重複探測。
+    回傳新增的 {代碼: 名稱}。
+    """
+    from concurrent.futures import ThreadPoolExecutor
     
-    valid_stocks = {}
+    candidates = stock_universe.discovery_candidates(
+        max_probes=DISCOVERY_MAX_PROBES if max_probes is None else max_probes
+    )
+    if not candidates:
+        logger.info("沒有需要探測的候選代碼")
+        return {}
     
     def check_stock(code):
         try:
-            url = f'https://query1.finance.yahoo.com/v8/finance/chart/{code}.TW?interval=1d&range=1d'
+            url = f'{YAHOO_BASE_URL}/v8/finance/chart/{code}.TW?interval=1d&range=1d'
             headers = {'User-Agent': 'Mozilla/5.0'}
-            r = requests.get(url, headers=headers, timeout=5, verify=False)
+            r = upstream_get('yahoo_probe', url, headers=headers, timeout=5, verify=False)
             if r.status_code == 200:
                 data = r.json()
                 result = data.get('chart', {}).get('result', [None])[0]
@@ -1252,37 +343,36 @@ def discover_twse_stocks_via_yahoo():
         except:
             return None
     
-    # 分批探測（每批 500 個代碼）
-    batch_size = 500
-    for i in range(0, len(candidate_codes), batch_size):
-        batch = candidate_codes[i:i+batch_size]
-        with ThreadPoolExecutor(max_workers=30) as executor:
-            futures = {executor.submit(check_stock, code): code for code in batch}
-            for future in as_completed(futures):
-                result = future.result()
-                if result:
-                    valid_stocks[result[0]] = result[1]
-        
-        if len(valid_stocks) > 800:  # 已找到足夠多的股票
-            break
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(DISCOVERY_WORKERS, len(candidates))) as executor:
+        valid_stocks = dict(result for result in executor.map(check_stock, candidates) if result)
     
-    logger.info(f"透過 Yahoo Finance 探測到 {len(valid_stocks)} 支上市股票")
-    return valid_stocks
+    added = stock_universe.merge_discovered(valid_stocks, candidates)
+    logger.info(f"透過 Yahoo Finance 探測 {len(candidates)} 個候選代碼，"
+                f"新增 {len(added)} 支上市股票（{time.perf_counter() - started:.1f} 秒）")
+    return added
 
-def fetch_single_stock_yahoo(code):
-    """從 Yahoo Finance v8 chart API 取得單支上市股票的即時資料"""
+def request_yahoo_quote(code):
+    """下載單支上市股票的 Yahoo Finance chart 原始回應（bytes），失敗時回傳 None"""
     try:
-        url = f'https://query1.finance.yahoo.com/v8/finance/chart/{code}.TW?interval=1d&range=2d'
+        url = f'{YAHOO_BASE_URL}/v8/finance/chart/{code}.TW?interval=1d&range=2d'
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
-        r = requests.get(url, headers=headers, timeout=10, verify=False)
+        r = upstream_get('yahoo_quote', url, headers=headers, timeout=10, verify=False)
         if r.status_code != 200:
             return None
-        
-        data = r.json()
-        chart_result = data.get('chart', {}).get('result', [None])[0]
+        return r.content
+    except Exception as e:
+        return None
+
+def parse_yahoo_quote(code, content):
+    """解析 Yahoo Finance chart 回應，取出最後一個交易日的即時資料"""
+    try:
+        data = json.loads(content)
+        chart_result = (data.get('chart', {}).get('result') or [None])[0]
         if not chart_result:
+            upstream_stats.reclassify('yahoo_quote', 'empty', f'{code}: chart 無資料')
             return None
         
         meta = chart_result.get('meta', {})
@@ -1290,6 +380,7 @@ def fetch_single_stock_yahoo(code):
         timestamps = chart_result.get('timestamp', [])
         
         if not timestamps or not indicators.get('close'):
+            upstream_stats.reclassify('yahoo_quote', 'empty', f'{code}: 無報價資料')
             return None
         
         # 取最後一天的資料
@@ -1301,6 +392,7 @@ def fetch_single_stock_yahoo(code):
         volume = indicators['volume'][idx]
         
         if close_price is None or volume is None:
+            upstream_stats.reclassify('yahoo_quote', 'empty', f'{code}: 收盤價或成交量為空')
             return None
         
         # 計算漲跌（使用前一天收盤價）
@@ -1331,113 +423,205 @@ def fetch_single_stock_yahoo(code):
             'market': 'TWSE'
         }
     except Exception as e:
+        upstream_stats.reclassify('yahoo_quote', classify_exception(e), f'{code}: {e}')
         return None
 
-def fetch_otc_stock_data():
-    """獲取上市股票資料（使用 Yahoo Finance API）
+def collect_otc_stock_data(publish_every=0, fast=False, only_codes=None):
+    """以串流管線下載並處理上市股票資料
     
-    由於 TWSE API 封鎖海外伺服器 IP（如 Render），
-    改用 Yahoo Finance v8 chart API 搭配並行請求取得所有上市股票資料。
+    下載 → 解碼驗證 兩個階段以有界佇列串接，每支股票的回應一到就立即解析，
+    不必等全部下載完成才開始處理。下載順序由 fetch_scheduler 依優先權排列；
+    fast=True 時略過低成交量股票並沿用其上一次的資料。publish_every 大於 0 時，
+    每完成該數量的股票即發布一次部分快照。only_codes 指定時只下載其中的代碼。
+    回傳 (processed_stocks, current_date)。
     """
-    from concurrent.futures import ThreadPoolExecutor, as_completed
-    
+    summary = RunSummary('update')
+    upstream_before = upstream_stats.outcome_counts()
     try:
-        logger.info("開始獲取上市股票資料（Yahoo Finance API）...")
+        logger.info("開始獲取上市股票資料（Yahoo Finance API，串流管線）...")
         
         # 取得上市股票代碼清單
-        stock_list = get_twse_stock_codes()
+        universe_started = time.perf_counter()
+        with observe_stage('universe'):
+            stock_list = get_twse_stock_codes()
+        summary.timing('universe', time.perf_counter() - universe_started)
+        if only_codes:
+            stock_list = {code: stock_list.get(code) for code in only_codes}
         if not stock_list:
             logger.error("無法取得上市股票代碼清單")
-            return None
-        
-        codes = list(stock_list.keys())
+            return {}, None
+        
+        # 依優先權排列下載順序
+        previous_snapshot = stocks_data
+        codes, skipped = fetch_scheduler.order(
+            list(stock_list.keys()),
+            previous_snapshot=previous_snapshot,
+            signal_candidates=recent_signal_codes,
+            fast=fast
+        )
         logger.info(f"準備下載 {len(codes)} 支上市股票資料...")
-        
-        # 使用並行請求批次下載
-        all_results = []
-        failed_count = 0
+        summary.set(fast=fast)
+        summary.count('universe', len(stock_list))
+        summary.count('selected', len(codes))
+        summary.count('skipped', len(skipped))
         
         update_status['total'] = len(codes)
         update_status['progress'] = 0
         update_status['message'] = f'正在下載 {len(codes)} 支上市股票資料...'
         
-        with ThreadPoolExecutor(max_workers=20) as executor:
-            futures = {executor.submit(fetch_single_stock_yahoo, code): code for code in codes}
-            for future in as_completed(futures):
-                result = future.result()
-                if result:
-                    # 優先使用 TWSE 清單中的中文簡稱，Yahoo Finance 回傳的是英文名稱
-                    if result['code'] in stock_list:
-                        result['name'] = stock_list[result['code']]
-                    all_results.append(result)
-                else:
-                    failed_count += 1
-                
-                # 更新進度
-                update_status['progress'] = len(all_results) + failed_count
-        
-        if not all_results:
-            logger.error("Yahoo Finance API 無法取得任何股票資料")
-            return None
-        
-        logger.info(f"成功從 Yahoo Finance 取得 {len(all_results)} 支上市股票資料（失敗 {failed_count} 支）")
-        return all_results
+        def fetch_stage(code):
+            content = request_yahoo_quote(code)
+            if content is None:
+                summary.fail('fetch')
+            return code, content
+        
+        def decode_stage(fetched):
+            code, content = fetched
+            if content is None:
+                return code, None
+            with observe_stage('decode_quote'):
+                item = parse_yahoo_quote(code, content)
+                if not item:
+                    summary.fail('decode')
+                    return code, None
+                # 優先使用 TWSE 清單中的中文簡稱，Yahoo Finance 回傳的是英文名稱
+                if stock_list.get(item['code']):
+                    item['name'] = stock_list[item['code']]
+                item = process_otc_stock_item(item)
+                if not item:
+                    summary.fail('filtered')
+            return code, item
+        
+        processed_stocks = {}
+        state = {'done': 0, 'current_date': None}
+        
+        def sink(decoded):
+            code, stock = decoded
+            state['done'] += 1
+            if stock:
+                if not state['current_date'] and stock['date']:
+                    state['current_date'] = stock['date']
+                processed_stocks[code] = stock
+            # 更新進度
+            update_status['progress'] = state['done']
+            
+            # 分段發布部分快照，讓讀取端提早看到已完成的股票
+            if publish_every and state['done'] % publish_every == 0 and processed_stocks:
+                if publish_snapshot(processed_stocks, state['current_date'], partial=True, total=len(codes)):
+                    summary.count('partial_snapshots')
+                    update_status['message'] = f'正在下載上市股票資料，已發布部分資料 {len(processed_stocks)}/{len(codes)} 支...'
+        
+        pipeline = Pipeline([
+            Stage('fetch', fetch_stage, workers=UPDATE_FETCH_WORKERS),
+            Stage('decode', decode_stage, workers=1)
+        ], queue_size=PIPELINE_QUEUE_SIZE, name='update')
+        stats = pipeline.run(codes, sink)
+        
+        failed_count = len(codes) - len(processed_stocks)
+        
+        summary.count('processed', len(processed_stocks))
+        summary.count('failed', failed_count)
+        
+        # 快速更新略過的股票沿用上一次的資料
+        for code in skipped:
+            if code in previous_snapshot:
+                processed_stocks.setdefault(code, previous_snapshot[code])
+        summary.count('carried_over', len(processed_stocks) - summary.counts['processed'])
+        summary.set(data_date=state['current_date'])
+        record_pipeline_timings(summary, stats)
+        return processed_stocks, state['current_date']
         
     except Exception as e:
         logger.error(f"從 Yahoo Finance 獲取上市股票資料時發生錯誤: {str(e)}")
-        return None
+        summary.fail('exception')
+        return {}, None
+    finally:
+        summary.set(upstream_failures=outcome_delta(upstream_before, upstream_stats.outcome_counts()))
+        last_run_summaries['update'] = summary.emit(logger)
+
+def record_pipeline_timings(summary, stats):
+    """將管線總耗時與各階段的實際經過時間（第一個項目開始至最後一個完成）記入執行摘要
+    
+    各階段所有執行緒的處理時間總和另記於 worker_seconds（多執行緒時會大於經過時間）。
+    """
+    summary.timing('pipeline', stats['elapsed_seconds'])
+    worker_seconds = {}
+    for name, stage in stats['stages'].items():
+        summary.timing(name, stage['wall_seconds'])
+        worker_seconds[name] = stage['busy_seconds']
+    summary.set(worker_seconds=worker_seconds)
+
+def publish_snapshot(processed_stocks, current_date, partial=False, total=None):
+    """發布新的股票資料快照
+    
+    部分快照以複本發布，讀取端取得的 dict 不會在更新過程中被修改。
+    目前為完整快照時，同一資料日期不以部分快照覆蓋；不同日期（新交易日）則要等
+    部分快照涵蓋前一份完整快照的 PARTIAL_SNAPSHOT_MIN_COVERAGE 以上才取代。
+    回傳是否已發布。
+    """
+    global stocks_data, data_date, last_update_time
+    
+    if partial and not snapshot_meta['partial'] and stocks_data:
+        if data_date == current_date:
+            return False
+        if len(processed_stocks) < PARTIAL_SNAPSHOT_MIN_COVERAGE * len(stocks_data):
+            return False
+    
+    stocks_data = dict(processed_stocks) if partial else processed_stocks
+    data_date = current_date
+    if not partial:
+        last_update_time = get_taiwan_time()
+        last_full_snapshot['stocks'], last_full_snapshot['date'] = stocks_data, data_date
+    
+    snapshot_meta['version'] += 1
+    snapshot_meta['partial'] = partial
+    snapshot_meta['coverage'] = len(stocks_data)
+    snapshot_meta['total'] = total if total is not None else len(stocks_data)
+    snapshot_meta['published_at'] = get_taiwan_time().strftime('%Y-%m-%d %H:%M:%S')
+    
+    if partial:
+        logger.info(f"已發布部分快照 v{snapshot_meta['version']}：{snapshot_meta['coverage']}/{snapshot_meta['total']} 支")
+    return True
+
+def restore_full_snapshot():
+    """更新失敗時撤回部分快照，恢復提供最近一次完整快照（沒有完整快照時保留部分快照）"""
+    global stocks_data, data_date
+    
+    if not snapshot_meta['partial'] or not last_full_snapshot['stocks']:
+        return False
+    stocks_data = last_full_snapshot['stocks']
+    data_date = last_full_snapshot['date']
+    snapshot_meta['version'] += 1
+    snapshot_meta['partial'] = False
+    snapshot_meta['coverage'] = snapshot_meta['total'] = len(stocks_data)
+    snapshot_meta['published_at'] = get_taiwan_time().strftime('%Y-%m-%d %H:%M:%S')
+    logger.warning(f"更新未完成，恢復完整快照 v{snapshot_meta['version']}：{len(stocks_data)} 支（{data_date}）")
+    return True
+
+def snapshot_info():
+    """快照版本與涵蓋率（供 API 回應使用）"""
+    return {
+        'snapshot_version': snapshot_meta['version'],
+        'partial': snapshot_meta['partial'],
+        'coverage': snapshot_meta['coverage'],
+        'coverage_total': snapshot_meta['total']
+    }
+
 def process_otc_stock_data(raw_data):
     """處理上市股票資料（從 Yahoo Finance API）
     
-    raw_data 為 fetch_otc_stock_data 回傳的 list，每個元素已經是處理好的 dict 格式。
+    raw_data 為單日報價 dict 的 list（格式同 parse_yahoo_quote 的回傳值），每個元素已經是處理好的 dict 格式。
     """
     processed_stocks = {}
     current_date = None
     
     try:
         for item in raw_data:
-            stock_code = item.get('code', '').strip()
-            stock_name = item.get('name', '').strip()
-            
-            # 過濾條件：只處理上市股票（代碼1000-9999）
-            if (stock_code and 
-                len(stock_code) == 4 and 
-                stock_code.isdigit() and
-                1000 <= int(stock_code) <= 9999 and
-                not any(keyword in stock_name for keyword in ['DR', 'TDR', 'ETF', 'ETN', '權證', '特別股', '存託憑證'])):
-                
-                try:
-                    closing_price = float(item.get('close', 0))
-                    opening_price = float(item.get('open', 0))
-                    highest_price = float(item.get('high', 0))
-                    lowest_price = float(item.get('low', 0))
-                    trade_volume = int(item.get('volume', 0))
-                    change = float(item.get('change', 0))
-                    change_percent = float(item.get('change_percent', 0))
-                    trade_date = item.get('date', '')
-                    
-                    # 過濾無效資料
-                    if closing_price > 0 and trade_volume > 0:
-                        if not current_date and trade_date:
-                            current_date = trade_date
-                        
-                        processed_stocks[stock_code] = {
-                            'code': stock_code,
-                            'name': stock_name,
-                            'close': closing_price,
-                            'open': opening_price,
-                            'high': highest_price,
-                            'low': lowest_price,
-                            'volume': trade_volume,
-                            'date': trade_date,
-                            'change': change,
-                            'change_percent': change_percent,
-                            'market': 'TWSE'  # 標記為上市市場
-                        }
-                        
-                except (ValueError, TypeError) as e:
-                    logger.warning(f"處理股票 {stock_code} 資料時發生錯誤: {e}")
-                    continue
+            stock = process_otc_stock_item(item)
+            if stock:
+                if not current_date and stock['date']:
+                    current_date = stock['date']
+                processed_stocks[stock['code']] = stock
         
         logger.info(f"成功處理 {len(processed_stocks)} 支上市股票資料")
         return processed_stocks, current_date
@@ -1446,6 +630,50 @@ def process_otc_stock_data(raw_data):
         logger.error(f"處理上市股票資料時發生錯誤: {str(e)}")
         return {}, None
 
+def process_otc_stock_item(item):
+    """驗證並整理單支上市股票資料，不符合條件時回傳 None"""
+    stock_code = item.get('code', '').strip()
+    stock_name = item.get('name', '').strip()
+    
+    # 過濾條件：只處理上市股票（代碼1000-9999）
+    if not (stock_code and 
+            len(stock_code) == 4 and 
+            stock_code.isdigit() and
+            1000 <= int(stock_code) <= 9999 and
+            not any(keyword in stock_name for keyword in ['DR', 'TDR', 'ETF', 'ETN', '權證', '特別股', '存託憑證'])):
+        return None
+    
+    try:
+        closing_price = float(item.get('close', 0))
+        opening_price = float(item.get('open', 0))
+        highest_price = float(item.get('high', 0))
+        lowest_price = float(item.get('low', 0))
+        trade_volume = int(item.get('volume', 0))
+        change = float(item.get('change', 0))
+        change_percent = float(item.get('change_percent', 0))
+        trade_date = item.get('date', '')
+    except (ValueError, TypeError) as e:
+        stock_log.debug(f"處理股票 {stock_code} 資料時發生錯誤: {e}")
+        return None
+    
+    # 過濾無效資料
+    if closing_price <= 0 or trade_volume <= 0:
+        return None
+    
+    return {
+        'code': stock_code,
+        'name': stock_name,
+        'close': closing_price,
+        'open': opening_price,
+        'high': highest_price,
+        'low': lowest_price,
+        'volume': trade_volume,
+        'date': trade_date,
+        'change': change,
+        'change_percent': change_percent,
+        'market': 'TWSE'  # 標記為上市市場
+    }
+
 def is_valid_otc_stock(stock_code, stock_name):
     """判斷是否為有效的上市一般股票"""
     if not stock_code or not stock_name:
@@ -1475,381 +703,338 @@ def is_valid_otc_stock(stock_code, stock_name):
     
     return True
 
-def calculate_weighted_simple_average(src_values, length, weight):
-    """完全按照Pine Script邏輯實現的加權移動平均"""
-    if not src_values or length <= 0:
-        return 0
-    
-    if len(src_values) == 1:
-        return src_values[0]
-    
-    # Pine Script狀態變量
-    sum_float = 0.0
-    output = None
-    
-    # 逐步計算，維護Pine Script的狀態邏輯
-    for i, src in enumerate(src_values):
-        # Pine Script邏輯：sum_float := nz(sum_float[1]) - nz(src[length]) + src
-        if i >= length:
-            # 移除length期前的值，加入當前值
-            sum_float = sum_float - src_values[i - length] + src
-        else:
-            # 累加當前值
-            sum_float += src
-        
-        # 計算移動平均
-        if i >= length - 1:
-            moving_average = sum_float / length
-        else:
-            moving_average = None  # Pine Script中會是na
-        
-        # Pine Script邏輯：output := na(output[1]) ? moving_average : (src * weight + output[1] * (length - weight)) / length
-        if output is None:
-            # 第一次計算或moving_average為None時
-            output = moving_average if moving_average is not None else src
-        else:
-            if moving_average is not None:
-                # 標準的加權計算
-                output = (src * weight + output * (length - weight)) / length
-            else:
-                # 如果moving_average為None，保持原值
-                output = (src * weight + output * (length - weight)) / length
-    
-    return output if output is not None else (src_values[-1] if src_values else 0)
-
-def calculate_pine_script_indicators(ohlc_data):
-    """完全按照Pine Script邏輯計算技術指標"""
-    if len(ohlc_data) < 34:  # 需要足夠的歷史數據
-        return None
-    
-    # 提取OHLC數據
-    closes = [d['close'] for d in ohlc_data]
-    highs = [d['high'] for d in ohlc_data]
-    lows = [d['low'] for d in ohlc_data]
-    opens = [d['open'] for d in ohlc_data]
-    
-    # 計算典型價格 (2 * close + high + low + open) / 5
-    typical_prices = [(2 * c + h + l + o) / 5 for c, h, l, o in zip(closes, highs, lows, opens)]
-    
-    # 計算資金流向趨勢（完全按照Pine Script公式）
-    fund_flow_values = []
-    
-    for i in range(len(closes)):
-        # 計算27期最高最低價
-        start_idx = max(0, i - 26)
-        lowest_27 = min(lows[start_idx:i+1])
-        highest_27 = max(highs[start_idx:i+1])
-        
-        if highest_27 != lowest_27:
-            # 計算相對位置
-            relative_pos = (closes[i] - lowest_27) / (highest_27 - lowest_27) * 100
-            
-            # 收集足夠的相對位置數據用於加權平均
-            relative_positions = []
-            for j in range(max(0, i - 4), i + 1):
-                start_j = max(0, j - 26)
-                low_27_j = min(lows[start_j:j+1])
-                high_27_j = max(highs[start_j:j+1])
-                if high_27_j != low_27_j:
-                    rel_pos_j = (closes[j] - low_27_j) / (high_27_j - low_27_j) * 100
-                else:
-                    rel_pos_j = 50
-                relative_positions.append(rel_pos_j)
-            
-            # 第一層加權簡單平均（5期，權重1）
-            wsa1 = calculate_weighted_simple_average(relative_positions, min(5, len(relative_positions)), 1)
-            
-            # 第二層加權簡單平均（3期，權重1）
-            if i >= 2:
-                # 收集前面的wsa1值
-                wsa1_values = []
-                for k in range(max(0, i - 2), i + 1):
-                    # 重新計算每個時點的wsa1
-                    rel_pos_k = []
-                    for j in range(max(0, k - 4), k + 1):
-                        start_j = max(0, j - 26)
-                        low_27_j = min(lows[start_j:j+1])
-                        high_27_j = max(highs[start_j:j+1])
-                        if high_27_j != low_27_j:
-                            rel_pos_j = (closes[j] - low_27_j) / (high_27_j - low_27_j) * 100
-                        else:
-                            rel_pos_j = 50
-                        rel_pos_k.append(rel_pos_j)
-                    
-                    wsa1_k = calculate_weighted_simple_average(rel_pos_k, min(5, len(rel_pos_k)), 1)
-                    wsa1_values.append(wsa1_k)
-                
-                wsa2 = calculate_weighted_simple_average(wsa1_values, min(3, len(wsa1_values)), 1)
-            else:
-                wsa2 = wsa1
-            
-            # 最終公式：(3 * wsa1 - 2 * wsa2 - 50) * 1.032 + 50
-            fund_flow = (3 * wsa1 - 2 * wsa2 - 50) * 1.032 + 50
-        else:
-            fund_flow = 50
-        
-        fund_flow_values.append(max(0, min(100, fund_flow)))
-    
-    # 計算多空線（13期EMA）
-    # 先計算標準化的典型價格
-    bull_bear_values = []
-    for i in range(len(typical_prices)):
-        # 計算34期最高最低價
-        start_idx = max(0, i - 33)
-        lowest_34 = min(lows[start_idx:i+1])
-        highest_34 = max(highs[start_idx:i+1])
-        
-        if highest_34 != lowest_34:
-            normalized_price = (typical_prices[i] - lowest_34) / (highest_34 - lowest_34) * 100
-        else:
-            normalized_price = 50
-        bull_bear_values.append(max(0, min(100, normalized_price)))
-    
-    # 計算13期EMA
-    bull_bear_line_values = []
-    for i in range(len(bull_bear_values)):
-        if i < 13:
-            ema_value = sum(bull_bear_values[:i+1]) / (i+1)
-        else:
-            ema_value = calculate_ema(bull_bear_values[:i+1], 13)
-        bull_bear_line_values.append(ema_value)
-    
-    # 檢查當日和前一日的黃柱信號
-    current_day_signal = False
-    previous_day_signal = False
-    
-    if len(fund_flow_values) >= 2 and len(bull_bear_line_values) >= 2:
-        # 檢查當日黃柱
-        current_fund = fund_flow_values[-1]
-        previous_fund = fund_flow_values[-2]
-        current_bull_bear = bull_bear_line_values[-1]
-        previous_bull_bear = bull_bear_line_values[-2]
-        
-        # Pine Script crossover邏輯：ta.crossover(fund_flow_trend, bull_bear_line)
-        is_crossover_today = (current_fund > current_bull_bear) and (previous_fund <= previous_bull_bear)
-        is_oversold_today = current_bull_bear < 25
-        current_day_signal = is_crossover_today and is_oversold_today
-        
-        # 檢查前一日黃柱
-        if len(fund_flow_values) >= 3 and len(bull_bear_line_values) >= 3:
-            prev_fund = fund_flow_values[-2]
-            prev_prev_fund = fund_flow_values[-3]
-            prev_bull_bear = bull_bear_line_values[-2]
-            prev_prev_bull_bear = bull_bear_line_values[-3]
-            
-            is_crossover_yesterday = (prev_fund > prev_bull_bear) and (prev_prev_fund <= prev_prev_bull_bear)
-            is_oversold_yesterday = prev_bull_bear < 25
-            previous_day_signal = is_crossover_yesterday and is_oversold_yesterday
-        
-        # 黃柱信號：當日或前一日出現
-        banker_entry_signal = current_day_signal or previous_day_signal
-        
-        # 記錄詳細計算結果用於調試（僅記錄符合條件的股票）
-        if banker_entry_signal:
-            logger.info(f"🟡 發現黃柱信號:")
-            logger.info(f"  當日: 資金流向={current_fund:.2f}, 多空線={current_bull_bear:.2f}, crossover={is_crossover_today}, 超賣={is_oversold_today}, 黃柱={current_day_signal}")
-            if len(fund_flow_values) >= 3:
-                logger.info(f"  前日: 資金流向={prev_fund:.2f}, 多空線={prev_bull_bear:.2f}, crossover={is_crossover_yesterday}, 超賣={is_oversold_yesterday}, 黃柱={previous_day_signal}")
-        
-        return {
-            'fund_trend': current_fund,
-            'multi_short_line': current_bull_bear,
-            'banker_entry_signal': banker_entry_signal,
-            'is_crossover': (is_crossover_today if current_day_signal else is_crossover_yesterday),
-            'is_oversold': (is_oversold_today if current_day_signal else is_oversold_yesterday),
-            'fund_trend_previous': previous_fund if len(fund_flow_values) >= 2 else current_fund,
-            'multi_short_line_previous': previous_bull_bear if len(bull_bear_line_values) >= 2 else current_bull_bear
-        }
-    
-    return None
-
-def calculate_ema(values, period):
-    """計算指數移動平均"""
-    if len(values) < period:
-        return sum(values) / len(values) if values else 0
-    
-    multiplier = 2 / (period + 1)
-    ema = sum(values[:period]) / period  # 初始SMA
-    
-    for value in values[period:]:
-        ema = (value * multiplier) + (ema * (1 - multiplier))
-    
-    return ema
-
-def update_stocks_data_background():
-    """後台執行的更新任務"""
+@profile_manager.profiled('update')
+def update_stocks_data_background(fast=False):
+    """後台執行的更新任務（fast=True 為快速更新，略過低成交量股票）"""
     global stocks_data, last_update_time, data_date, update_status
     
-    try:
-        update_status['message'] = '正在取得上市股票清單...'
-        logger.info("開始後台更新上市股票資料...")
+    with observe_stage('update') as run:
+        memory_tracker.mark('update_before')
+        try:
+            update_status['message'] = '正在取得上市股票清單...'
+            logger.info("開始後台更新上市股票資料...")
+        
+            # 獲取並處理上市股票資料（下載與解析以串流管線重疊進行，期間分段發布部分快照）
+            processed_data, current_date = collect_otc_stock_data(publish_every=PARTIAL_SNAPSHOT_EVERY, fast=fast)
+            if not processed_data:
+                logger.error("無法獲取上市股票資料")
+                restore_full_snapshot()
+                update_status['is_running'] = False
+                update_status['success'] = False
+                update_status['message'] = '無法獲取股票資料，請稍後再試'
+                update_status['finished_at'] = get_taiwan_time().strftime('%Y-%m-%d %H:%M:%S')
+                run['outcome'] = 'error'
+                return
+        
+            # 更新全域變數（發布完整快照）
+            publish_snapshot(processed_data, current_date)
         
-        # 獲取上市股票資料
-        raw_data = fetch_otc_stock_data()
-        if not raw_data:
-            logger.error("無法獲取上市股票資料")
             update_status['is_running'] = False
-            update_status['success'] = False
-            update_status['message'] = '無法獲取股票資料，請稍後再試'
+            update_status['success'] = True
+            update_status['message'] = f'成功更新 {len(stocks_data)} 支上市股票資料'
             update_status['finished_at'] = get_taiwan_time().strftime('%Y-%m-%d %H:%M:%S')
-            return
         
-        update_status['message'] = '正在處理股票資料...'
+            logger.info(f"後台更新完成：{len(stocks_data)} 支上市股票資料，資料日期: {data_date}")
         
-        # 處理資料
-        processed_data, current_date = process_otc_stock_data(raw_data)
-        if not processed_data:
-            logger.error("處理上市股票資料失敗")
+        except Exception as e:
+            logger.error(f"後台更新上市股票資料時發生錯誤: {str(e)}")
+            restore_full_snapshot()
             update_status['is_running'] = False
             update_status['success'] = False
-            update_status['message'] = '處理股票資料失敗，請稍後再試'
+            update_status['message'] = f'更新失敗: {str(e)}'
             update_status['finished_at'] = get_taiwan_time().strftime('%Y-%m-%d %H:%M:%S')
-            return
-        
-        # 更新全域變數
-        stocks_data = processed_data
-        data_date = current_date
-        last_update_time = get_taiwan_time()
-        
-        update_status['is_running'] = False
-        update_status['success'] = True
-        update_status['message'] = f'成功更新 {len(stocks_data)} 支上市股票資料'
-        update_status['finished_at'] = get_taiwan_time().strftime('%Y-%m-%d %H:%M:%S')
-        
-        logger.info(f"後台更新完成：{len(stocks_data)} 支上市股票資料，資料日期: {data_date}")
-        
-    except Exception as e:
-        logger.error(f"後台更新上市股票資料時發生錯誤: {str(e)}")
-        update_status['is_running'] = False
-        update_status['success'] = False
-        update_status['message'] = f'更新失敗: {str(e)}'
-        update_status['finished_at'] = get_taiwan_time().strftime('%Y-%m-%d %H:%M:%S')
+            run['outcome'] = 'error'
+        finally:
+            memory_tracker.mark('update_after')
 
-def update_stocks_data():
-    """更新股票資料（直接同步版本，保留相容）"""
+def update_stocks_data(fast=False, only_codes=None):
+    """更新股票資料（直接同步版本，供 screen_cli.py 等非 HTTP 呼叫端使用）"""
     global stocks_data, last_update_time, data_date
     
     try:
         logger.info("開始更新上市股票資料...")
         
-        raw_data = fetch_otc_stock_data()
-        if not raw_data:
-            return False
-        
-        processed_data, current_date = process_otc_stock_data(raw_data)
+        processed_data, current_date = collect_otc_stock_data(fast=fast, only_codes=only_codes)
         if not processed_data:
+            restore_full_snapshot()
             return False
         
-        stocks_data = processed_data
-        data_date = current_date
-        last_update_time = get_taiwan_time()
+        publish_snapshot(processed_data, current_date)
         
         logger.info(f"成功更新 {len(stocks_data)} 支上市股票資料，資料日期: {data_date}")
         return True
         
     except Exception as e:
         logger.error(f"更新上市股票資料時發生錯誤: {str(e)}")
+        restore_full_snapshot()
         return False
 
+@app.before_request
+def start_request_timer():
+    """記錄請求開始時間（供路由耗時指標使用）"""
+    g.request_started_at = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """記錄各路由的請求數與處理耗時"""
+    started_at = g.get('request_started_at')
+    if started_at is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_DURATION.observe(time.perf_counter() - started_at, route=route, method=request.method)
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=str(response.status_code))
+    return response
+
 @app.route('/')
 def index():
     """首頁"""
     return render_template('index.html')
 
+DIAGNOSE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+def probe_yahoo_finance(timeout):
+    """探測 Yahoo Finance chart API"""
+    url = f'{YAHOO_BASE_URL}/v8/finance/chart/2330.TW?interval=1d&range=1d'
+    response = upstream_get('probe_yahoo', url, retries=0, headers=DIAGNOSE_HEADERS, timeout=timeout, verify=False)
+    if response.status_code != 200:
+        return {'status': 'failed', 'http_code': response.status_code}
+    
+    chart_result = (response.json().get('chart', {}).get('result') or [None])[0]
+    if not chart_result:
+        return {'status': 'no_data', 'http_code': 200}
+    meta = chart_result.get('meta', {})
+    return {
+        'status': 'success',
+        'http_code': 200,
+        'sample_stock': meta.get('symbol', ''),
+        'sample_price': meta.get('regularMarketPrice', 0)
+    }
+
+def make_twse_probe(source, url):
+    """建立 TWSE API（股票清單來源）的探測函式"""
+    def probe(timeout):
+        response = upstream_get(source, url, retries=0, headers=DIAGNOSE_HEADERS, timeout=timeout, verify=False)
+        result = {'status': 'available', 'http_code': response.status_code}
+        if 'text/html' in response.headers.get('Content-Type', 'unknown'):
+            result['status'] = 'blocked'
+            result['note'] = 'TWSE 封鎖海外 IP，已改用 Yahoo Finance'
+        return result
+    return probe
+
+# 背景健康探測：/api/diagnose 直接回傳快取結果，不在請求中對外連線
+HEALTH_PROBE_INTERVAL = int(os.environ.get('HEALTH_PROBE_INTERVAL', '300'))
+HEALTH_PROBE_TIMEOUT = float(os.environ.get('HEALTH_PROBE_TIMEOUT', '10'))
+health_prober = HealthProber([
+    Probe('yahoo_finance', probe_yahoo_finance),
+    Probe('openapi_twse', make_twse_probe('probe_twse_openapi', f'{TWSE_OPENAPI_BASE_URL}/v1/exchangeReport/STOCK_DAY_ALL')),
+    Probe('twse_rwd', make_twse_probe('probe_twse_rwd', f'{TWSE_BASE_URL}/rwd/zh/afterTrading/STOCK_DAY_ALL?response=json')),
+], interval=HEALTH_PROBE_INTERVAL, timeout=HEALTH_PROBE_TIMEOUT)
+
 @app.route('/api/diagnose')
 def diagnose():
-    """診斷端點：測試 Yahoo Finance API 和 TWSE API 的連線狀況"""
-    import time as time_module
-    import socket
+    """診斷端點：回傳背景探測的 Yahoo Finance API 和 TWSE API 連線狀況
+    
+    force=1 時立即重新探測（最多等待 HEALTH_PROBE_TIMEOUT 秒，10 秒內最多一次）。
+    """
+    # 背景探測於啟動時開始；此處再確認一次（例如啟動時尚未建立執行緒）
+    health_prober.ensure_started()
+    last_probed_at = health_prober.last_probed_at
+    if request.args.get('force') == '1' and (last_probed_at is None or time.time() - last_probed_at >= 10):
+        # 10 秒內已探測過時直接回傳結果，避免重複強制探測佔用請求執行緒
+        health_prober.probe_all()
+    
     result = {
         'timestamp': get_taiwan_time().strftime('%Y-%m-%d %H:%M:%S'),
         'data_source': 'Yahoo Finance v8 chart API',
-        'tests': {}
-    }
-    
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        **health_prober.view()
     }
     
-    # 測試 Yahoo Finance API
-    try:
-        start = time_module.time()
-        url = 'https://query1.finance.yahoo.com/v8/finance/chart/2330.TW?interval=1d&range=1d'
-        response = requests.get(url, headers=headers, timeout=15, verify=False)
-        elapsed = time_module.time() - start
-        
-        if response.status_code == 200:
-            data = response.json()
-            chart_result = data.get('chart', {}).get('result', [None])[0]
-            if chart_result:
-                meta = chart_result.get('meta', {})
-                result['tests']['yahoo_finance'] = {
-                    'status': 'success',
-                    'http_code': 200,
-                    'elapsed_seconds': round(elapsed, 2),
-                    'sample_stock': meta.get('symbol', ''),
-                    'sample_price': meta.get('regularMarketPrice', 0)
-                }
-            else:
-                result['tests']['yahoo_finance'] = {
-                    'status': 'no_data',
-                    'http_code': 200,
-                    'elapsed_seconds': round(elapsed, 2)
-                }
-        else:
-            result['tests']['yahoo_finance'] = {
-                'status': 'failed',
-                'http_code': response.status_code,
-                'elapsed_seconds': round(elapsed, 2)
-            }
-    except Exception as e:
-        result['tests']['yahoo_finance'] = {
-            'status': 'error',
-            'error': str(e),
-            'error_type': type(e).__name__
-        }
-    
-    # 測試 TWSE API（用於取得股票清單）
-    twse_apis = [
-        ('openapi_twse', 'https://openapi.twse.com.tw/v1/exchangeReport/STOCK_DAY_ALL'),
-        ('twse_rwd', 'https://www.twse.com.tw/rwd/zh/afterTrading/STOCK_DAY_ALL?response=json'),
-    ]
-    
-    for test_name, url in twse_apis:
-        try:
-            start = time_module.time()
-            response = requests.get(url, headers=headers, timeout=15, verify=False)
-            elapsed = time_module.time() - start
-            content_type = response.headers.get('Content-Type', 'unknown')
-            
-            if 'text/html' in content_type:
-                result['tests'][test_name] = {
-                    'status': 'blocked',
-                    'http_code': response.status_code,
-                    'elapsed_seconds': round(elapsed, 2),
-                    'note': 'TWSE 封鎖海外 IP，已改用 Yahoo Finance'
-                }
-            else:
-                result['tests'][test_name] = {
-                    'status': 'available',
-                    'http_code': response.status_code,
-                    'elapsed_seconds': round(elapsed, 2)
-                }
-        except Exception as e:
-            result['tests'][test_name] = {
-                'status': 'error',
-                'error': str(e)
-            }
-    
     # 目前股票資料狀態
     result['stocks_data_count'] = len(stocks_data)
     result['data_date'] = data_date
     result['last_update'] = last_update_time.strftime('%Y-%m-%d %H:%M:%S') if last_update_time else None
-    result['stock_list_cached'] = TWSE_STOCK_LIST is not None
-    result['stock_list_count'] = len(TWSE_STOCK_LIST) if TWSE_STOCK_LIST else 0
+    universe = stock_universe.status()
+    result['stock_list_cached'] = universe['source'] not in (None, 'builtin')
+    result['stock_list_count'] = universe['count']
+    result['stock_universe'] = universe
+    result['signal_archive'] = signal_archive.stats()
     
     return jsonify(result)
 
+@app.route('/api/metrics')
+def get_metrics():
+    """執行期指標（Prometheus 文字格式）"""
+    SNAPSHOT_STOCKS.set(len(stocks_data))
+    SNAPSHOT_VERSION.set(snapshot_meta['version'])
+    SNAPSHOT_PARTIAL.set(1 if snapshot_meta['partial'] else 0)
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+def check_admin_token():
+    """驗證管理權杖（X-Admin-Token 標頭或 token 參數）；失敗時回傳錯誤回應"""
+    if not ADMIN_TOKEN:
+        return jsonify({'success': False, 'error': '管理端點未啟用（未設定 ADMIN_TOKEN）'}), 404
+    token = request.headers.get('X-Admin-Token') or request.args.get('token', '')
+    if not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        return jsonify({'success': False, 'error': '管理權杖錯誤'}), 403
+    return None
+
+@app.route('/api/admin/profile', methods=['GET', 'POST', 'DELETE'])
+def admin_profile():
+    """剖析管理：GET 查詢狀態與結果清單，POST 預約剖析下一次執行，DELETE 取消預約"""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    
+    if request.method == 'POST':
+        payload = request.get_json(silent=True) or {}
+        try:
+            interval_ms = float(payload.get('interval_ms', 5))
+            max_seconds = float(payload.get('max_seconds', 600))
+            if not 1 <= interval_ms <= 1000 or max_seconds <= 0:
+                raise ValueError('interval_ms 需介於 1~1000，max_seconds 需大於 0')
+            armed = profile_manager.arm(
+                target=payload.get('target', 'any'),
+                interval=interval_ms / 1000,
+                max_seconds=max_seconds
+            )
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        logger.info(f"已預約剖析下一次 {armed['target']} 執行")
+        return jsonify({'success': True, 'armed': armed})
+    
+    if request.method == 'DELETE':
+        profile_manager.disarm()
+    return jsonify({'success': True, **profile_manager.status()})
+
+@app.route('/api/admin/profile/<int:profile_id>')
+def download_profile(profile_id):
+    """下載剖析結果（collapsed stack 格式，可用 flamegraph.pl / speedscope 開啟）"""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    
+    result = profile_manager.get(profile_id)
+    if result is None:
+        return jsonify({'success': False, 'error': '找不到剖析結果'}), 404
+    started = datetime.fromtimestamp(result['started_at'], TW_TZ).strftime('%Y%m%d-%H%M%S')
+    filename = f"profile-{result['target']}-{started}.folded"
+    return Response(
+        result['collapsed'],
+        content_type='text/plain; charset=utf-8',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@app.route('/api/admin/universe', methods=['GET', 'POST'])
+def admin_universe():
+    """股票清單管理：GET 查詢快取狀態，POST {"action": "refresh"} 重新取得清單，
+    POST {"action": "discover", "max_probes": 100} 探測清單中缺少的代碼"""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        action = body.get('action')
+        if action == 'refresh':
+            success = stock_universe.refresh()
+            return jsonify({'success': success, 'universe': stock_universe.status()})
+        if action == 'discover':
+            added = discover_twse_stocks_via_yahoo(max_probes=int(body.get('max_probes', DISCOVERY_MAX_PROBES)))
+            return jsonify({'success': True, 'added': added, 'universe': stock_universe.status()})
+        return jsonify({'success': False, 'error': 'action 須為 refresh 或 discover'}), 400
+    
+    return jsonify({'success': True, 'universe': stock_universe.status()})
+
+def memory_report():
+    """各主要資料結構的估計記憶體用量"""
+    snapshot = stocks_data
+    stock_list = stock_universe.stocks or {}
+    store = history_store.stats()
+    screen_results = last_screen_results
+    archive_cache = signal_archive.cached()
+    structures = {
+        'snapshot': {'items': len(snapshot), 'bytes': deep_sizeof(snapshot)},
+        'history_store': {
+            'mapped_stocks': store['mapped_stocks'],
+            'mapped_bytes': store['mapped_bytes'],
+            'pending_stocks': store['pending_stocks'],
+            'pending_bytes': store['pending_bytes']
+        },
+        'stock_list_cache': {'items': len(stock_list), 'bytes': deep_sizeof(stock_list)},
+        'signal_candidates': {'items': len(recent_signal_codes), 'bytes': deep_sizeof(recent_signal_codes)},
+        'upstream_stats': {'bytes': deep_sizeof(upstream_stats.snapshot())},
+        'profiles': {'items': len(profile_manager.results), 'bytes': deep_sizeof(list(profile_manager.results))},
+        'screen_results': {'items': len(screen_results), 'bytes': deep_sizeof(screen_results)},
+        'signal_archive_cache': {'days': len(archive_cache), 'bytes': deep_sizeof(archive_cache)}
+    }
+    # 資料收集器只在有使用時才載入（需要 pandas），未載入時不列出
+    collector = sys.modules.get('stock_data_collector')
+    if collector is not None:
+        caches = collector.cache_snapshot()
+        structures['collector_universe_cache'] = {'bytes': deep_sizeof(caches['universe'])}
+        structures['collector_quote_cache'] = {
+            'items': sum(len(quotes) for quotes in caches['quotes']),
+            'bytes': deep_sizeof(caches['quotes'])
+        }
+    return {
+        'process': process_memory(),
+        'structures': structures,
+        'tracemalloc': memory_tracker.status()
+    }
+
+@app.route('/api/admin/memory', methods=['GET', 'POST'])
+def admin_memory():
+    """記憶體用量：GET 查詢各資料結構用量；POST 控制 tracemalloc（start / stop / mark）"""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    
+    if request.method == 'POST':
+        payload = request.get_json(silent=True) or {}
+        action = payload.get('action')
+        if action == 'start':
+            memory_tracker.start(frames=max(1, int(payload.get('frames', 1))))
+            memory_tracker.mark('start')
+        elif action == 'stop':
+            memory_tracker.stop()
+        elif action == 'mark':
+            if not memory_tracker.mark(str(payload.get('name') or 'manual')):
+                return jsonify({'success': False, 'error': 'tracemalloc 未啟用'}), 400
+        else:
+            return jsonify({'success': False, 'error': 'action 必須為 start、stop 或 mark'}), 400
+        return jsonify({'success': True, 'tracemalloc': memory_tracker.status()})
+    
+    started = time.perf_counter()
+    report = memory_report()
+    report['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+    return jsonify({'success': True, **report})
+
+@app.route('/api/admin/memory/diff')
+def admin_memory_diff():
+    """比較兩個 tracemalloc 快照（預設 update_before → update_after），回傳增加最多的前 N 項"""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    
+    before = request.args.get('before', 'update_before')
+    after = request.args.get('after', 'update_after')
+    top = min(200, max(1, request.args.get('top', 20, type=int)))
+    try:
+        # after=now 表示與目前狀態比較
+        stats = memory_tracker.diff(before, None if after == 'now' else after, top=top)
+    except KeyError as e:
+        return jsonify({'success': False, 'error': f'找不到快照 {e}', **memory_tracker.status()}), 404
+    except RuntimeError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({
+        'success': True,
+        'before': before,
+        'after': after,
+        'top_size_diff_bytes': sum(stat['size_diff_bytes'] for stat in stats),
+        'top': stats
+    })
+
 @app.route('/api/health')
 def health_check():
     """健康檢查API"""
@@ -1868,7 +1053,8 @@ def health_check():
             'data_date': data_date,
             'last_update': last_update_str,
             'market': 'TWSE',  # 標記為上市市場
-            'version': '5.0 - TWSE Market Edition (Yahoo Finance)'
+            'version': '5.0 - TWSE Market Edition (Yahoo Finance)',
+            **snapshot_info()
         })
     except Exception as e:
         logger.error(f"健康檢查失敗: {str(e)}")
@@ -1880,6 +1066,10 @@ def update_data():
     global update_status
     
     try:
+        # 可選參數 fast：快速更新，略過前一日成交量過低的股票
+        payload = request.get_json(silent=True) or {}
+        fast = bool(payload.get('fast', False))
+        
         with update_lock:
             if update_status['is_running']:
                 return jsonify({
@@ -1901,7 +1091,7 @@ def update_data():
             update_status['finished_at'] = None
         
         # 在後台執行緒中啟動更新
-        thread = threading.Thread(target=update_stocks_data_background, daemon=True)
+        thread = threading.Thread(target=update_stocks_data_background, kwargs={'fast': fast}, daemon=True)
         thread.start()
         
         return jsonify({
@@ -1937,7 +1127,11 @@ def get_update_status():
             'finished_at': update_status['finished_at'],
             'stocks_count': len(stocks_data),
             'data_date': data_date,
-            'last_update': last_update_str
+            'last_update': last_update_str,
+            **snapshot_info(),
+            'sources': upstream_stats.snapshot(),
+            'last_runs': last_run_summaries,
+            'universe': stock_universe.status()
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1949,13 +1143,16 @@ def get_stocks():
         # 返回前50支股票作為預覽
         preview_stocks = dict(list(stocks_data.items())[:50])
         
-        return jsonify({
-            'stocks': preview_stocks,
-            'total_count': len(stocks_data),
-            'preview_count': len(preview_stocks),
-            'data_date': data_date,
-            'market': 'TWSE'
-        })
+        with observe_stage('serialize_stocks'):
+            response = jsonify({
+                'stocks': preview_stocks,
+                'total_count': len(stocks_data),
+                'preview_count': len(preview_stocks),
+                'data_date': data_date,
+                'market': 'TWSE',
+                **snapshot_info()
+            })
+        return response
         
     except Exception as e:
         logger.error(f"獲取股票清單失敗: {str(e)}")
@@ -2009,18 +1206,14 @@ def get_volume_ratio_class(volume_ratio):
     else:
         return "volume-low"      # 縮量（灰色）
 
-def fetch_historical_data_for_indicators(stock_code, days=60):
-    """獲取歷史資料用於技術指標計算（上市股票版本，Yahoo Finance為主）"""
+def request_yahoo_history(stock_code):
+    """下載單支上市股票近3個月日K的 Yahoo Finance 原始回應（bytes），失敗時回傳 None"""
     
     # 使用Yahoo Finance API獲取歷史數據
     try:
-        logger.info(f"正在獲取 {stock_code} 歷史資料（Yahoo Finance API）...")
-        
-        import requests
-        
         # Yahoo Finance API URL
         symbol = f"{stock_code}.TW"  # 上市股票使用.TW後綴
-        url = f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
+        url = f"{YAHOO_BASE_URL}/v8/finance/chart/{symbol}"
         
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -2036,288 +1229,408 @@ def fetch_historical_data_for_indicators(stock_code, days=60):
             'includeAdjustedClose': 'true'
         }
         
-        response = requests.get(url, headers=headers, params=params, timeout=20, verify=False)
+        response = upstream_get('yahoo_history', url, headers=headers, params=params, timeout=20, verify=False)
         
         if response.status_code == 200:
-            data = response.json()
-            
-            if (data and 'chart' in data and 'result' in data['chart'] and 
-                data['chart']['result'] and len(data['chart']['result']) > 0):
-                
-                result = data['chart']['result'][0]
-                
-                # 檢查數據結構
-                if 'timestamp' not in result or 'indicators' not in result:
-                    logger.warning(f"⚠️ {stock_code}: Yahoo Finance返回數據結構不完整")
-                    return None
-                
-                timestamps = result['timestamp']
-                quotes = result['indicators']['quote'][0]
-                
-                ohlc_data = []
-                for i in range(len(timestamps)):
-                    try:
-                        if (quotes['open'][i] is not None and 
-                            quotes['high'][i] is not None and 
-                            quotes['low'][i] is not None and 
-                            quotes['close'][i] is not None):
-                            
-                            ohlc_data.append({
-                                'date': datetime.fromtimestamp(timestamps[i]).strftime('%Y-%m-%d'),
-                                'open': float(quotes['open'][i]),
-                                'high': float(quotes['high'][i]),
-                                'low': float(quotes['low'][i]),
-                                'close': float(quotes['close'][i]),
-                                'volume': int(quotes['volume'][i]) if quotes['volume'][i] else 0
-                            })
-                    except (ValueError, TypeError, IndexError) as e:
-                        logger.warning(f"⚠️ {stock_code}: 跳過無效數據點 {i}: {e}")
-                        continue
-                
-                if len(ohlc_data) >= 34:
-                    logger.info(f"✅ {stock_code}: 成功獲取 {len(ohlc_data)} 天歷史資料（Yahoo Finance）")
-                    return ohlc_data[-days:] if len(ohlc_data) > days else ohlc_data
-                else:
-                    logger.warning(f"⚠️ {stock_code}: Yahoo Finance資料不足，僅 {len(ohlc_data)} 天（需要至少34天）")
-                    return None
+            return response.content
         
-        logger.warning(f"❌ {stock_code}: Yahoo Finance失敗，HTTP狀態碼: {response.status_code}")
-        if response.status_code == 404:
-            logger.info(f"💡 {stock_code}: 可能是無效的股票代碼或該股票未在Yahoo Finance上市")
+        # 失敗原因已由 upstream_stats 分類統計，逐股日誌僅取樣記錄
+        stock_log.debug(f"❌ {stock_code}: Yahoo Finance失敗，HTTP狀態碼: {response.status_code}")
         
     except requests.exceptions.Timeout:
-        logger.warning(f"❌ {stock_code}: Yahoo Finance請求超時")
+        stock_log.debug(f"❌ {stock_code}: Yahoo Finance請求超時")
     except requests.exceptions.ConnectionError:
-        logger.warning(f"❌ {stock_code}: Yahoo Finance連接錯誤")
+        stock_log.debug(f"❌ {stock_code}: Yahoo Finance連接錯誤")
     except Exception as e:
-        logger.warning(f"❌ {stock_code}: Yahoo Finance異常 - {e}")
-    
-    # 如果Yahoo Finance失敗，記錄錯誤並返回None
-    logger.error(f"❌ {stock_code}: 無法獲取歷史資料")
-    logger.info(f"💡 建議：請檢查網路連接、股票代碼是否正確，或稍後重試")
+        stock_log.debug(f"❌ {stock_code}: Yahoo Finance異常 - {e}")
     
     return None
 
-def get_stock_web_data(stock_code, stock_name=None):
-    """獲取單支股票的完整資料（包含技術指標）"""
+def parse_yahoo_history(stock_code, content, days=60):
+    """解析 Yahoo Finance chart 回應為 OHLC list，資料不足34天時回傳 None"""
     try:
-        # 獲取即時資料
-        if stock_code not in stocks_data:
-            logger.warning(f"股票 {stock_code} 沒有即時資料")
-            return None
-        
-        current_data = stocks_data[stock_code]
-        
-        # 獲取歷史資料用於技術指標計算
-        historical_data = fetch_historical_data_for_indicators(stock_code)
-        
-        if historical_data and len(historical_data) >= 34:
-            # 將當日資料加入歷史資料
-            today_data = {
-                'date': convert_roc_date_to_ad(data_date) if data_date else current_data['date'],
-                'open': current_data['open'],
-                'high': current_data['high'],
-                'low': current_data['low'],
-                'close': current_data['close'],
-                'volume': current_data['volume']
-            }
+        data = json.loads(content)
+    except ValueError as e:
+        upstream_stats.reclassify('yahoo_history', 'json_error', f'{stock_code}: {e}')
+        stock_log.debug(f"❌ {stock_code}: Yahoo Finance異常 - {e}")
+        return None
+    
+    if not (data and 'chart' in data and 'result' in data['chart'] and 
+            data['chart']['result'] and len(data['chart']['result']) > 0):
+        upstream_stats.reclassify('yahoo_history', 'empty', f'{stock_code}: chart 無資料')
+        stock_log.debug(f"❌ {stock_code}: 無法獲取歷史資料")
+        return None
+    
+    result = data['chart']['result'][0]
+    
+    # 檢查數據結構
+    if 'timestamp' not in result or 'indicators' not in result:
+        upstream_stats.reclassify('yahoo_history', 'empty', f'{stock_code}: 資料結構不完整')
+        stock_log.debug(f"⚠️ {stock_code}: Yahoo Finance返回數據結構不完整")
+        return None
+    
+    timestamps = result['timestamp']
+    quotes = result['indicators']['quote'][0]
+    
+    ohlc_data = []
+    for i in range(len(timestamps)):
+        try:
+            if (quotes['open'][i] is not None and 
+                quotes['high'][i] is not None and 
+                quotes['low'][i] is not None and 
+                quotes['close'][i] is not None):
+                
+                ohlc_data.append({
+                    'date': datetime.fromtimestamp(timestamps[i]).strftime('%Y-%m-%d'),
+                    'open': float(quotes['open'][i]),
+                    'high': float(quotes['high'][i]),
+                    'low': float(quotes['low'][i]),
+                    'close': float(quotes['close'][i]),
+                    'volume': int(quotes['volume'][i]) if quotes['volume'][i] else 0
+                })
+        except (ValueError, TypeError, IndexError) as e:
+            stock_log.debug(f"⚠️ {stock_code}: 跳過無效數據點 {i}: {e}")
+            continue
+    
+    if len(ohlc_data) >= 34:
+        stock_log.debug(f"✅ {stock_code}: 成功獲取 {len(ohlc_data)} 天歷史資料（Yahoo Finance）")
+        return ohlc_data[-days:] if len(ohlc_data) > days else ohlc_data
+    
+    stock_log.debug(f"⚠️ {stock_code}: Yahoo Finance資料不足，僅 {len(ohlc_data)} 天（需要至少34天）")
+    return None
+
+def cached_indicator_history(stock_code, current_data):
+    """歷史存放區已涵蓋即時資料日期時回傳其欄位資料，否則回傳 None
+    
+    同一天再次更新後即時資料的 OHLCV 可能已改變，最後一筆以快照資料覆寫。
+    """
+    if history_store.last_date(stock_code) == current_data['date']:
+        return history_store.refresh_last_bar(stock_code, current_data)
+    return None
+
+def store_indicator_history(stock_code, current_data, historical_data):
+    """將下載的歷史資料併入當日資料後寫入存放區，回傳欄位資料"""
+    if not historical_data or len(historical_data) < 34:
+        return None
+    
+    # 將當日資料加入歷史資料
+    today_data = {
+        'date': convert_roc_date_to_ad(data_date) if data_date else current_data['date'],
+        'open': current_data['open'],
+        'high': current_data['high'],
+        'low': current_data['low'],
+        'close': current_data['close'],
+        'volume': current_data['volume']
+    }
+    
+    # 檢查是否已經包含當日資料
+    if historical_data[-1]['date'] != today_data['date']:
+        historical_data.append(today_data)
+    
+    # 當日資料日期缺漏時以即時資料日期記錄，供下次判斷存放區是否為最新
+    if not historical_data[-1]['date']:
+        historical_data[-1]['date'] = current_data['date']
+    
+    return history_store.put(stock_code, historical_data)
+
+def build_stock_web_result(stock_code, current_data, history, result, stock_name=None):
+    """依歷史資料與指標計算結果組合單支股票的顯示資料"""
+    if history is not None and len(history.close) >= 34:
+        if result:
+            fund_flow_trend = result['fund_trend']
+            bull_bear_line = result['multi_short_line']
+            banker_entry_signal = result['banker_entry_signal']
+            is_crossover = result['is_crossover']
+            is_oversold = result['is_oversold']
+            fund_trend_previous = result['fund_trend_previous']
+            multi_short_line_previous = result['multi_short_line_previous']
             
-            # 檢查是否已經包含當日資料
-            if not historical_data or historical_data[-1]['date'] != today_data['date']:
-                historical_data.append(today_data)
+            # 根據嚴格的Pine Script條件判斷狀態
+            signal_status, score = classify_signal(result)
             
-            # 計算Pine Script技術指標
-            result = calculate_pine_script_indicators(historical_data)
+            # 計算成交量和趨勢信息
+            current_volume = current_data['volume']
+            volume_formatted = format_volume(current_volume)
             
-            if result:
-                fund_flow_trend = result['fund_trend']
-                bull_bear_line = result['multi_short_line']
-                banker_entry_signal = result['banker_entry_signal']
-                is_crossover = result['is_crossover']
-                is_oversold = result['is_oversold']
-                fund_trend_previous = result['fund_trend_previous']
-                multi_short_line_previous = result['multi_short_line_previous']
+            # 計算成交量趨勢（需要歷史成交量數據）
+            historical_volumes = [int(v) for v in history.volume[-6:-1]] if len(history.volume) > 5 else []
+            previous_volume = historical_volumes[-1] if historical_volumes else current_volume
+            volume_trend, volume_change_percent = calculate_trend_direction(current_volume, previous_volume)
             
-            if fund_flow_trend is not None:
-                # 根據嚴格的Pine Script條件判斷狀態
-                if banker_entry_signal:
-                    signal_status = "🟡 黃柱信號"
-                    score = 100
-                elif is_crossover and not is_oversold:
-                    signal_status = "突破但非超賣"
-                    score = 75
-                elif is_oversold and not is_crossover:
-                    signal_status = "超賣但未突破"
-                    score = 65
-                elif fund_flow_trend > bull_bear_line:
-                    signal_status = "資金流向強勢"
-                    score = 55
-                else:
-                    signal_status = "資金流向弱勢"
-                    score = 30
-                
-                # 計算成交量和趨勢信息
-                current_volume = current_data['volume']
-                volume_formatted = format_volume(current_volume)
-                
-                # 計算成交量趨勢（需要歷史成交量數據）
-                historical_volumes = [d.get('volume', 0) for d in historical_data[-6:-1]] if len(historical_data) > 5 else []
-                previous_volume = historical_volumes[-1] if historical_volumes else current_volume
-                volume_trend, volume_change_percent = calculate_trend_direction(current_volume, previous_volume)
-                
-                # 計算量比
-                volume_ratio = calculate_volume_ratio(current_volume, historical_volumes)
-                volume_ratio_class = get_volume_ratio_class(volume_ratio)
-                
-                # 計算資金流向和多空線趨勢
-                fund_trend_direction, fund_trend_change = calculate_trend_direction(fund_flow_trend, fund_trend_previous)
-                multi_short_line_direction, multi_short_line_change = calculate_trend_direction(bull_bear_line, multi_short_line_previous)
-                
-                return {
-                    'name': stock_name or current_data['name'],
-                    'price': current_data['close'],
-                    'change_percent': current_data['change_percent'],
-                    'volume': current_volume,
-                    'volume_formatted': volume_formatted,
-                    'volume_trend': volume_trend,
-                    'volume_change_percent': volume_change_percent,
-                    'volume_ratio': volume_ratio,
-                    'volume_ratio_class': volume_ratio_class,
-                    'fund_trend': f"{fund_flow_trend:.2f}",
-                    'fund_trend_direction': fund_trend_direction,
-                    'fund_trend_change': fund_trend_change,
-                    'multi_short_line': f"{bull_bear_line:.2f}",
-                    'multi_short_line_direction': multi_short_line_direction,
-                    'multi_short_line_change': multi_short_line_change,
-                    'signal_status': signal_status,
-                    'score': score,
-                    'date': data_date,  # 使用統一的資料日期顯示格式
-                    'is_crossover': is_crossover,
-                    'is_oversold': is_oversold,
-                    'banker_entry_signal': banker_entry_signal
-                }
-        
-        # 如果無法計算技術指標，返回詳細錯誤資訊
-        error_msg = "歷史資料獲取失敗"
-        if historical_data is None:
-            error_msg = "API連接失敗"
-        elif len(historical_data) < 34:
-            error_msg = f"資料不足({len(historical_data)}/34天)"
-        
-        logger.warning(f"股票 {stock_code} 無法計算技術指標: {error_msg}")
-        
-        # 即使無法計算技術指標，也要返回基本的成交量信息
-        current_volume = current_data['volume']
-        volume_formatted = format_volume(current_volume)
-        
-        return {
-            'name': stock_name or current_data['name'],
-            'price': current_data['close'],
-            'change_percent': current_data['change_percent'],
-            'volume': current_volume,
-            'volume_formatted': volume_formatted,
-            'volume_trend': 'flat',
-            'volume_change_percent': 0,
-            'volume_ratio': 1.0,
-            'volume_ratio_class': 'volume-normal',
-            'fund_trend': error_msg,
-            'fund_trend_direction': 'flat',
-            'fund_trend_change': 0,
-            'multi_short_line': error_msg,
-            'multi_short_line_direction': 'flat',
-            'multi_short_line_change': 0,
-            'signal_status': error_msg,
-            'score': 0,
-            'date': data_date,  # 使用統一的資料日期顯示格式
-            'is_crossover': False,
-            'is_oversold': False,
-            'banker_entry_signal': False
-        }
+            # 計算量比
+            volume_ratio = calculate_volume_ratio(current_volume, historical_volumes)
+            volume_ratio_class = get_volume_ratio_class(volume_ratio)
+            
+            # 計算資金流向和多空線趨勢
+            fund_trend_direction, fund_trend_change = calculate_trend_direction(fund_flow_trend, fund_trend_previous)
+            multi_short_line_direction, multi_short_line_change = calculate_trend_direction(bull_bear_line, multi_short_line_previous)
+            
+            return {
+                'name': stock_name or current_data['name'],
+                'price': current_data['close'],
+                'change_percent': current_data['change_percent'],
+                'volume': current_volume,
+                'volume_formatted': volume_formatted,
+                'volume_trend': volume_trend,
+                'volume_change_percent': volume_change_percent,
+                'volume_ratio': volume_ratio,
+                'volume_ratio_class': volume_ratio_class,
+                'fund_trend': f"{fund_flow_trend:.2f}",
+                'fund_trend_direction': fund_trend_direction,
+                'fund_trend_change': fund_trend_change,
+                'multi_short_line': f"{bull_bear_line:.2f}",
+                'multi_short_line_direction': multi_short_line_direction,
+                'multi_short_line_change': multi_short_line_change,
+                'signal_status': signal_status,
+                'score': score,
+                'date': data_date,  # 使用統一的資料日期顯示格式
+                'is_crossover': is_crossover,
+                'is_oversold': is_oversold,
+                'banker_entry_signal': banker_entry_signal
+            }
+    
+    # 如果無法計算技術指標，返回詳細錯誤資訊
+    error_msg = "歷史資料獲取失敗"
+    if history is None:
+        error_msg = "API連接失敗"
+    elif len(history.close) < 34:
+        error_msg = f"資料不足({len(history.close)}/34天)"
+    
+    stock_log.debug(f"股票 {stock_code} 無法計算技術指標: {error_msg}")
+    
+    # 即使無法計算技術指標，也要返回基本的成交量信息
+    current_volume = current_data['volume']
+    volume_formatted = format_volume(current_volume)
+    
+    return {
+        'name': stock_name or current_data['name'],
+        'price': current_data['close'],
+        'change_percent': current_data['change_percent'],
+        'volume': current_volume,
+        'volume_formatted': volume_formatted,
+        'volume_trend': 'flat',
+        'volume_change_percent': 0,
+        'volume_ratio': 1.0,
+        'volume_ratio_class': 'volume-normal',
+        'fund_trend': error_msg,
+        'fund_trend_direction': 'flat',
+        'fund_trend_change': 0,
+        'multi_short_line': error_msg,
+        'multi_short_line_direction': 'flat',
+        'multi_short_line_change': 0,
+        'signal_status': error_msg,
+        'score': 0,
+        'date': data_date,  # 使用統一的資料日期顯示格式
+        'is_crossover': False,
+        'is_oversold': False,
+        'banker_entry_signal': False
+    }
+
+def run_screen_pipeline(stock_codes, summary=None):
+    """以串流管線執行篩選：下載歷史 → 解碼寫入存放區 → 指標計算
+    
+    每支股票的歷史資料一下載完成就立即解析並計算指標，網路等待與 CPU 計算
+    重疊進行；INDICATOR_EXECUTION_MODE=process 時指標階段分批交由行程池計算。
+    summary（RunSummary）會記錄快取命中、失敗原因與各階段耗時。
+    """
+    snapshot = stocks_data
+    summary = summary or RunSummary('screen')
+    
+    def fetch_stage(stock_code):
+        current_data = snapshot[stock_code]
+        cached = cached_indicator_history(stock_code, current_data)
+        if cached is not None:
+            summary.count('cache_hit')
+            return stock_code, cached, None
+        
+        # 使用簡單的超時機制，不依賴signal
+        start_time = time.time()
+        content = request_yahoo_history(stock_code)
+        if time.time() - start_time > 10:  # 10秒超時
+            stock_log.debug(f"股票 {stock_code} 處理超時，跳過")
+            summary.fail('timeout')
+            return None
+        summary.count('downloaded')
+        return stock_code, None, content
+    
+    def decode_stage(fetched):
+        stock_code, history, content = fetched
+        if history is None and content is not None:
+            with observe_stage('decode_history'):
+                historical_data = parse_yahoo_history(stock_code, content)
+                history = store_indicator_history(stock_code, snapshot[stock_code], historical_data)
+        return stock_code, history
+    
+    if INDICATOR_EXECUTION_MODE == 'process':
+        def indicator_stage(batch):
+            with observe_stage('indicators'):
+                results = indicator_pool.compute(dict(batch))
+            INDICATOR_STOCKS.inc(len(batch), mode='process')
+            return [(stock_code, history, results.get(stock_code)) for stock_code, history in batch]
+        indicator_workers, indicator_batch = INDICATOR_PROCESS_WORKERS, INDICATOR_CHUNK_SIZE
+        indicator_min_batch, indicator_linger = INDICATOR_MIN_BATCH, INDICATOR_BATCH_LINGER_MS / 1000
+    else:
+        def indicator_stage(batch):
+            computed = []
+            for stock_code, history in batch:
+                result = None
+                if history is not None and len(history.close) >= 34:
+                    with observe_stage('indicators'):
+                        result = calculate_pine_script_indicators_from_columns(history.open, history.high, history.low, history.close)
+                computed.append((stock_code, history, result))
+            INDICATOR_STOCKS.inc(len(batch), mode='inline')
+            return computed
+        indicator_workers, indicator_batch = 1, 1
+        indicator_min_batch, indicator_linger = 1, 0.0
+    
+    results = {}
+    
+    def sink(computed):
+        stock_code, history, result = computed
+        if history is None:
+            summary.fail('no_history')
+        elif len(history.close) < 34:
+            summary.fail('insufficient_history')
+        elif result is None:
+            summary.fail('indicator_error')
+        try:
+            stock_data = build_stock_web_result(stock_code, snapshot[stock_code], history, result)
+        except Exception as e:
+            stock_log.debug(f"處理股票 {stock_code} 時發生錯誤: {e}")
+            summary.fail('build_error')
+            return
+        if stock_data:
+            results[stock_code] = {
+                'code': stock_code,
+                **stock_data
+            }
+    
+    pipeline = Pipeline([
+        Stage('fetch', fetch_stage, workers=SCREEN_FETCH_WORKERS),
+        Stage('decode', decode_stage, workers=1),
+        Stage('indicator', indicator_stage, workers=indicator_workers, batched=True, batch_size=indicator_batch,
+              min_batch=indicator_min_batch, linger=indicator_linger)
+    ], queue_size=PIPELINE_QUEUE_SIZE, name='screen')
+    stats = pipeline.run(stock_codes, sink)
+    record_pipeline_timings(summary, stats)
+    summary.count('analyzed', len(results))
+    
+    # 維持原始股票順序（同分時的排序結果與逐支處理一致）
+    return [results[stock_code] for stock_code in stock_codes if stock_code in results]
+
+# 篩選結果匯出（CSV）的欄位順序
+SCREEN_EXPORT_FIELDS = tuple(name for name, _ in exporters.SCREEN_EXPORT_COLUMNS)
+
+@profile_manager.profiled('screen')
+def run_screen(stock_codes=None, max_stocks=1044):
+    """篩選股票（供 /api/screen 與 screen_cli.py 共用），回傳結果 dict
+    
+    stock_codes 為 None 時篩選快照中的全部股票（依優先權排列，最多 max_stocks 支），
+    否則只篩選其中存在於快照的代碼。快照為空時拋出 RuntimeError。
+    """
+    global recent_signal_codes, last_screen_results
+    
+    current_time = get_taiwan_time()
+    
+    # 檢查是否有股票資料
+    if not stocks_data:
+        raise RuntimeError('請先更新上市股票資料')
+    
+    # 歷史資料檔可能已被其他行程（排程的 screen_cli.py、其他 worker）替換，讀取前重新映射
+    history_store.reload()
+    
+    # 獲取所有股票的完整資料（全部股票分析）；更新進行中可能為部分快照
+    snapshot = snapshot_info()
+    
+    if stock_codes:
+        stock_codes = [code for code in dict.fromkeys(stock_codes) if code in stocks_data]
+    else:
+        logger.info(f"開始分析 {len(stocks_data)} 支上市股票的Pine Script指標...")
+        
+        # 依優先權排列（自選清單與高成交量股票先完成）
+        stock_codes, _ = fetch_scheduler.order(
+            list(stocks_data.keys()),
+            previous_snapshot=stocks_data,
+            signal_candidates=recent_signal_codes
+        )
+    
+    # 限制總處理數量以避免超時
+    max_stocks = min(max_stocks, len(stock_codes))  # 最多處理1044支上市股票
+    stock_codes = stock_codes[:max_stocks]
+    
+    summary = RunSummary('screen')
+    summary.count('requested', max_stocks)
+    summary.set(snapshot_version=snapshot['snapshot_version'], partial=snapshot['partial'])
+    upstream_before = upstream_stats.outcome_counts()
+    
+    memory_tracker.mark('screen_before')
+    with observe_stage('screen'):
+        all_stocks_data = run_screen_pipeline(stock_codes, summary)
+        processed_count = len(all_stocks_data)
         
-    except Exception as e:
-        logger.error(f"獲取股票 {stock_code} 資料時發生錯誤: {e}")
-        return None
+        # 將本次新下載的歷史資料寫入存放區，供後續篩選與其他行程共用
+        try:
+            history_store.flush(as_of=data_date)
+        except OSError as e:
+            logger.warning(f"寫入歷史資料檔失敗: {e}")
+    
+    memory_tracker.mark('screen_after')
+    
+    # 篩選出黃柱信號的股票
+    yellow_candle_stocks = [stock for stock in all_stocks_data if stock.get('banker_entry_signal', False)]
+    
+    # 記錄信號候選股，供下次更新優先下載
+    recent_signal_codes = {
+        stock['code'] for stock in all_stocks_data
+        if stock.get('banker_entry_signal') or stock.get('is_crossover') or stock.get('is_oversold')
+    }
+    
+    summary.count('yellow_candle', len(yellow_candle_stocks))
+    summary.count('signal_candidates', len(recent_signal_codes))
+    summary.set(upstream_failures=outcome_delta(upstream_before, upstream_stats.outcome_counts()))
+    last_run_summaries['screen'] = summary.emit(logger)
+    
+    # 按評分排序
+    all_stocks_data.sort(key=lambda x: x.get('score', 0), reverse=True)
+    yellow_candle_stocks.sort(key=lambda x: x.get('score', 0), reverse=True)
+    last_screen_results = all_stocks_data
+    
+    # 封存本次的指標值與信號旗標（依資料日期），供日後查詢歷史信號
+    try:
+        signal_archive.append(data_date, all_stocks_data)
+    except OSError as e:
+        logger.warning(f"寫入信號封存失敗: {e}")
+    
+    return {
+        'success': True,
+        'all_stocks': all_stocks_data,
+        'yellow_candle_stocks': yellow_candle_stocks,
+        'total_analyzed': processed_count,
+        'yellow_candle_count': len(yellow_candle_stocks),
+        'query_time': current_time.isoformat(),
+        'data_date': data_date,
+        'market': 'TWSE',
+        **snapshot
+    }
 
 @app.route('/api/screen', methods=['POST'])
 def screen_stocks():
     """篩選股票"""
     try:
-        current_time = get_taiwan_time()
+        payload = request.get_json(silent=True) or {}
+        stock_codes = payload.get('stock_codes') or None
         
-        # 檢查是否有股票資料
-        if not stocks_data:
+        try:
+            result = run_screen(stock_codes)
+        except RuntimeError as e:
             return jsonify({
                 'success': False,
-                'error': '請先更新上市股票資料'
+                'error': str(e)
             }), 400
         
-        # 獲取所有股票的完整資料（全部股票分析）
-        all_stocks_data = []
-        total_stocks = len(stocks_data)
-        processed_count = 0
-        
-        logger.info(f"開始分析 {total_stocks} 支上市股票的Pine Script指標...")
-        
-        # 分批處理以避免超時（減少批次大小）
-        batch_size = 10  # 從50減少到10支股票每批
-        stock_codes = list(stocks_data.keys())
-        
-        # 限制總處理數量以避免超時
-        max_stocks = min(1044, len(stock_codes))  # 最多處理1044支上市股票
-        stock_codes = stock_codes[:max_stocks]
-        
-        logger.info(f"為確保穩定性，本次處理前 {max_stocks} 支上市股票")
-        
-        for i in range(0, len(stock_codes), batch_size):
-            batch_codes = stock_codes[i:i+batch_size]
-            logger.info(f"處理第 {i//batch_size + 1} 批股票 ({len(batch_codes)} 支)...")
-            
-            for stock_code in batch_codes:
-                try:
-                    # 使用簡單的超時機制，不依賴signal
-                    import time
-                    start_time = time.time()
-                    
-                    stock_data = get_stock_web_data(stock_code)
-                    
-                    # 檢查是否超時
-                    if time.time() - start_time > 10:  # 10秒超時
-                        logger.warning(f"股票 {stock_code} 處理超時，跳過")
-                        continue                
-                    if stock_data:
-                        all_stocks_data.append({
-                            'code': stock_code,
-                            **stock_data
-                        })
-                        processed_count += 1
-                        
-                        # 每處理5支股票記錄一次進度
-                        if processed_count % 5 == 0:
-                            logger.info(f"已處理 {processed_count}/{max_stocks} 支股票...")
-                            
-                except Exception as e:
-                    logger.warning(f"處理股票 {stock_code} 時發生錯誤: {e}")
-                    continue
-        
-        # 篩選出黃柱信號的股票
-        yellow_candle_stocks = [stock for stock in all_stocks_data if stock.get('banker_entry_signal', False)]
-        
-        logger.info(f"篩選完成：共分析 {processed_count} 支上市股票，發現 {len(yellow_candle_stocks)} 支黃柱信號股票")
-        
-        # 按評分排序
-        all_stocks_data.sort(key=lambda x: x.get('score', 0), reverse=True)
-        yellow_candle_stocks.sort(key=lambda x: x.get('score', 0), reverse=True)
-        
-        return jsonify({
-            'success': True,
-            'all_stocks': all_stocks_data,
-            'yellow_candle_stocks': yellow_candle_stocks,
-            'total_analyzed': processed_count,
-            'yellow_candle_count': len(yellow_candle_stocks),
-            'query_time': current_time.isoformat(),
-            'data_date': data_date,
-            'market': 'TWSE'
-        })
+        with observe_stage('serialize_screen'):
+            response = jsonify(result)
+        return response
         
     except Exception as e:
         logger.error(f"篩選上市股票時發生錯誤: {e}")
@@ -2326,6 +1639,99 @@ def screen_stocks():
             'error': f'篩選失敗: {str(e)}'
         }), 500
 
+def parse_export_filters():
+    """匯出端點的共用參數：format、codes（逗號分隔）、start / end（YYYY-MM-DD）"""
+    fmt = (request.args.get('format') or 'csv').lower()
+    codes = [code.strip() for code in (request.args.get('codes') or '').split(',') if code.strip()]
+    start = request.args.get('start') or None
+    end = request.args.get('end') or None
+    for value in (start, end):
+        if value is not None:
+            datetime.strptime(value, '%Y-%m-%d')
+    return fmt, set(codes) or None, start, end
+
+def export_response(rows, columns, fmt, name):
+    """以串流回應輸出匯出資料（邊產生邊傳送，不在記憶體中組出整份檔案）"""
+    try:
+        chunks = exporters.iter_export(rows, columns, fmt)
+    except exporters.ExportUnavailable as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    mimetype, extension = exporters.FORMATS[fmt]
+    filename = f"{name}_{get_taiwan_time().strftime('%Y%m%d_%H%M')}.{extension}"
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@app.route('/api/export/screen')
+def export_screen():
+    """匯出最近一次篩選結果（CSV 或 Parquet）"""
+    try:
+        fmt, codes, start, end = parse_export_filters()
+    except ValueError:
+        return jsonify({'success': False, 'error': '日期格式錯誤，請使用 YYYY-MM-DD'}), 400
+    if not last_screen_results:
+        return jsonify({'success': False, 'error': '尚無篩選結果，請先執行篩選'}), 400
+    signals_only = request.args.get('signals_only', '').lower() in ('1', 'true', 'yes')
+    rows = exporters.screen_rows(last_screen_results, codes, start, end, signals_only)
+    return export_response(rows, exporters.SCREEN_EXPORT_COLUMNS, fmt, 'screen')
+
+@app.route('/api/export/history')
+def export_history():
+    """匯出歷史存放區中的日K資料（CSV 或 Parquet），依代碼與日期範圍過濾"""
+    try:
+        fmt, codes, start, end = parse_export_filters()
+    except ValueError:
+        return jsonify({'success': False, 'error': '日期格式錯誤，請使用 YYYY-MM-DD'}), 400
+    history_store.reload()
+    rows = exporters.history_rows(history_store, codes, start, end)
+    return export_response(rows, exporters.HISTORY_EXPORT_COLUMNS, fmt, 'history')
+
+@app.route('/api/signals/history')
+def signals_history():
+    """查詢封存的歷史信號
+    
+    未指定 code 時回傳最近 days 個交易日內 flag 成立的股票（只讀索引）；
+    指定 code 時回傳該股票每日的指標值與信號旗標。end 為查詢區間的最後日期（含）。
+    """
+    flag = request.args.get('flag', 'banker_entry_signal')
+    code = (request.args.get('code') or '').strip() or None
+    end = request.args.get('end') or None
+    try:
+        days = int(request.args.get('days', '10'))
+        if end is not None:
+            datetime.strptime(end, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'days 須為整數，end 須為 YYYY-MM-DD'}), 400
+    days = max(1, min(days, 250))
+    if flag not in SIGNAL_FLAGS:
+        return jsonify({'success': False, 'error': f"未知的信號旗標：{flag}（可用 {', '.join(SIGNAL_FLAGS)}）"}), 400
+    
+    if code:
+        history = signal_archive.code_history(code, days, end)
+        return jsonify({
+            'success': True,
+            'code': code,
+            'dates': [row['date'] for row in history],
+            'history': history
+        })
+    
+    dates, stocks = signal_archive.signals(flag, days, end)
+    names = get_twse_stock_codes()
+    for stock in stocks:
+        stock['name'] = names.get(stock['code'])
+    return jsonify({
+        'success': True,
+        'flag': flag,
+        'dates': dates,
+        'stocks': stocks,
+        'count': len(stocks)
+    })
+
+# 啟動背景健康探測，第一次 /api/diagnose 前就已有探測結果（HEALTH_PROBE_INTERVAL=0 時不啟動）
+health_prober.ensure_started()
+
 if __name__ == '__main__':
     # 啟動Flask應用（移除啟動時數據更新以避免部署超時）
     logger.info("台股主力資金篩選器 - 上市市場版本啟動中...")
@@ -1,56 +1,195 @@
+import heapq
 import logging
-import random
+from array import array
+from collections import namedtuple
+from collections.abc import Mapping
+
+from indicators import calculate_pine_script_indicators_from_columns, classify_signal
+
+OHLC_FIELDS = ('open', 'high', 'low', 'close')
+SIGNAL_COLUMNS = ('code', 'entry_score', 'signal_status', 'fund_trend', 'multi_short_line',
+                  'fund_trend_previous', 'multi_short_line_previous',
+                  'banker_entry_signal', 'is_crossover', 'is_oversold')
+
+# 送往指標計算行程池的欄位（IndicatorProcessPool 以屬性讀取 open/high/low/close）
+_Columns = namedtuple('_Columns', OHLC_FIELDS)
+
+
+def history_columns(history):
+    """將各種形式的歷史K線轉為 (opens, highs, lows, closes)
+
+    支援：具 open/high/low/close 屬性的物件（歷史存放區欄位）、
+    欄位 dict（或 DataFrame）、以及每日一筆的 OHLC dict list。
+    """
+    if history is None:
+        return None
+    if hasattr(history, 'columns'):
+        # DataFrame：轉為 list，避免 Series 以索引標籤而非位置取值
+        return tuple(list(history[field]) for field in OHLC_FIELDS)
+    if isinstance(history, Mapping):
+        return tuple(history[field] for field in OHLC_FIELDS)
+    if all(hasattr(history, field) for field in OHLC_FIELDS):
+        return tuple(getattr(history, field) for field in OHLC_FIELDS)
+    rows = list(history)
+    return tuple([row[field] for row in rows] for field in OHLC_FIELDS)
+
+
+def _iter_stocks(stocks_data):
+    """依序產生 (code, stock)；stocks_data 可為 {代碼: 股票} 或股票 list"""
+    if isinstance(stocks_data, Mapping):
+        yield from stocks_data.items()
+    else:
+        for stock in stocks_data:
+            yield stock.get('code'), stock
+
 
 class BankerEntrySignalCalculator:
-    def __init__(self):
+    def __init__(self, execution_mode='inline', pool=None, workers=None):
+        """execution_mode 為 inline（目前執行緒）或 process（指標計算行程池）；
+        pool 可傳入應用程式既有的 IndicatorProcessPool，否則首次使用時自行建立"""
         self.logger = logging.getLogger(__name__)
-        
+        self.execution_mode = execution_mode
+        self.workers = workers
+        self._pool = pool
+        self._owns_pool = False
+
     def get_top_banker_entry_stocks(self, stocks_data, top_n=20):
-        """獲取主力進場股票（簡化版）"""
+        """獲取主力進場評分最高的 top_n 支股票
+
+        stocks_data 為 {代碼: 股票} 或股票 list，每支股票含 name 與 history
+        （沒有 history 時以股票本身作為歷史K線）。以 heapq 只保留前 top_n 名，
+        n 支股票的排名為 O(n log k)，只有入選的股票會組合成結果 dict。
+        """
         try:
-            results = []
-            
-            # 生成模擬結果
-            sample_stocks = [
-                {'code': '2330', 'name': '台積電'},
-                {'code': '2317', 'name': '鴻海'},
-                {'code': '2454', 'name': '聯發科'},
-                {'code': '2881', 'name': '富邦金'},
-                {'code': '2882', 'name': '國泰金'}
-            ]
-            
-            for stock in sample_stocks:
-                result = {
-                    'code': stock['code'],
-                    'name': stock['name'],
-                    'close_price': round(random.uniform(50, 1000), 2),
-                    'change_percent': round(random.uniform(-3, 5), 2),
-                    'fund_trend': random.choice(['流入', '流出', '持平']),
-                    'multi_short_line': random.choice(['多頭', '空頭', '盤整']),
-                    'entry_score': random.randint(60, 95)
-                }
-                results.append(result)
-            
-            # 按評分排序
-            results.sort(key=lambda x: x['entry_score'], reverse=True)
-            
-            self.logger.info(f"生成 {len(results)} 支股票的模擬分析結果")
-            return results[:top_n]
-            
+            def scored():
+                for code, stock in _iter_stocks(stocks_data):
+                    # 單支股票資料格式錯誤時略過，不影響其他股票的排名
+                    try:
+                        columns = history_columns(stock.get('history', stock))
+                        signal = self._signal_from_columns(columns)
+                    except Exception as e:
+                        self.logger.debug(f"股票 {code} 無法計算主力信號，略過: {e}")
+                        continue
+                    if signal is not None:
+                        yield (signal['entry_score'], signal['fund_trend'] - signal['multi_short_line'],
+                               code, stock, columns, signal)
+
+            top = heapq.nlargest(top_n, scored(), key=lambda item: item[:2])
+            results = [self._ranking_result(code, stock, columns, signal)
+                       for _, _, code, stock, columns, signal in top]
+
+            self.logger.info(f"主力進場排名：取前 {len(results)} 支股票")
+            return results
+
         except Exception as e:
             self.logger.error(f"計算主力進場信號失敗: {e}")
             return []
-    
+
     def calculate_banker_signal(self, stock_data):
-        """計算單支股票的主力信號（簡化版）"""
+        """以資金流向與多空線指標計算單支股票的主力信號；資料不足 34 天時回傳 None"""
         try:
-            # 返回模擬信號
-            return {
-                'entry_score': random.randint(60, 95),
-                'fund_trend': random.choice(['流入', '流出', '持平']),
-                'multi_short_line': random.choice(['多頭', '空頭', '盤整'])
-            }
+            return self._signal_from_columns(history_columns(stock_data))
         except Exception as e:
             self.logger.error(f"計算主力信號失敗: {e}")
             return None
 
+    def calculate_banker_signals(self, universe, mode=None):
+        """一次計算整個股票池的主力信號，回傳欄式表格 {欄位: list}
+
+        universe 為 {代碼: 歷史K線} 或 [(代碼, 歷史K線), ...]，歷史K線的形式同
+        calculate_banker_signal。每支股票佔一列（順序與輸入相同），資料不足的股票
+        各欄為 None；表格可直接交給 pandas.DataFrame。mode 未指定時使用 execution_mode。
+        """
+        items = universe.items() if isinstance(universe, Mapping) else universe
+        codes = []
+        histories = {}
+        for code, history in items:
+            codes.append(code)
+            try:
+                columns = history_columns(history)
+            except (KeyError, TypeError) as e:
+                self.logger.warning(f"股票 {code} 的歷史K線格式錯誤: {e}")
+                columns = None
+            if columns is not None and len(columns[3]) >= 34:
+                histories[code] = columns
+
+        mode = mode or self.execution_mode
+        if mode == 'process' and len(histories) > 1:
+            # 歷史存放區的 mmap 切片在行程池中只會傳送代碼，而子行程不一定映射同一個存放區；
+            # 一律複製成 array 傳送數值
+            results = self._get_pool().compute({
+                code: _Columns(*(array('d', column) if isinstance(column, memoryview) else column
+                                 for column in columns))
+                for code, columns in histories.items()
+            })
+        else:
+            results = {}
+            for code, columns in histories.items():
+                try:
+                    results[code] = calculate_pine_script_indicators_from_columns(*columns)
+                except Exception as e:
+                    self.logger.warning(f"計算股票 {code} 主力信號時發生錯誤: {e}")
+                    results[code] = None
+
+        table = {column: [] for column in SIGNAL_COLUMNS}
+        for code in codes:
+            signal = self._signal_from_result(results.get(code)) or {}
+            table['code'].append(code)
+            for column in SIGNAL_COLUMNS[1:]:
+                table[column].append(signal.get(column))
+
+        computed = sum(1 for code in codes if results.get(code))
+        self.logger.info(f"批次計算主力信號：{len(codes)} 支股票，{computed} 支有結果（{mode}）")
+        return table
+
+    def _get_pool(self):
+        if self._pool is None:
+            from indicator_pool import IndicatorProcessPool
+            self._pool = IndicatorProcessPool(workers=self.workers)
+            self._owns_pool = True
+        return self._pool
+
+    def shutdown(self):
+        """關閉自行建立的行程池（外部傳入的行程池由呼叫端管理）"""
+        if self._owns_pool and self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+            self._owns_pool = False
+
+    def _signal_from_columns(self, columns):
+        if columns is None:
+            return None
+        return self._signal_from_result(calculate_pine_script_indicators_from_columns(*columns))
+
+    @staticmethod
+    def _signal_from_result(result):
+        if not result:
+            return None
+        signal_status, score = classify_signal(result)
+        return {
+            'entry_score': score,
+            'signal_status': signal_status,
+            'fund_trend': round(result['fund_trend'], 2),
+            'multi_short_line': round(result['multi_short_line'], 2),
+            'fund_trend_previous': round(result['fund_trend_previous'], 2),
+            'multi_short_line_previous': round(result['multi_short_line_previous'], 2),
+            'banker_entry_signal': result['banker_entry_signal'],
+            'is_crossover': result['is_crossover'],
+            'is_oversold': result['is_oversold']
+        }
+
+    @staticmethod
+    def _ranking_result(code, stock, columns, signal):
+        closes = columns[3]
+        close_price = float(closes[-1])
+        previous = float(closes[-2]) if len(closes) >= 2 else close_price
+        change_percent = stock.get('change_percent')
+        if change_percent is None:
+            change_percent = (close_price - previous) / previous * 100 if previous else 0.0
+        return {
+            'code': code,
+            'name': stock.get('name', ''),
+            'close_price': round(close_price, 2),
+            'change_percent': round(float(change_percent), 2),
+            **signal
+        }
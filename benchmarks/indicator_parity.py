@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+指標計算一致性檢查（golden parity）
+
+比較參考實作（indicators.calculate_pine_script_indicators_from_columns）與
+替代實作在固定樣本與隨機樣本上的結果，避免效能改寫悄悄改變哪些股票出現黃柱：
+
+- 固定樣本：benchmarks/fixtures/indicator_golden.json（含輸入與參考輸出），
+  同時檢查參考實作本身是否與記錄的結果一致
+- 隨機樣本：以固定種子產生不同長度與型態的K線（隨機漫步、橫盤、跳空、高低價相同...）
+- 數值欄位（fund_trend、multi_short_line 及前一日值）在容許誤差內視為相同，
+  布林欄位（is_crossover、is_oversold、banker_entry_signal）必須完全相同
+- 並列兩者的耗時
+
+用法：
+    python benchmarks/indicator_parity.py                                  # 參考實作 vs golden
+    python benchmarks/indicator_parity.py --engine fast_indicators:compute # 替代實作 vs 參考實作
+    python benchmarks/indicator_parity.py --ema fast_indicators:ema --wsa fast_indicators:wsa
+    python benchmarks/indicator_parity.py --update-golden                  # 重新產生 golden 檔
+"""
+
+import argparse
+import importlib
+import json
+import math
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from indicators import (  # noqa: E402
+    calculate_pine_script_indicators_from_columns,
+    calculate_weighted_simple_average,
+    calculate_ema,
+)
+from synthetic import generate_stock  # noqa: E402
+
+GOLDEN_PATH = os.path.join(BENCH_DIR, 'fixtures', 'indicator_golden.json')
+NUMERIC_FIELDS = ('fund_trend', 'multi_short_line', 'fund_trend_previous', 'multi_short_line_previous')
+BOOLEAN_FIELDS = ('is_crossover', 'is_oversold', 'banker_entry_signal')
+
+
+def load_callable(spec):
+    """載入 'module:function' 形式的函式"""
+    module_name, _, attribute = spec.partition(':')
+    if not attribute:
+        raise SystemExit(f"請以 module:function 指定函式：{spec}")
+    target = importlib.import_module(module_name)
+    for part in attribute.split('.'):
+        target = getattr(target, part)
+    return target
+
+
+def columns_engine(func, api):
+    """將替代實作包成 (opens, highs, lows, closes) 介面"""
+    if api == 'columns':
+        return func
+
+    def ohlc(opens, highs, lows, closes):
+        return func([{'open': o, 'high': h, 'low': l, 'close': c, 'volume': 0}
+                     for o, h, l, c in zip(opens, highs, lows, closes)])
+    return ohlc
+
+
+def handcrafted_series():
+    """特殊型態的固定樣本"""
+    def bars(closes, spread=0.01):
+        return {
+            'open': [round(c * (1 - spread / 2), 4) for c in closes],
+            'high': [round(c * (1 + spread), 4) for c in closes],
+            'low': [round(c * (1 - spread), 4) for c in closes],
+            'close': [round(c, 4) for c in closes]
+        }
+
+    series = {
+        'flat': bars([100.0] * 62, spread=0),
+        'min_length_34': bars([50 + i * 0.3 for i in range(34)]),
+        'steady_uptrend': bars([20 * 1.01 ** i for i in range(62)]),
+        'steady_downtrend': bars([200 * 0.99 ** i for i in range(62)]),
+        'v_rebound': bars([100 * 0.97 ** i for i in range(58)] + [100 * 0.97 ** 57 * m for m in (1.05, 1.1, 1.16, 1.2)]),
+        'limit_moves': bars([50 * (1.1 if i % 2 else 0.91) ** (i % 5) for i in range(62)]),
+        'tiny_prices': bars([0.05 + 0.001 * math.sin(i / 3) for i in range(62)]),
+        'large_prices': bars([3000 + 400 * math.sin(i / 5) for i in range(120)]),
+        'flat_then_breakout': bars([80.0] * 50 + [80 * 1.03 ** i for i in range(1, 13)]),
+    }
+    # 最後一天崩跌後隔日反彈（前一日黃柱判斷路徑）
+    crash = [100 * 0.98 ** i for i in range(55)]
+    series['crash_rebound_two_days'] = bars(crash + [crash[-1] * 0.93, crash[-1] * 0.95, crash[-1] * 1.04])
+    return series
+
+
+def synthetic_series(count, seed=7):
+    series = {}
+    for index in range(count):
+        days = (34, 62, 120)[index % 3]
+        stock = generate_stock(index, days, seed)
+        series[f'synthetic_{stock.code}_{days}d'] = {
+            'open': list(stock.open), 'high': list(stock.high),
+            'low': list(stock.low), 'close': list(stock.close)
+        }
+    return series
+
+
+def fuzz_series(count, seed=2024):
+    """隨機樣本：長度 34~200，混合隨機漫步、橫盤、跳空與高低價相同的K線"""
+    rng = random.Random(seed)
+    for index in range(count):
+        length = rng.randint(34, 200)
+        price = rng.uniform(1, 2000)
+        volatility = rng.choice((0.0, 0.002, 0.02, 0.06))
+        opens, highs, lows, closes = [], [], [], []
+        for _ in range(length):
+            regime = rng.random()
+            if regime < 0.05:
+                change = rng.choice((-0.1, 0.1))           # 漲跌停
+            elif regime < 0.15:
+                change = 0.0                               # 橫盤
+            else:
+                change = rng.gauss(0, volatility)
+            open_price = price * (1 + rng.gauss(0, volatility / 2))
+            close_price = max(0.01, price * (1 + change))
+            if rng.random() < 0.05:
+                high_price = low_price = open_price = close_price   # 一字線
+            else:
+                high_price = max(open_price, close_price) * (1 + abs(rng.gauss(0, volatility / 2)))
+                low_price = min(open_price, close_price) * (1 - abs(rng.gauss(0, volatility / 2)))
+            opens.append(open_price)
+            highs.append(high_price)
+            lows.append(low_price)
+            closes.append(close_price)
+            price = close_price
+        yield f'fuzz_{index}', {'open': opens, 'high': highs, 'low': lows, 'close': closes}
+
+
+def run_engine(func, bars):
+    """執行一次計算；例外也視為結果的一部分（兩邊必須一致）"""
+    try:
+        return func(bars['open'], bars['high'], bars['low'], bars['close'])
+    except Exception as e:
+        return {'__error__': type(e).__name__}
+
+
+def compare_results(expected, actual, tolerance):
+    """回傳不一致的欄位說明（空 list 表示一致）"""
+    if expected is None or actual is None:
+        return [] if expected is None and actual is None else [f'None 不一致：{expected!r} vs {actual!r}']
+    if '__error__' in expected or '__error__' in actual:
+        return [] if expected.get('__error__') == actual.get('__error__') else [f'例外不一致：{expected} vs {actual}']
+
+    problems = []
+    for field in NUMERIC_FIELDS:
+        a, b = expected.get(field), actual.get(field)
+        if a is None or b is None or not math.isclose(a, b, rel_tol=0, abs_tol=tolerance):
+            problems.append(f'{field}: {a!r} vs {b!r}')
+    for field in BOOLEAN_FIELDS:
+        if bool(expected.get(field)) != bool(actual.get(field)):
+            problems.append(f'{field}: {expected.get(field)!r} vs {actual.get(field)!r}')
+    return problems
+
+
+def serializable(result):
+    if result is None:
+        return None
+    return {key: (bool(value) if key in BOOLEAN_FIELDS else value) for key, value in result.items()}
+
+
+def update_golden(synthetic_count):
+    cases = {**handcrafted_series(), **synthetic_series(synthetic_count)}
+    fixtures = []
+    for name, bars in cases.items():
+        fixtures.append({'name': name, 'bars': bars,
+                         'expected': serializable(run_engine(calculate_pine_script_indicators_from_columns, bars))})
+    os.makedirs(os.path.dirname(GOLDEN_PATH), exist_ok=True)
+    with open(GOLDEN_PATH, 'w', encoding='utf-8') as f:
+        json.dump({'version': 1, 'fixtures': fixtures}, f, ensure_ascii=False, separators=(',', ':'))
+    signals = sum(1 for fixture in fixtures if fixture['expected'] and fixture['expected'].get('banker_entry_signal'))
+    print(f"已寫入 {len(fixtures)} 個固定樣本（{signals} 個黃柱）至 {GOLDEN_PATH}")
+
+
+def check_components(args, report):
+    """比較 calculate_weighted_simple_average / calculate_ema 的替代實作"""
+    rng = random.Random(args.seed)
+    components = []
+    if args.wsa:
+        components.append(('calculate_weighted_simple_average', calculate_weighted_simple_average,
+                           load_callable(args.wsa), lambda values: (values, rng.randint(1, 8), rng.choice((1, 2)))))
+    if args.ema:
+        components.append(('calculate_ema', calculate_ema, load_callable(args.ema),
+                           lambda values: (values, rng.choice((3, 5, 13, 26)))))
+
+    for name, reference, alternative, make_args in components:
+        cases = [make_args([rng.uniform(0, 100) for _ in range(rng.randint(1, 120))]) for _ in range(args.fuzz)]
+        cases += [make_args([]), make_args([42.0]), make_args([50.0] * 30)]
+        mismatches = []
+        timings = {'reference': 0.0, 'engine': 0.0}
+        for case in cases:
+            started = time.perf_counter()
+            expected = reference(*case)
+            timings['reference'] += time.perf_counter() - started
+            started = time.perf_counter()
+            actual = alternative(*case)
+            timings['engine'] += time.perf_counter() - started
+            if not math.isclose(expected, actual, rel_tol=0, abs_tol=args.tolerance):
+                mismatches.append({'length': len(case[0]), 'args': list(case[1:]), 'expected': expected, 'actual': actual})
+        report['components'][name] = {'cases': len(cases), 'mismatches': len(mismatches),
+                                      'examples': mismatches[:5], **timing_summary(timings)}
+
+
+def timing_summary(timings):
+    result = {'reference_seconds': round(timings['reference'], 4)}
+    if 'engine' in timings:
+        result['engine_seconds'] = round(timings['engine'], 4)
+        if timings['engine']:
+            result['speedup'] = round(timings['reference'] / timings['engine'], 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='指標計算一致性檢查')
+    parser.add_argument('--engine', help='替代實作（module:function）')
+    parser.add_argument('--engine-api', choices=('columns', 'ohlc'), default='columns',
+                        help='替代實作的介面：columns=(opens, highs, lows, closes)，ohlc=list of dict')
+    parser.add_argument('--wsa', help='calculate_weighted_simple_average 的替代實作（module:function）')
+    parser.add_argument('--ema', help='calculate_ema 的替代實作（module:function）')
+    parser.add_argument('--fuzz', type=int, default=300, help='隨機樣本數')
+    parser.add_argument('--seed', type=int, default=2024, help='隨機樣本的亂數種子')
+    parser.add_argument('--tolerance', type=float, default=1e-6, help='數值欄位的容許誤差（0~100 刻度的絕對值）')
+    parser.add_argument('--json', help='將報告寫入 JSON 檔')
+    parser.add_argument('--update-golden', action='store_true', help='以目前的參考實作重新產生 golden 檔')
+    parser.add_argument('--golden-synthetic', type=int, default=24, help='golden 檔中的合成樣本數')
+    args = parser.parse_args()
+
+    if args.update_golden:
+        update_golden(args.golden_synthetic)
+        return
+
+    reference = calculate_pine_script_indicators_from_columns
+    engine = columns_engine(load_callable(args.engine), args.engine_api) if args.engine else None
+    report = {'golden': {}, 'engine': None, 'components': {}}
+
+    with open(GOLDEN_PATH, encoding='utf-8') as f:
+        fixtures = json.load(f)['fixtures']
+
+    # 參考實作 vs golden
+    golden_mismatches = []
+    for fixture in fixtures:
+        problems = compare_results(fixture['expected'], run_engine(reference, fixture['bars']), args.tolerance)
+        if problems:
+            golden_mismatches.append({'case': fixture['name'], 'problems': problems})
+    report['golden'] = {'cases': len(fixtures), 'mismatches': len(golden_mismatches), 'examples': golden_mismatches[:10]}
+
+    # 替代實作 vs 參考實作（固定樣本 + 隨機樣本）
+    if engine is not None:
+        cases = [(fixture['name'], fixture['bars']) for fixture in fixtures] + list(fuzz_series(args.fuzz, args.seed))
+        timings = {'reference': 0.0, 'engine': 0.0}
+        mismatches = []
+        signals = 0
+        for name, bars in cases:
+            started = time.perf_counter()
+            expected = run_engine(reference, bars)
+            timings['reference'] += time.perf_counter() - started
+            started = time.perf_counter()
+            actual = run_engine(engine, bars)
+            timings['engine'] += time.perf_counter() - started
+            if expected and expected.get('banker_entry_signal'):
+                signals += 1
+            problems = compare_results(expected, actual, args.tolerance)
+            if problems:
+                mismatches.append({'case': name, 'length': len(bars['close']), 'problems': problems})
+        report['engine'] = {
+            'engine': args.engine,
+            'cases': len(cases),
+            'reference_signals': signals,
+            'mismatches': len(mismatches),
+            'signal_mismatches': sum(1 for m in mismatches if any(p.startswith('banker_entry_signal') for p in m['problems'])),
+            'examples': mismatches[:10],
+            **timing_summary(timings)
+        }
+
+    check_components(args, report)
+
+    golden = report['golden']
+    print(f"golden：{golden['cases']} 個固定樣本，{golden['mismatches']} 個不一致")
+    for example in golden['examples']:
+        print(f"  {example['case']}: {'; '.join(example['problems'])}")
+    if report['engine']:
+        result = report['engine']
+        print(f"{result['engine']}：{result['cases']} 個樣本（參考實作 {result['reference_signals']} 個黃柱），"
+              f"{result['mismatches']} 個不一致（其中黃柱 {result['signal_mismatches']} 個）")
+        print(f"  耗時：參考 {result['reference_seconds']} 秒，替代 {result['engine_seconds']} 秒"
+              + (f"（{result['speedup']}x）" if 'speedup' in result else ''))
+        for example in result['examples']:
+            print(f"  {example['case']}（{example['length']} 天）: {'; '.join(example['problems'])}")
+    for name, result in report['components'].items():
+        print(f"{name}：{result['cases']} 個樣本，{result['mismatches']} 個不一致；"
+              f"耗時 參考 {result['reference_seconds']} 秒 / 替代 {result['engine_seconds']} 秒")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    failed = golden['mismatches'] or (report['engine'] and report['engine']['mismatches']) \
+        or any(result['mismatches'] for result in report['components'].values())
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
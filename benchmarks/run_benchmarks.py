@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+離線效能基準測試
+
+以合成資料（benchmarks/synthetic.py）量測，不需連線：
+- indicators   ：指標計算吞吐量（stocks/s）
+- snapshot     ：process_otc_stock_data 建立快照的耗時
+- screen_cold  ：篩選管線端到端耗時（解析 Yahoo 回應 → 寫入存放區 → 指標 → 組合結果）
+- screen_warm  ：歷史存放區已為最新時的篩選管線耗時
+- peak_rss     ：每個規模在獨立子行程中執行，回報峰值 RSS
+- import_app   ：子行程中 import app 的耗時（啟動成本）
+
+結果寫成 JSON（含 commit 與環境資訊），可用 --compare 與先前的結果比較。
+
+用法：
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --sizes 1000,5000 --compare benchmarks/results/old.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic import generate_universe, to_quote_item, to_yahoo_chart  # noqa: E402
+
+DEFAULT_SIZES = (1000, 5000, 20000)
+
+
+def peak_rss_bytes():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        return None
+
+
+def run_size(size, days, seed):
+    """在目前行程中執行單一規模的所有量測（由子行程呼叫）"""
+    workdir = tempfile.mkdtemp(prefix='twse-bench-')
+    os.environ['HISTORY_STORE_PATH'] = os.path.join(workdir, 'history.bin')
+    os.environ['SIGNAL_ARCHIVE_PATH'] = os.path.join(workdir, 'signal_archive.gz')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    # 基準測試不對外連線，也不需要背景健康探測
+    os.environ.setdefault('HEALTH_PROBE_INTERVAL', '0')
+
+    started = time.perf_counter()
+    import app
+    import_seconds = time.perf_counter() - started
+    from indicators import calculate_pine_script_indicators_from_columns
+
+    stocks = list(generate_universe(size, days, seed))
+    result = {'size': size, 'days': days, 'import_app': {'seconds': round(import_seconds, 4)}}
+
+    # 指標計算吞吐量
+    started = time.perf_counter()
+    for stock in stocks:
+        calculate_pine_script_indicators_from_columns(stock.open, stock.high, stock.low, stock.close)
+    elapsed = time.perf_counter() - started
+    result['indicators'] = {'seconds': round(elapsed, 4), 'stocks_per_second': round(size / elapsed, 1)}
+
+    # 快照建立
+    raw = [to_quote_item(stock) for stock in stocks]
+    started = time.perf_counter()
+    processed, current_date = app.process_otc_stock_data(raw)
+    elapsed = time.perf_counter() - started
+    result['snapshot'] = {'seconds': round(elapsed, 4), 'stocks': len(processed)}
+
+    # 篩選管線：快照包含全部股票（不經代碼過濾），Yahoo 回應於下載階段才編碼
+    by_code = {stock.code: stock for stock in stocks}
+    app.stocks_data = {item['code']: dict(item) for item in raw}
+    app.data_date = current_date or stocks[0].dates[-1]
+    app.request_yahoo_history = lambda code: to_yahoo_chart(by_code[code])
+    codes = list(by_code)
+
+    started = time.perf_counter()
+    screened = app.run_screen_pipeline(codes)
+    elapsed = time.perf_counter() - started
+    result['screen_cold'] = {'seconds': round(elapsed, 4), 'stocks': len(screened),
+                             'stocks_per_second': round(size / elapsed, 1)}
+
+    app.history_store.flush(as_of=app.data_date)
+    started = time.perf_counter()
+    screened = app.run_screen_pipeline(codes)
+    elapsed = time.perf_counter() - started
+    result['screen_warm'] = {'seconds': round(elapsed, 4), 'stocks': len(screened),
+                             'stocks_per_second': round(size / elapsed, 1)}
+
+    result['signals'] = sum(1 for stock in screened if stock.get('banker_entry_signal'))
+    result['peak_rss_bytes'] = peak_rss_bytes()
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current):
+    """列出與先前結果的耗時比較（比值 < 1 表示變快）"""
+    previous = {entry['size']: entry for entry in baseline['results']}
+    print(f"\n與 {baseline['meta'].get('commit')} 比較（目前 / 先前）：")
+    for entry in current['results']:
+        old = previous.get(entry['size'])
+        if not old:
+            continue
+        parts = []
+        for key in ('import_app', 'indicators', 'snapshot', 'screen_cold', 'screen_warm'):
+            if key in entry and key in old and old[key]['seconds']:
+                parts.append(f"{key} {entry[key]['seconds'] / old[key]['seconds']:.2f}x")
+        if entry.get('peak_rss_bytes') and old.get('peak_rss_bytes'):
+            parts.append(f"peak_rss {entry['peak_rss_bytes'] / old['peak_rss_bytes']:.2f}x")
+        print(f"  {entry['size']:>6} 支: " + ', '.join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='台股篩選器離線效能基準測試')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='股票數量（逗號分隔），預設 1000,5000,20000')
+    parser.add_argument('--days', type=int, default=62, help='每支股票的交易日數（預設 62，約 3 個月）')
+    parser.add_argument('--seed', type=int, default=42, help='亂數種子')
+    parser.add_argument('--output', default=os.path.join(BENCH_DIR, 'results'), help='結果輸出目錄')
+    parser.add_argument('--compare', help='與先前的結果 JSON 比較')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_size(args.child, args.days, args.seed)))
+        return
+
+    results = []
+    for size in (int(value) for value in args.sizes.split(',') if value.strip()):
+        print(f"執行 {size} 支股票 × {args.days} 天...", flush=True)
+        # 每個規模在獨立子行程執行，峰值 RSS 互不影響
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', str(size),
+             '--days', str(args.days), '--seed', str(args.seed)],
+            capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            sys.exit(completed.returncode)
+        entry = json.loads(completed.stdout.strip().splitlines()[-1])
+        results.append(entry)
+        print(f"  指標 {entry['indicators']['stocks_per_second']} 支/秒，"
+              f"快照 {entry['snapshot']['seconds']} 秒，"
+              f"篩選 {entry['screen_cold']['seconds']} 秒（冷）/ {entry['screen_warm']['seconds']} 秒（熱），"
+              f"峰值 RSS {(entry['peak_rss_bytes'] or 0) / 1048576:.1f} MB")
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'days': args.days,
+            'seed': args.seed,
+            'indicator_mode': os.environ.get('INDICATOR_EXECUTION_MODE', 'inline')
+        },
+        'results': results
+    }
+
+    os.makedirs(args.output, exist_ok=True)
+    filename = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{report['meta']['commit'] or 'nogit'}.json"
+    path = os.path.join(args.output, filename)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"結果已寫入 {path}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
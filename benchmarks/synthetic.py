@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成股票資料產生器
+
+以固定亂數種子產生 N 支股票 × M 個交易日的 OHLCV 資料，同樣的參數永遠
+產生同樣的資料，可在不同 commit 之間比較效能。價格為帶有個股波動度與
+趨勢的幾何隨機漫步，成交量為對數常態分布並隨價格波動放大，另有少數
+跳空與漲跌停（±10%）的交易日，盡量接近實際台股日K的分布。
+
+代碼 1000~9999 為有效的上市代碼；超過 9000 支時其餘代碼為 5 位數以上，
+會被 process_otc_stock_item 濾除（只影響快照建立，篩選與指標計算不受影響）。
+"""
+
+import json
+import math
+import random
+from array import array
+from collections import namedtuple
+from datetime import date, datetime, timedelta, timezone
+
+SyntheticStock = namedtuple('SyntheticStock', 'code name dates timestamps open high low close volume')
+
+# 2026-01-05（週一）台灣時間 09:00
+START_DATE = date(2026, 1, 5)
+TW_OFFSET = timezone(timedelta(hours=8))
+
+
+def trading_days(days, start=START_DATE):
+    """產生 days 個交易日（略過週末）"""
+    result = []
+    current = start
+    while len(result) < days:
+        if current.weekday() < 5:
+            result.append(current)
+        current += timedelta(days=1)
+    return result
+
+
+def stock_code(index):
+    """第 index 支股票的代碼：前 9000 支為 4 位數有效代碼"""
+    return str(1000 + index) if index < 9000 else str(10000 + index)
+
+
+def generate_stock(index, days=62, seed=42, calendar=None):
+    """產生單支股票的合成日K資料"""
+    rng = random.Random(seed * 1000003 + index)
+    calendar = calendar or trading_days(days)
+
+    price = math.exp(rng.uniform(math.log(10), math.log(1000)))
+    volatility = rng.uniform(0.008, 0.035)
+    drift = rng.gauss(0, 0.002)
+    base_volume = math.exp(rng.uniform(math.log(2e4), math.log(3e7)))
+
+    opens, highs, lows, closes, volumes = (array('d') for _ in range(5))
+    timestamps = []
+    for day in calendar:
+        gap = rng.gauss(0, volatility / 3) if rng.random() < 0.1 else 0.0
+        open_price = price * (1 + gap)
+        change = max(-0.1, min(0.1, drift + rng.gauss(0, volatility) + gap))
+        close_price = price * (1 + change)
+        high_price = max(open_price, close_price) * (1 + abs(rng.gauss(0, volatility / 2)))
+        low_price = min(open_price, close_price) * (1 - abs(rng.gauss(0, volatility / 2)))
+        volume = base_volume * rng.lognormvariate(0, 0.5) * (1 + 10 * abs(change))
+
+        opens.append(round(open_price, 2))
+        highs.append(round(high_price, 2))
+        lows.append(round(low_price, 2))
+        closes.append(round(close_price, 2))
+        volumes.append(float(int(volume)))
+        timestamps.append(int(datetime(day.year, day.month, day.day, 9, 0, tzinfo=TW_OFFSET).timestamp()))
+        price = close_price
+
+    code = stock_code(index)
+    return SyntheticStock(
+        code, f'合成{code}', [day.strftime('%Y-%m-%d') for day in calendar], timestamps,
+        opens, highs, lows, closes, volumes
+    )
+
+
+def generate_universe(count, days=62, seed=42):
+    """產生 count 支股票（依序產生，不一次佔用大量記憶體）"""
+    calendar = trading_days(days)
+    for index in range(count):
+        yield generate_stock(index, days, seed, calendar)
+
+
+def to_quote_item(stock):
+    """轉為 parse_yahoo_quote 的單日報價格式（最後一個交易日）"""
+    close_price = stock.close[-1]
+    previous = stock.close[-2] if len(stock.close) > 1 else close_price
+    return {
+        'code': stock.code,
+        'name': stock.name,
+        'close': close_price,
+        'open': stock.open[-1],
+        'high': stock.high[-1],
+        'low': stock.low[-1],
+        'volume': int(stock.volume[-1]),
+        'change': close_price - previous,
+        'change_percent': (close_price - previous) / previous * 100 if previous else 0,
+        'date': stock.dates[-1],
+        'market': 'TWSE'
+    }
+
+
+def to_yahoo_chart(stock):
+    """轉為 Yahoo Finance v8 chart API 的回應內容（bytes）"""
+    return json.dumps({
+        'chart': {
+            'result': [{
+                'meta': {'symbol': f'{stock.code}.TW', 'shortName': stock.name,
+                         'chartPreviousClose': stock.close[0]},
+                'timestamp': stock.timestamps,
+                'indicators': {'quote': [{
+                    'open': list(stock.open),
+                    'high': list(stock.high),
+                    'low': list(stock.low),
+                    'close': list(stock.close),
+                    'volume': [int(v) for v in stock.volume]
+                }]}
+            }],
+            'error': None
+        }
+    }).encode('utf-8')
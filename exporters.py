@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+篩選結果與歷史K線的串流匯出
+
+資料列以產生器逐筆產生，CSV 每累積 chunk_rows 列輸出一段文字，
+Parquet 每累積 row_group_rows 列寫出一個 row group 並立即輸出已寫入的位元組，
+匯出整個股票池時記憶體用量不隨資料量增加。
+
+Parquet 需要選用套件 pyarrow（pip install pyarrow）；未安裝時只提供 CSV。
+"""
+
+import csv
+import io
+from bisect import bisect_left, bisect_right
+
+from history_store import date_to_int, int_to_date
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 選用依賴
+    pa = pq = None
+
+# 欄位型別：str / float / int / bool（Parquet schema 與 CSV 欄位順序共用）
+SCREEN_EXPORT_COLUMNS = (
+    ('code', 'str'), ('name', 'str'), ('price', 'float'), ('change_percent', 'float'),
+    ('volume', 'int'), ('fund_trend', 'float'), ('multi_short_line', 'float'),
+    ('signal_status', 'str'), ('score', 'int'), ('is_crossover', 'bool'),
+    ('is_oversold', 'bool'), ('banker_entry_signal', 'bool'), ('date', 'str')
+)
+HISTORY_EXPORT_COLUMNS = (
+    ('code', 'str'), ('date', 'str'), ('open', 'float'), ('high', 'float'),
+    ('low', 'float'), ('close', 'float'), ('volume', 'int')
+)
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+class ExportUnavailable(Exception):
+    """要求的匯出格式無法使用（例如未安裝 pyarrow）"""
+
+
+def parquet_available():
+    return pq is not None
+
+
+def iter_csv(rows, columns, chunk_rows=1000):
+    """以 CSV 文字區塊串流輸出（含 UTF-8 BOM，Excel 可直接開啟中文）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    buffer.write('\ufeff')
+    writer.writerow([name for name, _ in columns])
+    pending = 0
+    for row in rows:
+        writer.writerow([row.get(name) for name, _ in columns])
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+class _ChunkSink:
+    """pyarrow 寫入目標：累積寫入的位元組，由 drain() 取出後清空"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _arrow_schema(columns):
+    types = {'str': pa.string(), 'float': pa.float64(), 'int': pa.int64(), 'bool': pa.bool_()}
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+def _coerce(value, kind):
+    """將顯示用的值轉為欄位型別；無法轉換時為 null"""
+    if value is None:
+        return None
+    try:
+        if kind == 'str':
+            return str(value)
+        if kind == 'float':
+            return float(value)
+        if kind == 'int':
+            return int(value)
+        return bool(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def iter_parquet(rows, columns, row_group_rows=50000):
+    """以 Parquet（欄式）串流輸出：每個 row group 寫完即輸出對應的位元組"""
+    if pq is None:
+        raise ExportUnavailable('Parquet 匯出需要安裝 pyarrow')
+    schema = _arrow_schema(columns)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema, compression='zstd')
+
+    def write_group(batch):
+        writer.write_table(pa.Table.from_pydict(batch, schema=schema))
+
+    batch = {name: [] for name, _ in columns}
+    pending = 0
+    try:
+        for row in rows:
+            for name, kind in columns:
+                batch[name].append(_coerce(row.get(name), kind))
+            pending += 1
+            if pending >= row_group_rows:
+                write_group(batch)
+                batch = {name: [] for name, _ in columns}
+                pending = 0
+                yield sink.drain()
+        if pending:
+            write_group(batch)
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def iter_export(rows, columns, fmt):
+    """依格式回傳串流產生器；Parquet 無法使用時立即拋出 ExportUnavailable"""
+    if fmt == 'csv':
+        return iter_csv(rows, columns)
+    if fmt == 'parquet':
+        if pq is None:
+            raise ExportUnavailable('Parquet 匯出需要安裝 pyarrow')
+        return iter_parquet(rows, columns)
+    raise ExportUnavailable(f'不支援的格式：{fmt}（可用 csv、parquet）')
+
+
+def screen_rows(stocks, codes=None, start=None, end=None, signals_only=False):
+    """篩選結果資料列（依代碼、日期與黃柱信號過濾）"""
+    for stock in stocks:
+        if codes and stock.get('code') not in codes:
+            continue
+        if signals_only and not stock.get('banker_entry_signal'):
+            continue
+        date = stock.get('date') or ''
+        if (start and date < start) or (end and date > end):
+            continue
+        yield stock
+
+
+def history_rows(store, codes=None, start=None, end=None):
+    """歷史K線資料列（每支股票每天一列），逐支讀取存放區，不一次載入全部"""
+    start_int = date_to_int(start) if start else None
+    end_int = date_to_int(end) if end else None
+    for code in (sorted(codes) if codes else store.codes()):
+        cols = store.columns(code)
+        if cols is None:
+            continue
+        # 只複製單支股票的日期範圍，存放區重新映射時不受影響
+        dates = list(cols.dates)
+        low = bisect_left(dates, start_int) if start_int else 0
+        high = bisect_right(dates, end_int) if end_int else len(dates)
+        if low >= high:
+            continue
+        opens, highs, lows, closes, volumes = (list(column[low:high]) for column in
+                                               (cols.open, cols.high, cols.low, cols.close, cols.volume))
+        for i, date in enumerate(dates[low:high]):
+            yield {
+                'code': code,
+                'date': int_to_date(date),
+                'open': opens[i],
+                'high': highs[i],
+                'low': lows[i],
+                'close': closes[i],
+                'volume': int(volumes[i])
+            }
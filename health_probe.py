@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+背景健康探測
+
+定期在背景測試各上游資料來源（Yahoo Finance、TWSE OpenAPI、TWSE RWD）的
+連線狀況，保留每個來源最近幾次的狀態與延遲。診斷端點直接回傳快取的結果，
+不再於請求執行緒中發出對外連線；需要即時結果時才強制重新探測。
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class Probe:
+    """單一探測項目：check(timeout) 回傳結果 dict（至少包含 status）"""
+
+    def __init__(self, name, check):
+        self.name = name
+        self.check = check
+
+
+class HealthProber:
+    """定期執行探測並保留滾動歷史（首次使用時才啟動背景執行緒）"""
+
+    def __init__(self, probes, interval=300, timeout=10, history=20):
+        self.probes = probes
+        self.interval = interval
+        self.timeout = timeout
+        self.history = {probe.name: deque(maxlen=history) for probe in probes}
+        self.last_probed_at = None
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+        self._thread = None
+        self._wakeup = threading.Event()
+
+    def _run_probe(self, probe):
+        started = time.perf_counter()
+        try:
+            result = probe.check(self.timeout)
+        except Exception as e:
+            result = {'status': 'error', 'error': str(e), 'error_type': type(e).__name__}
+        result['elapsed_seconds'] = round(time.perf_counter() - started, 2)
+        result['probed_at'] = time.time()
+        return result
+
+    def probe_all(self):
+        """並行執行所有探測並記錄結果（同一時間只會有一輪探測）"""
+        with self._probe_lock:
+            with ThreadPoolExecutor(max_workers=len(self.probes)) as executor:
+                results = list(executor.map(self._run_probe, self.probes))
+            with self._lock:
+                for probe, result in zip(self.probes, results):
+                    self.history[probe.name].append(result)
+                self.last_probed_at = time.time()
+        failed = [probe.name for probe, result in zip(self.probes, results) if result['status'] == 'error']
+        if failed:
+            logger.warning(f"健康探測失敗: {', '.join(failed)}")
+
+    def _loop(self):
+        while True:
+            try:
+                self.probe_all()
+            except Exception as e:
+                logger.warning(f"健康探測執行錯誤: {e}")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def ensure_started(self):
+        """啟動背景探測執行緒（interval <= 0 時不啟動，只能強制探測）"""
+        if self._thread is not None or self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='health-probe', daemon=True)
+                self._thread.start()
+                logger.info(f"背景健康探測已啟動（每 {self.interval} 秒）")
+
+    def view(self):
+        """最近一次探測結果與各來源的滾動統計"""
+        with self._lock:
+            history = {name: list(entries) for name, entries in self.history.items()}
+            last_probed_at = self.last_probed_at
+
+        tests = {}
+        sources = {}
+        for name, entries in history.items():
+            if not entries:
+                continue
+            tests[name] = dict(entries[-1])
+            latencies = sorted(entry['elapsed_seconds'] for entry in entries if entry['status'] != 'error')
+            statuses = {}
+            for entry in entries:
+                statuses[entry['status']] = statuses.get(entry['status'], 0) + 1
+            sources[name] = {
+                'samples': len(entries),
+                'statuses': statuses,
+                'error_rate': round(statuses.get('error', 0) / len(entries), 3),
+                'latency_p50': latencies[len(latencies) // 2] if latencies else None,
+                'latency_max': latencies[-1] if latencies else None,
+                'recent': [
+                    {'status': entry['status'], 'elapsed_seconds': entry['elapsed_seconds'],
+                     'probed_at': entry['probed_at']}
+                    for entry in entries
+                ]
+            }
+
+        age = round(time.time() - last_probed_at, 1) if last_probed_at else None
+        return {
+            'probed_at': last_probed_at,
+            'age_seconds': age,
+            'stale': age is None or (self.interval > 0 and age > self.interval * 2),
+            'interval_seconds': self.interval,
+            'tests': tests,
+            'history': sources
+        }
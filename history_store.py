@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+歷史K線本地存放區
+
+將每支股票最近的日K（OHLCV）存成欄式二進位檔（stocks × days × OHLCV），
+讀取端以唯讀 mmap 開啟。同一台機器上的所有行程共用作業系統的 page cache，
+指標計算直接讀取 memoryview 切片，不需逐支解析或各自保留一份複本。
+
+檔案格式（little/native endian，8 bytes 對齊）：
+    preamble  : magic(4s) + 格式版本(u32) + header 長度(u32)
+    header    : JSON（codes、counts、days、fields、as_of ...），補齊至 8 bytes
+    values    : float64[stocks][days][5]   欄位順序 open, high, low, close, volume
+    dates     : int32[stocks][days]        YYYYMMDD
+每支股票的資料靠右對齊，counts[i] 為有效筆數，前段空位填 NaN / 0。
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from collections import namedtuple
+
+MAGIC = b'TWHS'
+FORMAT_VERSION = 1
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+_PREAMBLE = struct.Struct('<4sII')
+
+HistoryColumns = namedtuple('HistoryColumns', ('dates',) + FIELDS)
+
+
+def date_to_int(date_str):
+    """'YYYY-MM-DD' 轉為 YYYYMMDD 整數"""
+    try:
+        return int(date_str.replace('-', ''))
+    except (AttributeError, ValueError):
+        return 0
+
+
+def int_to_date(value):
+    """YYYYMMDD 整數轉為 'YYYY-MM-DD'"""
+    value = int(value)
+    return f"{value // 10000:04d}-{value // 100 % 100:02d}-{value % 100:02d}"
+
+
+class HistoryStore:
+    """以 mmap 共用的歷史K線欄式存放區
+
+    寫入端（篩選流程）以 put() 暫存新抓到的歷史資料，flush() 時合併既有檔案
+    並以原子替換寫出新版本；讀取端透過 columns() 取得零複製的欄位切片。
+    其他行程只要以相同路徑建立 HistoryStore 即可讀取同一份資料。
+    """
+
+    def __init__(self, path, max_days=120):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.max_days = max_days
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._file_id = None
+        self._header = None
+        self._index = {}
+        self._values = None
+        self._dates = None
+        self._mmap = None
+        self.reload()
+
+    # ------------------------------------------------------------------
+    # 讀取
+    # ------------------------------------------------------------------
+    def reload(self):
+        """若磁碟上的檔案已被替換，重新映射最新版本"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if file_id == self._file_id:
+            return False
+
+        try:
+            with open(self.path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, header_len = _PREAMBLE.unpack_from(mm, 0)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                self.logger.warning(f"歷史資料檔格式不符，略過: {self.path}")
+                return False
+            header_start = _PREAMBLE.size
+            header = json.loads(bytes(mm[header_start:header_start + header_len]).decode('utf-8'))
+            if header.get('byteorder') != sys.byteorder:
+                self.logger.warning(f"歷史資料檔位元組順序不符，略過: {self.path}")
+                return False
+
+            stocks = len(header['codes'])
+            days = header['days']
+            values_start = header['values_offset']
+            values_len = stocks * days * len(FIELDS) * 8
+            dates_start = values_start + values_len
+            view = memoryview(mm)
+            values = view[values_start:values_start + values_len].cast('d')
+            dates = view[dates_start:dates_start + stocks * days * 4].cast('i')
+        except (OSError, ValueError, KeyError, struct.error) as e:
+            self.logger.warning(f"無法開啟歷史資料檔 {self.path}: {e}")
+            return False
+
+        with self._lock:
+            # 舊的 mmap 不主動 close：仍有切片被使用時交由 GC 在引用釋放後回收
+            self._mmap = mm
+            self._header = header
+            self._index = {code: i for i, code in enumerate(header['codes'])}
+            self._values = values
+            self._dates = dates
+            self._file_id = file_id
+        self.logger.info(f"已映射歷史資料檔：{stocks} 支股票 × {days} 天")
+        return True
+
+    def _mapped_columns(self, code):
+        i = self._index.get(code)
+        if i is None:
+            return None
+        days = self._header['days']
+        count = self._header['counts'][i]
+        if count <= 0:
+            return None
+        width = len(FIELDS)
+        row = i * days + (days - count)
+        start = row * width
+        stop = start + count * width
+        values = self._values
+        return HistoryColumns(
+            self._dates[row:row + count],
+            *(values[start + f:stop:width] for f in range(width))
+        )
+
+    def columns(self, code):
+        """取得單支股票的欄位序列（mmap 上的 memoryview 切片，不複製）"""
+        with self._lock:
+            pending = self._pending.get(code)
+            if pending is not None:
+                return pending
+            if self._header is None:
+                return None
+            return self._mapped_columns(code)
+
+    def get_ohlc(self, code):
+        """以 list of dict 形式取得歷史資料（相容舊有呼叫端，會複製）"""
+        cols = self.columns(code)
+        if cols is None:
+            return None
+        return [
+            {
+                'date': int_to_date(cols.dates[i]),
+                'open': cols.open[i],
+                'high': cols.high[i],
+                'low': cols.low[i],
+                'close': cols.close[i],
+                'volume': int(cols.volume[i])
+            }
+            for i in range(len(cols.dates))
+        ]
+
+    def last_date(self, code):
+        """最後一筆資料的日期（'YYYY-MM-DD'），無資料時回傳 None"""
+        cols = self.columns(code)
+        if cols is None or len(cols.dates) == 0:
+            return None
+        return int_to_date(cols.dates[-1])
+
+    def codes(self):
+        with self._lock:
+            mapped = set(self._index) if self._header else set()
+            return sorted(mapped | set(self._pending))
+
+    def __contains__(self, code):
+        return self.columns(code) is not None
+
+    def __len__(self):
+        return len(self.codes())
+
+    # ------------------------------------------------------------------
+    # 寫入
+    # ------------------------------------------------------------------
+    def put(self, code, ohlc_data):
+        """暫存一支股票的歷史資料（list of dict），於 flush() 時寫入檔案"""
+        ohlc_data = ohlc_data[-self.max_days:]
+        cols = HistoryColumns(
+            array('i', (date_to_int(d['date']) for d in ohlc_data)),
+            *(array('d', (float(d[field] or 0) for d in ohlc_data)) for field in FIELDS)
+        )
+        with self._lock:
+            self._pending[code] = cols
+        return cols
+
+    def refresh_last_bar(self, code, bar):
+        """以即時資料覆寫最後一筆（同一天盤中再次更新），回傳欄位資料
+
+        最後一筆與 bar 的 OHLCV 相同時直接回傳既有欄位；不同時複製一份、
+        替換最後一筆後暫存，於下次 flush() 寫入檔案。
+        """
+        cols = self.columns(code)
+        if cols is None or len(cols.dates) == 0:
+            return cols
+        values = [float(bar[field] or 0) for field in FIELDS]
+        if all(getattr(cols, field)[-1] == value for field, value in zip(FIELDS, values)):
+            return cols
+        refreshed = HistoryColumns(
+            array('i', cols.dates),
+            *(array('d', getattr(cols, field)) for field in FIELDS)
+        )
+        for field, value in zip(FIELDS, values):
+            getattr(refreshed, field)[-1] = value
+        with self._lock:
+            self._pending[code] = refreshed
+        return refreshed
+
+    @property
+    def pending_count(self):
+        return len(self._pending)
+
+    def flush(self, as_of=None):
+        """合併暫存資料與既有檔案，原子替換寫出新版本
+
+        合併前先重新映射：檔案若已被其他行程（例如排程執行的 screen_cli.py）替換，
+        以最新版本為基礎，不會以舊內容覆蓋對方寫入的資料。
+        """
+        self.reload()
+        with self._lock:
+            if not self._pending:
+                return False
+            merged = {}
+            if self._header is not None:
+                for code in self._index:
+                    merged[code] = self._mapped_columns(code)
+            merged.update(self._pending)
+            merged = {code: cols for code, cols in merged.items() if cols is not None}
+
+            codes = sorted(merged)
+            days = min(self.max_days, max((len(c.dates) for c in merged.values()), default=0))
+            width = len(FIELDS)
+            values = array('d', [float('nan')]) * (len(codes) * days * width)
+            dates = array('i', [0]) * (len(codes) * days)
+            counts = []
+            for i, code in enumerate(codes):
+                cols = merged[code]
+                count = min(days, len(cols.dates))
+                counts.append(count)
+                offset = len(cols.dates) - count
+                row = i * days + (days - count)
+                dates[row:row + count] = array('i', cols.dates[offset:])
+                for f, field in enumerate(FIELDS):
+                    start = row * width + f
+                    values[start:start + count * width:width] = array('d', getattr(cols, field)[offset:])
+
+            header = {
+                'codes': codes,
+                'counts': counts,
+                'days': days,
+                'fields': list(FIELDS),
+                'byteorder': sys.byteorder,
+                'as_of': as_of,
+                'values_offset': 0
+            }
+            header_bytes = self._encode_header(header)
+
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+                f.write(header_bytes)
+                values.tofile(f)
+                dates.tofile(f)
+            os.replace(tmp_path, self.path)
+            self._pending = {}
+            # 釋放對舊 mmap 的參照，讓 reload() 映射新檔
+            self._file_id = None
+
+        self.reload()
+        self.logger.info(f"歷史資料檔已更新：{len(codes)} 支股票 × {days} 天")
+        return True
+
+    @staticmethod
+    def _encode_header(header):
+        """編碼 header，並將 values 區段起點對齊至 8 bytes"""
+        while True:
+            raw = json.dumps(header, ensure_ascii=False).encode('utf-8')
+            end = _PREAMBLE.size + len(raw)
+            padded = end + (-end % 8)
+            if header['values_offset'] == padded:
+                return raw + b' ' * (padded - end)
+            header['values_offset'] = padded
+
+    def stats(self):
+        """存放區概況（供狀態與記憶體查詢使用）"""
+        with self._lock:
+            return {
+                'path': self.path,
+                'mapped_stocks': len(self._index) if self._header else 0,
+                'mapped_days': self._header['days'] if self._header else 0,
+                'mapped_bytes': len(self._mmap) if self._mmap is not None else 0,
+                'as_of': self._header.get('as_of') if self._header else None,
+                'pending_stocks': len(self._pending),
+                'pending_bytes': sum(col.itemsize * len(col) for cols in self._pending.values() for col in cols)
+            }
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+指標計算行程池
+
+calculate_pine_script_indicators 為純 Python 的 CPU 密集運算，在 gthread
+worker 中只能使用一個核心，且會與請求執行緒爭用 GIL。本模組將指標計算
+分批送到獨立行程執行：
+
+- 已寫入歷史存放區的股票只傳送代碼，子行程直接 mmap 讀取（零複製）
+- 尚未寫入的股票以精簡的 array('d') 欄位傳送
+- 子行程不匯入 Flask 應用，啟動成本低
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from history_store import HistoryStore
+from indicators import calculate_pine_script_indicators_from_columns
+
+logger = logging.getLogger(__name__)
+
+# 子行程中的歷史存放區（由 _init_worker 開啟）
+_worker_store = None
+
+
+def _init_worker(store_path):
+    """子行程初始化：以唯讀方式映射歷史存放區"""
+    global _worker_store
+    if store_path:
+        _worker_store = HistoryStore(store_path)
+
+
+def _compute_chunk(chunk):
+    """在子行程中計算一批股票的指標
+
+    chunk 為 [(code, columns), ...]；columns 為 None 時從存放區讀取，
+    否則為 (opens, highs, lows, closes) 四個 array。
+    """
+    if _worker_store is not None:
+        _worker_store.reload()
+
+    results = []
+    for code, columns in chunk:
+        try:
+            if columns is None:
+                cols = _worker_store.columns(code) if _worker_store is not None else None
+                if cols is None:
+                    results.append((code, None))
+                    continue
+                columns = (cols.open, cols.high, cols.low, cols.close)
+            results.append((code, calculate_pine_script_indicators_from_columns(*columns)))
+        except Exception as e:
+            logger.warning(f"子行程計算股票 {code} 指標時發生錯誤: {e}")
+            results.append((code, None))
+    return results
+
+
+def _pack_columns(history):
+    """將歷史欄位轉為可傳送的形式：mmap 切片只傳代碼，其餘轉成精簡 array"""
+    if isinstance(history.close, memoryview):
+        return None
+    return tuple(array('d', col) for col in (history.open, history.high, history.low, history.close))
+
+
+class IndicatorProcessPool:
+    """持久化的指標計算行程池（首次使用時才啟動子行程）"""
+
+    def __init__(self, workers=None, chunk_size=50, store_path=None, mp_context=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = max(1, chunk_size)
+        self.store_path = store_path
+        self.mp_context = mp_context
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # gunicorn gthread 為多執行緒行程，避免直接 fork
+                method = self.mp_context
+                if method is None:
+                    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(method),
+                    initializer=_init_worker,
+                    initargs=(self.store_path,)
+                )
+                logger.info(f"指標計算行程池已啟動（{self.workers} 個行程，{method}）")
+            return self._executor
+
+    def compute(self, histories):
+        """計算多支股票的指標
+
+        histories: {code: HistoryColumns}
+        回傳 {code: 指標結果 dict 或 None}
+        """
+        items = [(code, _pack_columns(history)) for code, history in histories.items()
+                 if history is not None and len(history.close) >= 34]
+        if not items:
+            return {}
+
+        executor = self._get_executor()
+        chunks = [items[i:i + self.chunk_size] for i in range(0, len(items), self.chunk_size)]
+        results = {}
+        for chunk_results in executor.map(_compute_chunk, chunks):
+            results.update(chunk_results)
+        return results
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pine Script 技術指標計算
+
+資金流向趨勢、多空線與黃柱信號的計算邏輯。核心函式以欄位序列
+（list、array 或 memoryview 皆可）為輸入，可直接讀取歷史K線存放區
+的唯讀 mmap 切片而不需複製。
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+def calculate_weighted_simple_average(src_values, length, weight):
+    """完全按照Pine Script邏輯實現的加權移動平均"""
+    if not src_values or length <= 0:
+        return 0
+    
+    if len(src_values) == 1:
+        return src_values[0]
+    
+    # Pine Script狀態變量
+    sum_float = 0.0
+    output = None
+    
+    # 逐步計算，維護Pine Script的狀態邏輯
+    for i, src in enumerate(src_values):
+        # Pine Script邏輯：sum_float := nz(sum_float[1]) - nz(src[length]) + src
+        if i >= length:
+            # 移除length期前的值，加入當前值
+            sum_float = sum_float - src_values[i - length] + src
+        else:
+            # 累加當前值
+            sum_float += src
+        
+        # 計算移動平均
+        if i >= length - 1:
+            moving_average = sum_float / length
+        else:
+            moving_average = None  # Pine Script中會是na
+        
+        # Pine Script邏輯：output := na(output[1]) ? moving_average : (src * weight + output[1] * (length - weight)) / length
+        if output is None:
+            # 第一次計算或moving_average為None時
+            output = moving_average if moving_average is not None else src
+        else:
+            if moving_average is not None:
+                # 標準的加權計算
+                output = (src * weight + output * (length - weight)) / length
+            else:
+                # 如果moving_average為None，保持原值
+                output = (src * weight + output * (length - weight)) / length
+    
+    return output if output is not None else (src_values[-1] if src_values else 0)
+
+def calculate_pine_script_indicators(ohlc_data):
+    """完全按照Pine Script邏輯計算技術指標"""
+    if len(ohlc_data) < 34:  # 需要足夠的歷史數據
+        return None
+    
+    # 提取OHLC數據
+    closes = [d['close'] for d in ohlc_data]
+    highs = [d['high'] for d in ohlc_data]
+    lows = [d['low'] for d in ohlc_data]
+    opens = [d['open'] for d in ohlc_data]
+    
+    return calculate_pine_script_indicators_from_columns(opens, highs, lows, closes)
+
+def calculate_pine_script_indicators_from_columns(opens, highs, lows, closes):
+    """以OHLC欄位序列計算Pine Script技術指標（可直接傳入 memoryview 切片）"""
+    if len(closes) < 34:  # 需要足夠的歷史數據
+        return None
+    
+    # 計算典型價格 (2 * close + high + low + open) / 5
+    typical_prices = [(2 * c + h + l + o) / 5 for c, h, l, o in zip(closes, highs, lows, opens)]
+    
+    # 計算資金流向趨勢（完全按照Pine Script公式）
+    fund_flow_values = []
+    
+    for i in range(len(closes)):
+        # 計算27期最高最低價
+        start_idx = max(0, i - 26)
+        lowest_27 = min(lows[start_idx:i+1])
+        highest_27 = max(highs[start_idx:i+1])
+        
+        if highest_27 != lowest_27:
+            # 計算相對位置
+            relative_pos = (closes[i] - lowest_27) / (highest_27 - lowest_27) * 100
+            
+            # 收集足夠的相對位置數據用於加權平均
+            relative_positions = []
+            for j in range(max(0, i - 4), i + 1):
+                start_j = max(0, j - 26)
+                low_27_j = min(lows[start_j:j+1])
+                high_27_j = max(highs[start_j:j+1])
+                if high_27_j != low_27_j:
+                    rel_pos_j = (closes[j] - low_27_j) / (high_27_j - low_27_j) * 100
+                else:
+                    rel_pos_j = 50
+                relative_positions.append(rel_pos_j)
+            
+            # 第一層加權簡單平均（5期，權重1）
+            wsa1 = calculate_weighted_simple_average(relative_positions, min(5, len(relative_positions)), 1)
+            
+            # 第二層加權簡單平均（3期，權重1）
+            if i >= 2:
+                # 收集前面的wsa1值
+                wsa1_values = []
+                for k in range(max(0, i - 2), i + 1):
+                    # 重新計算每個時點的wsa1
+                    rel_pos_k = []
+                    for j in range(max(0, k - 4), k + 1):
+                        start_j = max(0, j - 26)
+                        low_27_j = min(lows[start_j:j+1])
+                        high_27_j = max(highs[start_j:j+1])
+                        if high_27_j != low_27_j:
+                            rel_pos_j = (closes[j] - low_27_j) / (high_27_j - low_27_j) * 100
+                        else:
+                            rel_pos_j = 50
+                        rel_pos_k.append(rel_pos_j)
+                    
+                    wsa1_k = calculate_weighted_simple_average(rel_pos_k, min(5, len(rel_pos_k)), 1)
+                    wsa1_values.append(wsa1_k)
+                
+                wsa2 = calculate_weighted_simple_average(wsa1_values, min(3, len(wsa1_values)), 1)
+            else:
+                wsa2 = wsa1
+            
+            # 最終公式：(3 * wsa1 - 2 * wsa2 - 50) * 1.032 + 50
+            fund_flow = (3 * wsa1 - 2 * wsa2 - 50) * 1.032 + 50
+        else:
+            fund_flow = 50
+        
+        fund_flow_values.append(max(0, min(100, fund_flow)))
+    
+    # 計算多空線（13期EMA）
+    # 先計算標準化的典型價格
+    bull_bear_values = []
+    for i in range(len(typical_prices)):
+        # 計算34期最高最低價
+        start_idx = max(0, i - 33)
+        lowest_34 = min(lows[start_idx:i+1])
+        highest_34 = max(highs[start_idx:i+1])
+        
+        if highest_34 != lowest_34:
+            normalized_price = (typical_prices[i] - lowest_34) / (highest_34 - lowest_34) * 100
+        else:
+            normalized_price = 50
+        bull_bear_values.append(max(0, min(100, normalized_price)))
+    
+    # 計算13期EMA
+    bull_bear_line_values = []
+    for i in range(len(bull_bear_values)):
+        if i < 13:
+            ema_value = sum(bull_bear_values[:i+1]) / (i+1)
+        else:
+            ema_value = calculate_ema(bull_bear_values[:i+1], 13)
+        bull_bear_line_values.append(ema_value)
+    
+    # 檢查當日和前一日的黃柱信號
+    current_day_signal = False
+    previous_day_signal = False
+    
+    if len(fund_flow_values) >= 2 and len(bull_bear_line_values) >= 2:
+        # 檢查當日黃柱
+        current_fund = fund_flow_values[-1]
+        previous_fund = fund_flow_values[-2]
+        current_bull_bear = bull_bear_line_values[-1]
+        previous_bull_bear = bull_bear_line_values[-2]
+        
+        # Pine Script crossover邏輯：ta.crossover(fund_flow_trend, bull_bear_line)
+        is_crossover_today = (current_fund > current_bull_bear) and (previous_fund <= previous_bull_bear)
+        is_oversold_today = current_bull_bear < 25
+        current_day_signal = is_crossover_today and is_oversold_today
+        
+        # 檢查前一日黃柱
+        if len(fund_flow_values) >= 3 and len(bull_bear_line_values) >= 3:
+            prev_fund = fund_flow_values[-2]
+            prev_prev_fund = fund_flow_values[-3]
+            prev_bull_bear = bull_bear_line_values[-2]
+            prev_prev_bull_bear = bull_bear_line_values[-3]
+            
+            is_crossover_yesterday = (prev_fund > prev_bull_bear) and (prev_prev_fund <= prev_prev_bull_bear)
+            is_oversold_yesterday = prev_bull_bear < 25
+            previous_day_signal = is_crossover_yesterday and is_oversold_yesterday
+        
+        # 黃柱信號：當日或前一日出現
+        banker_entry_signal = current_day_signal or previous_day_signal
+        
+        # 記錄詳細計算結果用於調試（僅記錄符合條件的股票）
+        if banker_entry_signal and logger.isEnabledFor(logging.DEBUG):
+            previous = ''
+            if len(fund_flow_values) >= 3:
+                previous = f"；前日: 資金流向={prev_fund:.2f}, 多空線={prev_bull_bear:.2f}, crossover={is_crossover_yesterday}, 超賣={is_oversold_yesterday}, 黃柱={previous_day_signal}"
+            logger.debug(f"🟡 發現黃柱信號 — 當日: 資金流向={current_fund:.2f}, 多空線={current_bull_bear:.2f}, crossover={is_crossover_today}, 超賣={is_oversold_today}, 黃柱={current_day_signal}{previous}")
+        
+        return {
+            'fund_trend': current_fund,
+            'multi_short_line': current_bull_bear,
+            'banker_entry_signal': banker_entry_signal,
+            'is_crossover': (is_crossover_today if current_day_signal else is_crossover_yesterday),
+            'is_oversold': (is_oversold_today if current_day_signal else is_oversold_yesterday),
+            'fund_trend_previous': previous_fund if len(fund_flow_values) >= 2 else current_fund,
+            'multi_short_line_previous': previous_bull_bear if len(bull_bear_line_values) >= 2 else current_bull_bear
+        }
+    
+    return None
+
+def calculate_ema(values, period):
+    """計算指數移動平均"""
+    if len(values) < period:
+        return sum(values) / len(values) if values else 0
+    
+    multiplier = 2 / (period + 1)
+    ema = sum(values[:period]) / period  # 初始SMA
+    
+    for value in values[period:]:
+        ema = (value * multiplier) + (ema * (1 - multiplier))
+    
+    return ema
+
+def classify_signal(result):
+    """依嚴格的Pine Script條件判斷狀態與評分，回傳 (signal_status, score)"""
+    if result['banker_entry_signal']:
+        return "🟡 黃柱信號", 100
+    if result['is_crossover'] and not result['is_oversold']:
+        return "突破但非超賣", 75
+    if result['is_oversold'] and not result['is_crossover']:
+        return "超賣但未突破", 65
+    if result['fund_trend'] > result['multi_short_line']:
+        return "資金流向強勢", 55
+    return "資金流向弱勢", 30
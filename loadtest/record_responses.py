@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+錄製 Yahoo Finance / TWSE 的真實回應，供 standin_server.py 回放
+
+錄製檔案結構：
+    <輸出目錄>/chart/<代碼>.TW_<range>.json
+    <輸出目錄>/twse_openapi_STOCK_DAY_ALL.json
+    <輸出目錄>/twse_rwd_STOCK_DAY_ALL.json
+
+用法：
+    python loadtest/record_responses.py --codes 2330,2317,2454 --output loadtest/recordings
+"""
+
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+
+def save(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def record(url, path, params=None):
+    try:
+        response = requests.get(url, headers=HEADERS, params=params, timeout=20, verify=False)
+    except requests.exceptions.RequestException as e:
+        print(f"  失敗 {url}: {e}")
+        return False
+    if response.status_code != 200 or 'text/html' in response.headers.get('Content-Type', ''):
+        print(f"  略過 {url}: HTTP {response.status_code} {response.headers.get('Content-Type', '')}")
+        return False
+    save(path, response.content)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='錄製上游回應供替身伺服器回放')
+    parser.add_argument('--codes', default='2330,2317,2454,2412,2882', help='要錄製的股票代碼（逗號分隔）')
+    parser.add_argument('--ranges', default='2d,3mo', help='Yahoo chart 的 range（逗號分隔）')
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recordings'))
+    parser.add_argument('--yahoo-base-url', default='https://query1.finance.yahoo.com')
+    parser.add_argument('--skip-twse', action='store_true', help='不錄製 TWSE 股票清單')
+    args = parser.parse_args()
+
+    import urllib3
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    codes = [code.strip() for code in args.codes.split(',') if code.strip()]
+    ranges = [value.strip() for value in args.ranges.split(',') if value.strip()]
+    jobs = [
+        (f'{args.yahoo_base_url}/v8/finance/chart/{code}.TW',
+         os.path.join(args.output, 'chart', f'{code}.TW_{range_}.json'),
+         {'range': range_, 'interval': '1d'})
+        for code in codes for range_ in ranges
+    ]
+    if not args.skip_twse:
+        jobs.append(('https://openapi.twse.com.tw/v1/exchangeReport/STOCK_DAY_ALL',
+                     os.path.join(args.output, 'twse_openapi_STOCK_DAY_ALL.json'), None))
+        jobs.append(('https://www.twse.com.tw/rwd/zh/afterTrading/STOCK_DAY_ALL',
+                     os.path.join(args.output, 'twse_rwd_STOCK_DAY_ALL.json'), {'response': 'json'}))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        saved = sum(executor.map(lambda job: record(*job), jobs))
+    print(f"已錄製 {saved}/{len(jobs)} 個回應至 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
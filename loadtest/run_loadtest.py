@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+API 負載測試
+
+以正式的 gunicorn.conf.py（workers=1、gthread threads=4）啟動應用程式，
+上游改連本地替身伺服器（standin_server.py），再以多個客戶端送出混合請求，
+量測各路由在不同情境下的延遲百分位數與吞吐量：
+
+- baseline：只有互動請求（/api/health、/api/stocks、/api/update_status）
+- update  ：更新持續進行中（結束後立即再觸發）同時送出互動請求
+- screen  ：持續有一個客戶端執行 /api/screen，同時送出互動請求
+- mixed   ：更新與篩選同時進行
+
+用法：
+    python loadtest/run_loadtest.py --clients 8 --duration 20 --stocks 1000 --latency-ms 50
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+LOADTEST_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(LOADTEST_DIR)
+sys.path.insert(0, LOADTEST_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from standin_server import StandinConfig, make_server  # noqa: E402
+
+DEFAULT_MIX = 'health=5,stocks=4,update_status=1'
+ROUTES = {
+    'health': '/api/health',
+    'stocks': '/api/stocks',
+    'update_status': '/api/update_status',
+    'diagnose': '/api/diagnose',
+    'metrics': '/api/metrics'
+}
+PHASES = ('baseline', 'update', 'screen', 'mixed')
+
+
+def parse_mix(value):
+    mix = []
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ROUTES:
+            raise SystemExit(f"未知的路由 {name}，可用：{', '.join(ROUTES)}")
+        mix.append((ROUTES[name], float(weight or 1)))
+    return mix
+
+
+def percentile(samples, p):
+    if not samples:
+        return None
+    # nearest-rank 百分位數
+    index = min(len(samples) - 1, max(0, math.ceil(p / 100 * len(samples)) - 1))
+    return round(samples[index] * 1000, 1)
+
+
+class Recorder:
+    """收集各路由的延遲樣本"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def add(self, route, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def summary(self, elapsed):
+        result = {}
+        with self._lock:
+            for route, samples in sorted(self.samples.items()):
+                ordered = sorted(samples)
+                result[route] = {
+                    'requests': len(ordered),
+                    'errors': self.errors.get(route, 0),
+                    'throughput_rps': round(len(ordered) / elapsed, 2) if elapsed else None,
+                    'p50_ms': percentile(ordered, 50),
+                    'p95_ms': percentile(ordered, 95),
+                    'p99_ms': percentile(ordered, 99),
+                    'max_ms': round(ordered[-1] * 1000, 1)
+                }
+        return result
+
+
+def timed_request(session, method, url, recorder, route, **kwargs):
+    started = time.perf_counter()
+    try:
+        response = session.request(method, url, **kwargs)
+        ok = response.status_code < 500
+    except requests.exceptions.RequestException:
+        response = None
+        ok = False
+    recorder.add(route, time.perf_counter() - started, ok)
+    return response
+
+
+def interactive_client(base_url, mix, recorder, stop, seed):
+    rng = random.Random(seed)
+    routes = [route for route, _ in mix]
+    weights = [weight for _, weight in mix]
+    with requests.Session() as session:
+        while not stop.is_set():
+            route = rng.choices(routes, weights)[0]
+            timed_request(session, 'GET', base_url + route, recorder, route, timeout=120)
+
+
+def update_driver(base_url, recorder, stop):
+    """持續讓更新保持進行中：未執行時立即再觸發"""
+    with requests.Session() as session:
+        while not stop.is_set():
+            try:
+                running = session.get(base_url + '/api/update_status', timeout=30).json().get('is_running')
+            except (requests.exceptions.RequestException, ValueError):
+                running = True
+            if not running:
+                timed_request(session, 'POST', base_url + '/api/update', recorder, '/api/update', json={}, timeout=60)
+            stop.wait(0.5)
+
+
+def screen_driver(base_url, recorder, stop):
+    """連續執行篩選（每次都是完整的篩選請求）"""
+    with requests.Session() as session:
+        while not stop.is_set():
+            timed_request(session, 'POST', base_url + '/api/screen', recorder, '/api/screen', json={}, timeout=600)
+
+
+def wait_for_update(base_url, timeout=600):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = requests.get(base_url + '/api/update_status', timeout=30).json()
+        if not status.get('is_running'):
+            return status
+        time.sleep(0.5)
+    raise SystemExit('等待更新完成逾時')
+
+
+def run_phase(name, base_url, mix, clients, duration, seed):
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=interactive_client, args=(base_url, mix, recorder, stop, seed + i), daemon=True)
+        for i in range(clients)
+    ]
+    if name in ('update', 'mixed'):
+        threads.append(threading.Thread(target=update_driver, args=(base_url, recorder, stop), daemon=True))
+    if name in ('screen', 'mixed'):
+        threads.append(threading.Thread(target=screen_driver, args=(base_url, recorder, stop), daemon=True))
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    # 進行中的篩選會讓實際時間超過 duration，吞吐量以實際時間計算
+    return {'elapsed_seconds': round(elapsed, 2), 'routes': recorder.summary(elapsed)}
+
+
+def seed_universe(standin_url, path):
+    """以替身伺服器的股票清單預先寫入股票清單快取，初始更新不必等背景取得清單"""
+    from stock_universe import FORMAT_VERSION
+    items = requests.get(standin_url + '/v1/exchangeReport/STOCK_DAY_ALL', timeout=30).json()
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'version': FORMAT_VERSION, 'source': 'standin', 'fetched_at': time.time(),
+                   'stocks': {item['Code']: item['Name'] for item in items}, 'changes': []}, f, ensure_ascii=False)
+
+
+def start_app(port, standin_url, workdir, log_path):
+    env = dict(os.environ)
+    universe_path = os.path.join(workdir, 'stock_universe.json')
+    seed_universe(standin_url, universe_path)
+    env.update({
+        'YAHOO_BASE_URL': standin_url,
+        'TWSE_OPENAPI_BASE_URL': standin_url,
+        'TWSE_BASE_URL': standin_url,
+        'HISTORY_STORE_PATH': os.path.join(workdir, 'history.bin'),
+        'STOCK_UNIVERSE_PATH': universe_path,
+        # 磁碟快取與封存一律放在暫存目錄，避免替身資料寫入正式的 data/
+        'SIGNAL_ARCHIVE_PATH': os.path.join(workdir, 'signal_archive.gz'),
+        'ISIN_CACHE_PATH': os.path.join(workdir, 'isin_universe.json'),
+        'HEALTH_PROBE_INTERVAL': env.get('HEALTH_PROBE_INTERVAL', '30')
+    })
+    log_file = open(log_path, 'w', encoding='utf-8')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}', 'app:app'],
+        cwd=ROOT_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'gunicorn 啟動失敗，請查看 {log_path}')
+        try:
+            if requests.get(base_url + '/api/health', timeout=2).status_code == 200:
+                return process, base_url
+        except requests.exceptions.RequestException:
+            time.sleep(0.3)
+    process.terminate()
+    raise SystemExit('等待 gunicorn 啟動逾時')
+
+
+def print_report(report):
+    for phase, result in report['phases'].items():
+        print(f"\n[{phase}] {result['elapsed_seconds']} 秒")
+        print(f"  {'路由':<22}{'請求':>7}{'錯誤':>6}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+        for route, stats in result['routes'].items():
+            print(f"  {route:<22}{stats['requests']:>7}{stats['errors']:>6}{stats['throughput_rps']:>9}"
+                  f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}{stats['max_ms']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='台股篩選器 API 負載測試（gunicorn + 本地替身伺服器）')
+    parser.add_argument('--clients', type=int, default=8, help='互動請求的並行客戶端數')
+    parser.add_argument('--duration', type=float, default=20, help='每個情境的持續秒數')
+    parser.add_argument('--phases', default=','.join(PHASES), help=f"要執行的情境（{','.join(PHASES)}）")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'互動請求的路由權重（預設 {DEFAULT_MIX}）')
+    parser.add_argument('--port', type=int, default=5055, help='gunicorn 監聽埠')
+    parser.add_argument('--standin-port', type=int, default=8765, help='內建替身伺服器監聽埠')
+    parser.add_argument('--standin-url', help='改用已啟動的替身伺服器（不啟動內建替身）')
+    parser.add_argument('--stocks', type=int, default=1000, help='替身伺服器的合成股票數量')
+    parser.add_argument('--latency-ms', type=float, default=50, help='替身伺服器平均延遲（毫秒）')
+    parser.add_argument('--jitter-ms', type=float, default=25, help='替身伺服器延遲變動範圍（±毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='替身伺服器 503 比例')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='替身伺服器 429 比例')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=os.path.join(LOADTEST_DIR, 'results'), help='結果輸出目錄')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    phases = [phase.strip() for phase in args.phases.split(',') if phase.strip()]
+    for phase in phases:
+        if phase not in PHASES:
+            raise SystemExit(f"未知的情境 {phase}")
+
+    standin = None
+    standin_url = args.standin_url
+    if not standin_url:
+        config = StandinConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                               rate_limit_rate=args.rate_limit_rate, stocks=min(args.stocks, 9000), seed=args.seed)
+        standin = make_server('127.0.0.1', args.standin_port, config)
+        threading.Thread(target=standin.serve_forever, name='standin', daemon=True).start()
+        standin_url = f'http://127.0.0.1:{args.standin_port}'
+
+    os.makedirs(args.output, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    workdir = tempfile.mkdtemp(prefix='twse-loadtest-')
+    log_path = os.path.join(args.output, f'{stamp}-gunicorn.log')
+    process, base_url = start_app(args.port, standin_url, workdir, log_path)
+
+    try:
+        # 先完成一次更新，讓 /api/stocks 與 /api/screen 有資料
+        print('初始更新中...', flush=True)
+        requests.post(base_url + '/api/update', json={}, timeout=60)
+        initial = wait_for_update(base_url)
+        print(f"  {initial.get('message')}")
+
+        report = {
+            'meta': {
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'clients': args.clients,
+                'duration': args.duration,
+                'mix': args.mix,
+                'stocks': args.stocks,
+                'standin_latency_ms': args.latency_ms,
+                'standin_error_rate': args.error_rate,
+                'standin_rate_limit_rate': args.rate_limit_rate,
+                'gunicorn_conf': 'gunicorn.conf.py'
+            },
+            'phases': {}
+        }
+        for phase in phases:
+            print(f'執行情境 {phase}（{args.duration} 秒，{args.clients} 個客戶端）...', flush=True)
+            report['phases'][phase] = run_phase(phase, base_url, mix, args.clients, args.duration, args.seed)
+            # 讓背景更新結束，避免影響下一個情境
+            wait_for_update(base_url)
+        if standin is not None:
+            report['standin'] = dict(standin.RequestHandlerClass.config.stats)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        if standin is not None:
+            standin.shutdown()
+
+    print_report(report)
+    path = os.path.join(args.output, f'{stamp}.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n結果已寫入 {path}（gunicorn 日誌：{log_path}）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Yahoo Finance / TWSE 本地替身伺服器
+
+提供與上游相同路徑的 API，讓更新與篩選可以離線、可重現地做負載測試：
+
+- GET /v8/finance/chart/<代碼>.TW?range=2d|3mo|1d   Yahoo Finance chart
+- GET /v1/exchangeReport/STOCK_DAY_ALL               TWSE OpenAPI 股票清單
+- GET /rwd/zh/afterTrading/STOCK_DAY_ALL             TWSE RWD 股票清單
+
+回應優先使用 --recordings 目錄中錄製的真實回應（見 record_responses.py），
+沒有錄製檔時以 benchmarks/synthetic.py 產生固定的合成資料。可注入延遲、
+5xx 錯誤與 429 限流；執行中可用 POST /_standin/config 調整，
+GET /_standin/stats 查看各類回應的次數。
+
+用法：
+    python loadtest/standin_server.py --port 8765 --latency-ms 80 --error-rate 0.02 --rate-limit-rate 0.01
+
+    YAHOO_BASE_URL=http://127.0.0.1:8765 \\
+    TWSE_OPENAPI_BASE_URL=http://127.0.0.1:8765 \\
+    TWSE_BASE_URL=http://127.0.0.1:8765 \\
+    gunicorn -c gunicorn.conf.py app:app
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.synthetic import generate_stock, stock_code, to_quote_item, to_yahoo_chart  # noqa: E402
+
+logger = logging.getLogger('standin')
+
+# Yahoo chart range 對應的交易日數
+RANGE_DAYS = {'1d': 1, '2d': 2, '5d': 5, '1mo': 22, '3mo': 62, '6mo': 124}
+HISTORY_DAYS = 124
+
+
+class StandinConfig:
+    """可於執行中調整的故障注入設定"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=1, stocks=1000, seed=42, recordings=None, strict=False):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.stocks = stocks
+        self.seed = seed
+        self.recordings = recordings
+        self.strict = strict
+        self.stats = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def update(self, values):
+        with self._lock:
+            for key in ('latency_ms', 'jitter_ms', 'error_rate', 'rate_limit_rate', 'retry_after'):
+                if key in values:
+                    setattr(self, key, float(values[key]))
+            if 'seed' in values:
+                self._random.seed(int(values['seed']))
+
+    def as_dict(self):
+        return {
+            'latency_ms': self.latency_ms,
+            'jitter_ms': self.jitter_ms,
+            'error_rate': self.error_rate,
+            'rate_limit_rate': self.rate_limit_rate,
+            'retry_after': self.retry_after,
+            'stocks': self.stocks,
+            'recordings': self.recordings,
+            'strict': self.strict
+        }
+
+    def roll(self):
+        """決定本次請求的延遲與故障類型（以固定種子，可重現）"""
+        with self._lock:
+            delay = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            draw = self._random.random()
+            if draw < self.rate_limit_rate:
+                fault = 'rate_limited'
+            elif draw < self.rate_limit_rate + self.error_rate:
+                fault = 'server_error'
+            else:
+                fault = None
+        return delay, fault
+
+    def count(self, kind):
+        with self._lock:
+            self.stats[kind] = self.stats.get(kind, 0) + 1
+
+
+def load_recording(config, *parts):
+    """讀取錄製的回應；沒有時回傳 None"""
+    if not config.recordings:
+        return None
+    path = os.path.join(config.recordings, *parts)
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+@lru_cache(maxsize=None)
+def synthetic_stock(code, seed):
+    index = int(code) - 1000 if len(code) == 4 else int(code) - 10000
+    return generate_stock(index, HISTORY_DAYS, seed)
+
+
+@lru_cache(maxsize=50000)
+def synthetic_chart(code, days, seed):
+    stock = synthetic_stock(code, seed)
+    return to_yahoo_chart(stock._replace(
+        dates=stock.dates[-days:], timestamps=stock.timestamps[-days:],
+        open=stock.open[-days:], high=stock.high[-days:], low=stock.low[-days:],
+        close=stock.close[-days:], volume=stock.volume[-days:]
+    ))
+
+
+@lru_cache(maxsize=4)
+def synthetic_stock_day_all(stocks, seed, fmt):
+    items = [to_quote_item(synthetic_stock(stock_code(i), seed)) for i in range(stocks)]
+    if fmt == 'openapi':
+        return json.dumps([
+            {'Code': item['code'], 'Name': item['name'], 'TradeVolume': str(item['volume']),
+             'OpeningPrice': f"{item['open']:.2f}", 'HighestPrice': f"{item['high']:.2f}",
+             'LowestPrice': f"{item['low']:.2f}", 'ClosingPrice': f"{item['close']:.2f}",
+             'Change': f"{item['change']:.2f}"}
+            for item in items
+        ], ensure_ascii=False).encode('utf-8')
+    return json.dumps({
+        'stat': 'OK',
+        'date': items[0]['date'].replace('-', '') if items else '',
+        'fields': ['證券代號', '證券名稱', '成交股數', '開盤價', '最高價', '最低價', '收盤價', '漲跌價差'],
+        'data': [[item['code'], item['name'], f"{item['volume']:,}", f"{item['open']:.2f}",
+                  f"{item['high']:.2f}", f"{item['low']:.2f}", f"{item['close']:.2f}",
+                  f"{item['change']:.2f}"] for item in items]
+    }, ensure_ascii=False).encode('utf-8')
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    config = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send(self, status, body, content_type='application/json', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/_standin/config':
+            self._send_json(404, {'error': 'not found'})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            self.config.update(json.loads(self.rfile.read(length) or b'{}'))
+        except (ValueError, TypeError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        self._send_json(200, self.config.as_dict())
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        path = parsed.path
+        config = self.config
+
+        if path == '/_standin/stats':
+            self._send_json(200, {'config': config.as_dict(), 'responses': dict(config.stats)})
+            return
+
+        body = self._resolve(path, parse_qs(parsed.query))
+        if body is None:
+            config.count('not_found')
+            self._send_json(404, {'chart': {'result': None, 'error': {'code': 'Not Found'}}})
+            return
+
+        delay, fault = config.roll()
+        if delay:
+            time.sleep(delay)
+        if fault == 'rate_limited':
+            config.count('rate_limited')
+            self._send(429, b'Too Many Requests', 'text/plain',
+                       {'Retry-After': str(int(config.retry_after))})
+        elif fault == 'server_error':
+            config.count('server_error')
+            self._send(503, b'Service Unavailable', 'text/plain')
+        else:
+            config.count('ok')
+            self._send(200, body)
+
+    def _resolve(self, path, query):
+        config = self.config
+        if path.startswith('/v8/finance/chart/'):
+            symbol = path.rsplit('/', 1)[-1]
+            code = symbol.split('.')[0]
+            range_ = query.get('range', ['3mo'])[0]
+            recorded = load_recording(config, 'chart', f'{symbol}_{range_}.json')
+            if recorded is not None or config.strict:
+                return recorded
+            if not code.isdigit() or not 1000 <= int(code) < 1000 + config.stocks:
+                return None
+            return synthetic_chart(code, RANGE_DAYS.get(range_, 62), config.seed)
+
+        if path == '/v1/exchangeReport/STOCK_DAY_ALL':
+            recorded = load_recording(config, 'twse_openapi_STOCK_DAY_ALL.json')
+            if recorded is not None or config.strict:
+                return recorded
+            return synthetic_stock_day_all(config.stocks, config.seed, 'openapi')
+
+        if path == '/rwd/zh/afterTrading/STOCK_DAY_ALL':
+            recorded = load_recording(config, 'twse_rwd_STOCK_DAY_ALL.json')
+            if recorded is not None or config.strict:
+                return recorded
+            return synthetic_stock_day_all(config.stocks, config.seed, 'rwd')
+        return None
+
+
+def make_server(host='127.0.0.1', port=8765, config=None):
+    """建立替身伺服器（尚未開始服務），可於測試程式中在背景執行緒啟動"""
+    handler = type('ConfiguredStandinHandler', (StandinHandler,), {'config': config or StandinConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Yahoo Finance / TWSE 本地替身伺服器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--stocks', type=int, default=1000, help='合成股票數量（最多 9000）')
+    parser.add_argument('--seed', type=int, default=42, help='合成資料與故障注入的亂數種子')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='每次回應的平均延遲（毫秒）')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='延遲的隨機變動範圍（±毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='回傳 503 的比例（0~1）')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='回傳 429 的比例（0~1）')
+    parser.add_argument('--retry-after', type=int, default=1, help='429 回應的 Retry-After 秒數')
+    parser.add_argument('--recordings', help='錄製回應的目錄（record_responses.py 產生）')
+    parser.add_argument('--strict', action='store_true', help='只回放錄製的回應，沒有錄製檔時回傳 404')
+    parser.add_argument('--verbose', action='store_true', help='輸出每筆請求')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    config = StandinConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+        stocks=min(args.stocks, 9000), seed=args.seed, recordings=args.recordings, strict=args.strict
+    )
+    server = make_server(args.host, args.port, config)
+    logger.info(f"替身伺服器啟動於 http://{args.host}:{args.port}（{config.stocks} 支合成股票）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日誌工具
+
+- configure_logging()：根 logger 改用 QueueHandler，實際輸出由背景的
+  QueueListener 執行緒負責，請求與管線執行緒不再等待 stdout 寫入
+- LogSampler：逐股層級的 DEBUG 日誌每 N 筆只輸出 1 筆，未啟用 DEBUG 時不做任何格式化
+- RunSummary：一次更新或篩選的結構化摘要（數量、依原因分類的失敗數、各階段耗時），
+  執行結束時以單筆日誌輸出
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+
+def configure_logging(level=logging.INFO, fmt=LOG_FORMAT):
+    """設定非同步日誌輸出（重複呼叫時只調整層級）"""
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None:
+        return _listener
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(fmt))
+    log_queue = queue.SimpleQueue()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    # 結束時清空佇列，避免遺失最後的日誌
+    atexit.register(_listener.stop)
+    return _listener
+
+
+class LogSampler:
+    """每 every 筆輸出一筆 DEBUG 日誌（第一筆一定輸出）"""
+
+    def __init__(self, logger, every=100):
+        self.logger = logger
+        self.every = max(1, every)
+        self._counter = itertools.count()
+
+    def debug(self, msg, *args):
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        # itertools.count 的 next() 在 GIL 下為原子操作
+        if next(self._counter) % self.every == 0:
+            self.logger.debug(msg + f'（每 {self.every} 筆取樣 1 筆）', *args)
+
+
+class RunSummary:
+    """一次執行的結構化摘要（可由多個管線執行緒同時更新）"""
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = {}
+        self.failures = {}
+        self.timings = {}
+        self.fields = {}
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + n
+
+    def fail(self, reason, n=1):
+        with self._lock:
+            self.failures[reason] = self.failures.get(reason, 0) + n
+
+    def timing(self, key, seconds):
+        with self._lock:
+            self.timings[key] = round(seconds, 3)
+
+    def set(self, **fields):
+        with self._lock:
+            self.fields.update(fields)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'run': self.name,
+                'elapsed_seconds': round(time.perf_counter() - self._started, 3),
+                'counts': dict(self.counts),
+                'failures': dict(self.failures),
+                'timings': dict(self.timings),
+                **self.fields
+            }
+
+    def emit(self, logger, level=logging.INFO):
+        """以單筆日誌輸出摘要（JSON 內容同時放在 record.run_summary 供結構化處理），並回傳摘要 dict"""
+        summary = self.as_dict()
+        logger.log(level, f"{self.name} 執行摘要: {json.dumps(summary, ensure_ascii=False)}",
+                   extra={'run_summary': summary})
+        return summary
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+記憶體用量統計
+
+- deep_sizeof()：估算容器物件（dict / list / set ...）含內容的總大小
+- process_memory()：目前行程的 RSS 與峰值 RSS
+- MemoryTracker：以 tracemalloc 在兩個時間點（例如更新前後）之間比較配置差異
+
+tracemalloc 會讓每次配置都變慢，預設不啟用；由管理端點開啟後，
+mark() 才會實際記錄快照，未啟用時 mark() 只檢查一個旗標。
+"""
+
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+
+def deep_sizeof(obj, max_objects=2000000):
+    """估算物件及其內容的記憶體大小（bytes），共用的物件只計算一次"""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack and len(seen) < max_objects:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, dict):
+            # 先複製一份，避免背景執行緒同時修改造成迭代錯誤
+            for key, value in list(current.items()):
+                stack.append(key)
+                stack.append(value)
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(list(current))
+        elif hasattr(current, '__dict__') and not isinstance(current, type):
+            stack.append(current.__dict__)
+    return total
+
+
+def process_memory():
+    """目前行程的常駐記憶體（Linux 讀取 /proc，其他平台退回 resource 模組）"""
+    result = {'rss_bytes': None, 'peak_rss_bytes': None}
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    result['rss_bytes'] = int(line.split()[1]) * 1024
+                elif line.startswith('VmHWM:'):
+                    result['peak_rss_bytes'] = int(line.split()[1]) * 1024
+    except OSError:
+        try:
+            import resource
+            # Linux 單位為 KB，macOS 為 bytes
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            result['peak_rss_bytes'] = peak if sys.platform == 'darwin' else peak * 1024
+        except ImportError:
+            pass
+    return result
+
+
+class MemoryTracker:
+    """tracemalloc 快照管理：記錄具名時間點並比較兩點之間的配置差異"""
+
+    def __init__(self, keep=10):
+        self.keep = keep
+        self.snapshots = {}
+        self._lock = threading.Lock()
+
+    def start(self, frames=1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            logger.info(f"已啟用 tracemalloc（{frames} 層堆疊）")
+
+    def stop(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.info("已停用 tracemalloc")
+        with self._lock:
+            self.snapshots = {}
+
+    @staticmethod
+    def _take():
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+
+    def mark(self, name):
+        """記錄具名快照；未啟用 tracemalloc 時不做任何事"""
+        if not tracemalloc.is_tracing():
+            return False
+        snapshot = self._take()
+        with self._lock:
+            self.snapshots[name] = (time.time(), snapshot)
+            # 只保留最近的快照，快照本身也佔用不少記憶體
+            while len(self.snapshots) > self.keep:
+                oldest = min(self.snapshots, key=lambda key: self.snapshots[key][0])
+                del self.snapshots[oldest]
+        return True
+
+    def diff(self, before, after=None, top=20, key_type='lineno'):
+        """比較兩個具名快照（after 為 None 時與目前狀態比較），回傳配置增加最多的前 N 項"""
+        with self._lock:
+            if before not in self.snapshots:
+                raise KeyError(before)
+            if after is not None and after not in self.snapshots:
+                raise KeyError(after)
+            old = self.snapshots[before][1]
+            new = self.snapshots[after][1] if after is not None else None
+        if new is None:
+            if not tracemalloc.is_tracing():
+                raise RuntimeError('tracemalloc 未啟用，無法取得目前快照')
+            new = self._take()
+
+        stats = new.compare_to(old, key_type)
+        return [
+            {
+                'location': str(stat.traceback[0]) if stat.traceback else '?',
+                'size_diff_bytes': stat.size_diff,
+                'count_diff': stat.count_diff,
+                'size_bytes': stat.size,
+                'count': stat.count
+            }
+            for stat in stats[:top]
+        ]
+
+    def status(self):
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        with self._lock:
+            marks = {name: taken_at for name, (taken_at, _) in self.snapshots.items()}
+        return {
+            'tracing': tracemalloc.is_tracing(),
+            'traced_bytes': current,
+            'traced_peak_bytes': peak,
+            'snapshots': marks
+        }
+
+
+memory_tracker = MemoryTracker()
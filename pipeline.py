@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+串流式分段處理管線
+
+各階段（例如：下載 → 解碼驗證 → 指標計算）以有界佇列串接，每支股票的資料
+一到就立即往下一階段流動：CPU 工作與網路等待重疊，佇列上限提供背壓、
+限制記憶體用量，整體耗時趨近 max(下載, 計算) 而非兩者相加。
+"""
+
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class Stage:
+    """管線中的一個階段
+
+    func      : 處理函式；一般階段接收單一項目並回傳單一結果，
+                batched=True 時接收 list 並回傳可迭代的結果
+    workers   : 此階段的執行緒數
+    batch_size: 批次階段每次最多取出的項目數
+    min_batch : 批次階段湊滿 min_batch 個項目或等待超過 linger 秒才處理
+                （預設 1：只取佇列中已就緒者，不等待）；上游較慢時避免每批只有一個項目
+    回傳 None 的結果會被丟棄，不再往下傳遞。
+    """
+
+    def __init__(self, name, func, workers=1, batched=False, batch_size=1, min_batch=1, linger=0.0):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.batched = batched
+        self.batch_size = max(1, batch_size) if batched else 1
+        self.min_batch = min(max(1, min_batch), self.batch_size)
+        self.linger = max(0.0, linger)
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        # busy_seconds 為所有執行緒處理時間的總和（worker-seconds）；
+        # first_started / last_finished 記錄第一個項目開始到最後一個項目完成的時間點
+        self.busy_seconds = 0.0
+        self.first_started = None
+        self.last_finished = None
+        self._lock = threading.Lock()
+
+    def stats(self):
+        wall = self.last_finished - self.first_started if self.first_started is not None else 0.0
+        return {
+            'workers': self.workers,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'wall_seconds': round(wall, 3)
+        }
+
+
+class Pipeline:
+    """以有界佇列串接多個 Stage 的執行緒管線"""
+
+    def __init__(self, stages, queue_size=64, name='pipeline'):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.name = name
+        self.elapsed_seconds = 0.0
+
+    def _take(self, inbox, stage):
+        """取出一批項目；遇到結束標記時回傳 (items, True)"""
+        item = inbox.get()
+        if item is _DONE:
+            return [], True
+        items = [item]
+        deadline = time.monotonic() + stage.linger
+        while len(items) < stage.batch_size:
+            try:
+                if len(items) < stage.min_batch:
+                    # 未湊滿最小批次：在 linger 期限內等待上游
+                    timeout = deadline - time.monotonic()
+                    item = inbox.get(timeout=timeout) if timeout > 0 else inbox.get_nowait()
+                else:
+                    item = inbox.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return items, True
+            items.append(item)
+        return items, False
+
+    def _run_stage(self, stage, inbox, outbox, remaining):
+        finished = False
+        while not finished:
+            items, finished = self._take(inbox, stage)
+            if not items:
+                break
+            start = time.perf_counter()
+            with stage._lock:
+                if stage.first_started is None or start < stage.first_started:
+                    stage.first_started = start
+            try:
+                if stage.batched:
+                    results = list(stage.func(items) or [])
+                else:
+                    results = [stage.func(items[0])]
+            except Exception as e:
+                logger.warning(f"{self.name} 階段 {stage.name} 處理失敗: {e}")
+                results = []
+                with stage._lock:
+                    stage.errors += len(items)
+            finished_at = time.perf_counter()
+            elapsed = finished_at - start
+
+            forwarded = 0
+            for result in results:
+                if result is not None:
+                    outbox.put(result)
+                    forwarded += 1
+            with stage._lock:
+                stage.busy_seconds += elapsed
+                if stage.last_finished is None or finished_at > stage.last_finished:
+                    stage.last_finished = finished_at
+                stage.processed += len(items)
+                stage.dropped += len(items) - forwarded
+
+        if finished:
+            # 放回結束標記，讓同階段其他執行緒也能結束
+            inbox.put(_DONE)
+        # 同階段最後一個結束的執行緒負責通知下一階段
+        with stage._lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            outbox.put(_DONE)
+
+    def run(self, items, sink):
+        """執行管線；sink 在呼叫端執行緒中依完成順序接收最後一階段的輸出"""
+        start = time.perf_counter()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = []
+
+        def feed():
+            for item in items:
+                queues[0].put(item)
+            queues[0].put(_DONE)
+
+        feeder = threading.Thread(target=feed, name=f'{self.name}-feed', daemon=True)
+        feeder.start()
+        threads.append(feeder)
+
+        for index, stage in enumerate(self.stages):
+            remaining = [stage.workers]
+            for n in range(stage.workers):
+                t = threading.Thread(
+                    target=self._run_stage,
+                    args=(stage, queues[index], queues[index + 1], remaining),
+                    name=f'{self.name}-{stage.name}-{n}',
+                    daemon=True
+                )
+                t.start()
+                threads.append(t)
+
+        outbox = queues[-1]
+        while True:
+            result = outbox.get()
+            if result is _DONE:
+                break
+            try:
+                sink(result)
+            except Exception as e:
+                # 持續消化輸出，避免上游執行緒卡在已滿的佇列
+                logger.warning(f"{self.name} 輸出處理失敗: {e}")
+
+        for t in threads:
+            t.join()
+        self.elapsed_seconds = time.perf_counter() - start
+        return self.stats()
+
+    def stats(self):
+        return {
+            'elapsed_seconds': round(self.elapsed_seconds, 3),
+            'stages': {stage.name: stage.stats() for stage in self.stages}
+        }
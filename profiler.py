@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+隨選取樣剖析器
+
+管理者可「預約」剖析下一次的更新（update）或篩選（screen）執行：
+執行期間由背景執行緒以固定間隔讀取 sys._current_frames()，彙整成
+collapsed stack 格式（每行「frame;frame;frame 次數」），可直接交給
+flamegraph.pl、speedscope 或 inferno 產生火焰圖。
+
+未預約時 profile_run() 只檢查一個旗標，不會啟動任何執行緒（零成本）。
+取樣涵蓋執行該任務的執行緒，以及執行期間新建立的執行緒（例如管線的各階段）。
+"""
+
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TARGETS = ('update', 'screen', 'any')
+
+
+class SamplingProfiler:
+    """以固定間隔取樣執行緒堆疊的低開銷剖析器"""
+
+    def __init__(self, interval=0.005, max_seconds=600, max_depth=64):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.max_depth = max_depth
+        self.samples = 0
+        self.stacks = {}
+        self.started_at = None
+        self.elapsed_seconds = 0.0
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._root_ident = None
+        self._baseline = set()
+
+    def _label(self, frame):
+        code = frame.f_code
+        label = self._labels.get(code)
+        if label is None:
+            # 以模組名稱標示（避免 app.py 與 flask/app.py 等同名檔案混淆）
+            module = frame.f_globals.get('__name__') or os.path.basename(code.co_filename)
+            label = f"{code.co_name} ({module}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _sample(self, thread_names):
+        frames = sys._current_frames()
+        for ident, frame in frames.items():
+            if ident != self._root_ident and ident in self._baseline:
+                continue
+            name = thread_names.get(ident)
+            if name is None:
+                continue
+            labels = []
+            while frame is not None and len(labels) < self.max_depth:
+                labels.append(self._label(frame))
+                frame = frame.f_back
+            labels.append(name)
+            key = ';'.join(reversed(labels))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+        self.samples += 1
+
+    def _run(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval):
+            own = threading.get_ident()
+            # 執行緒名稱中的數字（例如 screen-fetch-3）合併，讓同階段的堆疊彙整在一起
+            thread_names = {
+                t.ident: t.name.rstrip('0123456789').rstrip('-_') or t.name
+                for t in threading.enumerate() if t.ident != own
+            }
+            self._sample(thread_names)
+            if time.monotonic() > deadline:
+                logger.warning(f"剖析超過 {self.max_seconds} 秒上限，停止取樣")
+                break
+
+    def start(self):
+        self._root_ident = threading.get_ident()
+        # 只取樣執行中的任務：開始前已存在的其他執行緒（閒置的請求執行緒等）略過
+        self._baseline = {t.ident for t in threading.enumerate()}
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.elapsed_seconds = time.time() - self.started_at
+
+    def collapsed(self):
+        """回傳 collapsed stack 格式文字（依次數由多到少）"""
+        lines = [f"{stack} {count}" for stack, count in
+                 sorted(self.stacks.items(), key=lambda item: item[1], reverse=True)]
+        return '\n'.join(lines) + '\n'
+
+
+class ProfileManager:
+    """管理剖析預約與最近的剖析結果"""
+
+    def __init__(self, keep=5):
+        self.armed = None
+        self.active = None
+        self.results = deque(maxlen=keep)
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def arm(self, target='any', interval=0.005, max_seconds=600):
+        """預約剖析下一次符合 target 的執行"""
+        if target not in PROFILE_TARGETS:
+            raise ValueError(f"target 必須為 {', '.join(PROFILE_TARGETS)} 之一")
+        with self._lock:
+            self.armed = {
+                'target': target,
+                'interval': interval,
+                'max_seconds': max_seconds,
+                'armed_at': time.time()
+            }
+            return dict(self.armed)
+
+    def disarm(self):
+        with self._lock:
+            self.armed = None
+
+    def _claim(self, name):
+        with self._lock:
+            armed = self.armed
+            if armed is None or self.active is not None or armed['target'] not in (name, 'any'):
+                return None
+            self.armed = None
+            self.active = name
+            return armed
+
+    @contextmanager
+    def profile_run(self, name):
+        """包住一次執行；有預約時進行取樣，否則不做任何事"""
+        if self.armed is None:
+            yield
+            return
+        armed = self._claim(name)
+        if armed is None:
+            yield
+            return
+
+        profiler = SamplingProfiler(interval=armed['interval'], max_seconds=armed['max_seconds'])
+        logger.info(f"開始剖析 {name}（取樣間隔 {armed['interval'] * 1000:.1f} ms）")
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with self._lock:
+                result = {
+                    'id': self._next_id,
+                    'target': name,
+                    'started_at': profiler.started_at,
+                    'elapsed_seconds': round(profiler.elapsed_seconds, 3),
+                    'samples': profiler.samples,
+                    'stacks': len(profiler.stacks),
+                    'interval': armed['interval'],
+                    'collapsed': profiler.collapsed()
+                }
+                self._next_id += 1
+                self.results.append(result)
+                self.active = None
+            logger.info(f"剖析 {name} 完成：{result['samples']} 次取樣，{result['stacks']} 種堆疊")
+
+    def profiled(self, name):
+        """裝飾器版本的 profile_run"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if self.armed is None:
+                    return func(*args, **kwargs)
+                with self.profile_run(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def get(self, profile_id):
+        with self._lock:
+            for result in self.results:
+                if result['id'] == profile_id:
+                    return result
+        return None
+
+    def status(self):
+        with self._lock:
+            return {
+                'armed': dict(self.armed) if self.armed else None,
+                'active': self.active,
+                'profiles': [
+                    {key: value for key, value in result.items() if key != 'collapsed'}
+                    for result in reversed(self.results)
+                ]
+            }
+
+
+profile_manager = ProfileManager()
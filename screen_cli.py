@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+命令列批次篩選
+
+不啟動 HTTP 伺服器，直接呼叫與 /api/update、/api/screen 相同的函式：
+先更新股票快照，再執行篩選並將結果寫成 JSON 或 CSV，適合排程（cron）夜間批次執行。
+每次更新成功後將快照寫入 --snapshot-file，下次以 --fast 執行時先載入它，
+才能依前一日成交量略過低成交量股票（並沿用其資料）。
+
+用法：
+    python screen_cli.py --output results/screen.json
+    python screen_cli.py --codes 2330,2317,2454 --format csv --output - --signals-only
+    python screen_cli.py --fast --fetch-workers 40 --indicator-mode process --output screen.csv
+
+結束碼：0 成功、1 更新或篩選失敗。
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+DEFAULT_SNAPSHOT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'cli_snapshot.json')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='台股主力資金篩選器：命令列批次篩選')
+    parser.add_argument('--codes', help='只處理這些股票代碼（逗號分隔）')
+    parser.add_argument('--codes-file', help='從檔案讀取股票代碼（每行一個或逗號分隔）')
+    parser.add_argument('--fast', action='store_true',
+                        help='快速更新：依上次儲存的快照略過前一日成交量過低的股票（沒有快照時完整更新）')
+    parser.add_argument('--snapshot-file', default=DEFAULT_SNAPSHOT_FILE,
+                        help=f'快照儲存檔，供下次 --fast 使用（預設 {DEFAULT_SNAPSHOT_FILE}）')
+    parser.add_argument('--no-universe-refresh', action='store_true',
+                        help='股票清單快取過期時不重新取得（直接使用快取或內建清單）')
+    parser.add_argument('--max-stocks', type=int, default=1044, help='最多篩選的股票數（預設 1044）')
+    parser.add_argument('--fetch-workers', type=int, help='更新時下載的並行數（UPDATE_FETCH_WORKERS）')
+    parser.add_argument('--screen-workers', type=int, help='篩選時歷史資料下載的並行數（SCREEN_FETCH_WORKERS）')
+    parser.add_argument('--indicator-mode', choices=('inline', 'process'), help='指標計算模式（INDICATOR_EXECUTION_MODE）')
+    parser.add_argument('--indicator-workers', type=int, help='process 模式的子行程數（INDICATOR_PROCESS_WORKERS）')
+    parser.add_argument('--format', choices=('json', 'csv'), help='輸出格式（預設依 --output 副檔名，否則 json）')
+    parser.add_argument('--output', '-o', default='-', help='輸出檔案，- 表示標準輸出（預設）')
+    parser.add_argument('--signals-only', action='store_true', help='只輸出黃柱信號股票')
+    parser.add_argument('--log-level', help='日誌層級（LOG_LEVEL，預設 INFO；日誌輸出至標準錯誤）')
+    return parser.parse_args(argv)
+
+
+def read_codes(args):
+    values = []
+    if args.codes:
+        values.append(args.codes)
+    if args.codes_file:
+        with open(args.codes_file, encoding='utf-8') as f:
+            values.append(f.read())
+    codes = [code.strip() for value in values for code in value.replace('\n', ',').split(',') if code.strip()]
+    return list(dict.fromkeys(codes)) or None
+
+
+def apply_environment(args):
+    """並行數等設定於 app 匯入時讀取，必須在 import app 之前寫入環境變數"""
+    settings = {
+        'UPDATE_FETCH_WORKERS': args.fetch_workers,
+        'SCREEN_FETCH_WORKERS': args.screen_workers,
+        'INDICATOR_EXECUTION_MODE': args.indicator_mode,
+        'INDICATOR_PROCESS_WORKERS': args.indicator_workers,
+        'LOG_LEVEL': args.log_level,
+    }
+    for name, value in settings.items():
+        if value is not None:
+            os.environ[name] = str(value)
+    # 批次執行不需要背景健康探測
+    os.environ.setdefault('HEALTH_PROBE_INTERVAL', '0')
+
+
+def write_json(result, stream):
+    json.dump(result, stream, ensure_ascii=False, indent=2)
+    stream.write('\n')
+
+
+def write_csv(rows, fields, stream):
+    writer = csv.DictWriter(stream, fieldnames=fields, extrasaction='ignore', lineterminator='\n')
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def load_snapshot(app, path):
+    """載入上次儲存的快照並發布為完整快照，回傳股票數（無快照時為 0）"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            payload = json.load(f)
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError) as e:
+        app.logger.warning(f"讀取快照檔失敗，改為完整更新: {e}")
+        return 0
+    stocks = payload.get('stocks') or {}
+    if stocks:
+        app.publish_snapshot(stocks, payload.get('date'))
+    return len(stocks)
+
+
+def save_snapshot(app, path):
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'date': app.data_date, 'stocks': app.stocks_data}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        app.logger.warning(f"寫入快照檔失敗: {e}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    apply_environment(args)
+    output_format = args.format or ('csv' if args.output.lower().endswith('.csv') else 'json')
+    codes = read_codes(args)
+
+    started = time.perf_counter()
+    import app
+
+    try:
+        # 伺服器在背景更新股票清單；批次執行只跑一次，過期時直接同步取得
+        if not codes and not args.no_universe_refresh:
+            app.stock_universe.get()
+            if app.stock_universe.stale():
+                app.stock_universe.refresh()
+
+        # 快照只存在記憶體中，每次執行都先更新（歷史K線則沿用歷史存放區）；
+        # 快速更新需要前一次的快照判斷成交量，先從快照檔載入
+        if args.fast and not load_snapshot(app, args.snapshot_file):
+            app.logger.info("沒有可用的快照檔，--fast 改為完整更新")
+        if not app.update_stocks_data(fast=args.fast, only_codes=codes):
+            app.logger.error("更新股票資料失敗")
+            return 1
+        if not codes:
+            save_snapshot(app, args.snapshot_file)
+        try:
+            result = app.run_screen(codes, max_stocks=args.max_stocks)
+        except RuntimeError as e:
+            app.logger.error(f"篩選失敗: {e}")
+            return 1
+    finally:
+        app.indicator_pool.shutdown()
+
+    rows = result['yellow_candle_stocks'] if args.signals_only else result['all_stocks']
+    if output_format == 'json' and args.signals_only:
+        result = {key: value for key, value in result.items() if key != 'all_stocks'}
+
+    if args.output == '-':
+        stream = sys.stdout
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        stream = open(args.output, 'w', encoding='utf-8', newline='')
+    try:
+        if output_format == 'csv':
+            write_csv(rows, app.SCREEN_EXPORT_FIELDS, stream)
+        else:
+            write_json(result, stream)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+    app.logger.info(f"批次篩選完成：{result['total_analyzed']} 支，黃柱 {result['yellow_candle_count']} 支，"
+                    f"輸出 {len(rows)} 筆至 {args.output}（{time.perf_counter() - started:.1f} 秒）")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
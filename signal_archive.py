@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+每日篩選信號封存
+
+每次篩選後將各股票的指標值與信號旗標以一個 gzip member 附加到封存檔尾端
+（只附加、不改寫），另以小型 JSON 索引記錄每個交易日的位置與各旗標成立的代碼：
+
+    資料檔 : gzip member 串接；每個 member 為一天的欄式 JSON
+             {"date", "codes": [...], "values": {欄位: [...]}}
+    索引檔 : <資料檔>.idx，{"version", "days": [{"date", "offset", "length",
+             "count", "flags": {旗標: [代碼...]}}]}（依日期排序，原子替換）
+
+「最近 N 個交易日出現黃柱的股票」只需讀取索引（依日期 + 依代碼的反向索引），
+不解壓資料；查詢單支股票的指標歷史時才解壓對應日期的 member，並快取最近讀取的天數。
+同一天重複篩選時附加新的 member 並指向它（部分篩選會與當天既有資料合併），
+舊 member 成為不再引用的位元組；其總量超過 compact_min_bytes 且多於仍引用的資料時，
+只保留引用中的 member 重寫資料檔（壓縮整理）。索引記錄資料檔的 inode，讀取端發現
+資料檔已被替換時重新載入索引。索引遺失時可由資料檔重建。
+"""
+
+import gzip
+import json
+import logging
+import os
+import threading
+import zlib
+from bisect import bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台：只有行程內的鎖
+    fcntl = None
+
+FORMAT_VERSION = 1
+FLAGS = ('banker_entry_signal', 'is_crossover', 'is_oversold')
+VALUE_FIELDS = ('name', 'price', 'change_percent', 'volume', 'fund_trend',
+                'multi_short_line', 'score', 'signal_status') + FLAGS
+
+
+def _number(value):
+    """顯示用字串（如 '12.34'）轉為數值；無法計算指標時的錯誤訊息回傳 None"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class SignalArchive:
+    """只附加的每日信號封存檔與日期 / 代碼索引"""
+
+    def __init__(self, path, cache_days=32, compact_min_bytes=1 << 20):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.lock_path = f"{path}.lock"
+        self.cache_days = cache_days
+        self.compact_min_bytes = compact_min_bytes
+        self._lock = threading.Lock()
+        # 附加寫入的序列化（跨行程另以 flock 鎖定 lock 檔；資料檔壓縮整理時會被替換，不能鎖資料檔本身）
+        self._write_lock = threading.Lock()
+        self._index_id = None
+        self._data_inode = None
+        self._days = []
+        self._dates = []
+        self._by_code = {}
+        self._cache = OrderedDict()
+
+    # ------------------------------------------------------------------
+    # 索引
+    # ------------------------------------------------------------------
+    def reload(self):
+        """索引檔被其他行程替換時重新載入；索引不存在而資料檔存在時由資料檔重建"""
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            if self._index_id is None and os.path.exists(self.path):
+                with self._lock:
+                    self._set_days(self._scan_members())
+                    self._data_inode = os.stat(self.path).st_ino
+                self._index_id = ('rebuilt',)
+            return False
+        index_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if index_id == self._index_id:
+            return False
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                payload = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"讀取信號封存索引失敗: {e}")
+            return False
+        if payload.get('version') != FORMAT_VERSION:
+            self.logger.warning(f"信號封存索引版本不符（{payload.get('version')}），略過")
+            return False
+        with self._lock:
+            self._set_days(payload.get('days', []))
+            self._data_inode = payload.get('data_inode')
+            self._index_id = index_id
+        return True
+
+    def _set_days(self, days):
+        # 位置改變的日期（其他行程重新封存或壓縮整理）不能再使用快取的舊內容
+        previous = {day['date']: (day['offset'], day['length']) for day in self._days}
+        current = {day['date']: (day['offset'], day['length']) for day in days}
+        for date in list(self._cache):
+            if current.get(date) != previous.get(date):
+                del self._cache[date]
+        self._days = sorted(days, key=lambda day: day['date'])
+        self._dates = [day['date'] for day in self._days]
+        # 依代碼的反向索引：旗標 -> 代碼 -> 成立的日期（遞增）
+        by_code = {flag: {} for flag in FLAGS}
+        for day in self._days:
+            for flag, codes in day['flags'].items():
+                for code in codes:
+                    by_code.setdefault(flag, {}).setdefault(code, []).append(day['date'])
+        self._by_code = by_code
+
+    def _scan_members(self):
+        """逐一解壓資料檔中的 member 重建索引（同一天以最後寫入者為準）"""
+        days = {}
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            self.logger.warning(f"讀取信號封存檔失敗: {e}")
+            return []
+        offset = 0
+        while offset < len(data):
+            decoder = zlib.decompressobj(wbits=31)
+            try:
+                raw = decoder.decompress(data[offset:])
+                record = json.loads(raw)
+            except (zlib.error, ValueError) as e:
+                # 寫入中斷留下的殘缺尾端，忽略
+                self.logger.warning(f"信號封存檔於位置 {offset} 損毀，忽略其後資料: {e}")
+                break
+            length = len(data) - offset - len(decoder.unused_data)
+            days[record['date']] = self._index_entry(record, offset, length)
+            offset += length
+        self.logger.info(f"由資料檔重建信號封存索引：{len(days)} 天")
+        return list(days.values())
+
+    @staticmethod
+    def _index_entry(record, offset, length):
+        values = record['values']
+        return {
+            'date': record['date'],
+            'offset': offset,
+            'length': length,
+            'count': len(record['codes']),
+            'flags': {
+                flag: [code for code, flagged in zip(record['codes'], values.get(flag, ())) if flagged]
+                for flag in FLAGS
+            }
+        }
+
+    def _write_index(self):
+        payload = {'version': FORMAT_VERSION, 'data_inode': self._data_inode, 'days': self._days}
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.index_path)
+        stat = os.stat(self.index_path)
+        self._index_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    # ------------------------------------------------------------------
+    # 寫入
+    # ------------------------------------------------------------------
+    def append(self, date, results):
+        """將一次篩選結果附加為 date 當天的資料，回傳封存的股票數
+
+        只封存成功計算指標的股票；當天已有資料時與之合併（本次結果優先）。
+        """
+        rows = {}
+        for stock in results:
+            fund_trend = _number(stock.get('fund_trend'))
+            multi_short_line = _number(stock.get('multi_short_line'))
+            if not stock.get('code') or fund_trend is None or multi_short_line is None:
+                continue
+            row = {field: stock.get(field) for field in VALUE_FIELDS}
+            row['fund_trend'], row['multi_short_line'] = fund_trend, multi_short_line
+            rows[stock['code']] = row
+        if not date or not rows:
+            return 0
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._exclusive(), open(self.path, 'ab') as f:
+            # 取得檔案鎖後重新讀取索引，包含其他行程剛附加的資料
+            self.reload()
+            existing = self.day(date)
+            if existing:
+                merged = dict(existing)
+                merged.update(rows)
+                rows = merged
+
+            codes = sorted(rows)
+            record = {
+                'date': date,
+                'codes': codes,
+                'values': {field: [rows[code].get(field) for code in codes] for field in VALUE_FIELDS}
+            }
+            member = gzip.compress(
+                json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+                compresslevel=6
+            )
+            offset = f.seek(0, os.SEEK_END)
+            f.write(member)
+            f.flush()
+            os.fsync(f.fileno())
+
+            with self._lock:
+                days = [day for day in self._days if day['date'] != date]
+                days.append(self._index_entry(record, offset, len(member)))
+                self._set_days(days)
+                self._data_inode = os.fstat(f.fileno()).st_ino
+                self._write_index()
+            self._maybe_compact(offset + len(member))
+        self.logger.info(f"信號封存：{date} 共 {len(codes)} 支（{len(member) / 1024:.1f} KB 壓縮）")
+        return len(codes)
+
+    @contextmanager
+    def _exclusive(self):
+        """寫入端的獨占鎖：行程內以 _write_lock、跨行程以 lock 檔的 flock"""
+        with self._write_lock, open(self.lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _maybe_compact(self, size):
+        live = sum(day['length'] for day in self._days)
+        unreferenced = size - live
+        if unreferenced >= self.compact_min_bytes and unreferenced > live:
+            self._compact_locked()
+
+    def compact(self):
+        """只保留索引引用中的 member 重寫資料檔，回傳釋放的位元組數"""
+        if not os.path.exists(self.path):
+            return 0
+        with self._exclusive():
+            self.reload()
+            return self._compact_locked()
+
+    def _compact_locked(self):
+        size = os.path.getsize(self.path)
+        days = []
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(self.path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            for day in self._days:
+                src.seek(day['offset'])
+                member = src.read(day['length'])
+                days.append(dict(day, offset=dst.tell()))
+                dst.write(member)
+            dst.flush()
+            os.fsync(dst.fileno())
+            new_size = dst.tell()
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self._set_days(days)
+            self._data_inode = os.stat(self.path).st_ino
+            self._write_index()
+        self.logger.info(f"信號封存檔壓縮整理：{size / 1024:.1f} KB → {new_size / 1024:.1f} KB")
+        return size - new_size
+
+    # ------------------------------------------------------------------
+    # 查詢
+    # ------------------------------------------------------------------
+    def dates(self):
+        self.reload()
+        return list(self._dates)
+
+    def window(self, days=10, end=None):
+        """截至 end（含）的最近 days 個已封存交易日"""
+        self.reload()
+        with self._lock:
+            stop = bisect_right(self._dates, end) if end else len(self._dates)
+            return self._dates[max(0, stop - days):stop]
+
+    def signals(self, flag='banker_entry_signal', days=10, end=None):
+        """最近 days 個交易日內 flag 成立的股票（只讀索引），依最近出現日期與次數排序"""
+        if flag not in FLAGS:
+            raise ValueError(f"未知的信號旗標：{flag}（可用 {', '.join(FLAGS)}）")
+        dates = self.window(days, end)
+        if not dates:
+            return dates, []
+        first, last = dates[0], dates[-1]
+        stocks = []
+        with self._lock:
+            for code, flagged in self._by_code.get(flag, {}).items():
+                hits = [date for date in flagged if first <= date <= last]
+                if hits:
+                    stocks.append({'code': code, 'dates': hits, 'count': len(hits), 'last_date': hits[-1]})
+        stocks.sort(key=lambda stock: (stock['last_date'], stock['count'], stock['code']), reverse=True)
+        return dates, stocks
+
+    def day(self, date):
+        """某一天全部股票的封存資料 {代碼: {欄位: 值}}"""
+        for _ in range(2):
+            self.reload()
+            with self._lock:
+                rows = self._read_day_unlocked(date)
+                if rows is not None:
+                    return rows
+                # 資料檔已被壓縮整理替換：強制重新載入索引後再讀一次
+                self._index_id = None
+        return {}
+
+    def code_history(self, code, days=30, end=None):
+        """單支股票最近 days 個交易日的指標值與信號旗標（依日期遞增）"""
+        history = []
+        for date in self.window(days, end):
+            row = self.day(date).get(code)
+            if row is not None:
+                history.append({'date': date, **row})
+        return history
+
+    def _read_day_unlocked(self, date):
+        cached = self._cache.get(date)
+        if cached is not None:
+            self._cache.move_to_end(date)
+            return cached
+        position = bisect_right(self._dates, date) - 1
+        if position < 0 or self._dates[position] != date:
+            return {}
+        entry = self._days[position]
+        try:
+            with open(self.path, 'rb') as f:
+                if self._data_inode is not None and os.fstat(f.fileno()).st_ino != self._data_inode:
+                    return None
+                f.seek(entry['offset'])
+                record = json.loads(gzip.decompress(f.read(entry['length'])))
+        except (OSError, ValueError, EOFError, zlib.error) as e:
+            self.logger.warning(f"讀取信號封存 {date} 失敗: {e}")
+            return {}
+        values = record['values']
+        fields = list(values)
+        rows = {
+            code: dict(zip(fields, row))
+            for code, row in zip(record['codes'], zip(*(values[field] for field in fields)))
+        }
+        self._cache[date] = rows
+        while len(self._cache) > self.cache_days:
+            self._cache.popitem(last=False)
+        return rows
+
+    def cached(self):
+        """目前快取中已解壓的日期資料 {日期: {代碼: {欄位: 值}}}（供記憶體報告估算用量）"""
+        with self._lock:
+            return dict(self._cache)
+
+    def stats(self):
+        """封存檔概況（供診斷使用）"""
+        self.reload()
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        with self._lock:
+            live = sum(day['length'] for day in self._days)
+            return {
+                'path': self.path,
+                'days': len(self._days),
+                'first_date': self._dates[0] if self._dates else None,
+                'last_date': self._dates[-1] if self._dates else None,
+                'file_bytes': size,
+                'unreferenced_bytes': max(0, size - live),
+                'cached_days': len(self._cache)
+            }
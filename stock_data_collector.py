@@ -1,45 +1,258 @@
+import codecs
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from html.parser import HTMLParser
+
 import pandas as pd
+import pytz
 import requests
-from bs4 import BeautifulSoup
-import logging
+from requests.adapters import HTTPAdapter
+
+from upstream import upstream_get
+
+# ISIN 清單頁面（strMode=2 上市、strMode=4 上櫃）
+ISIN_LIST_URL = os.environ.get('ISIN_LIST_URL', 'https://isin.twse.com.tw/isin/C_public.jsp?strMode=2')
+ISIN_CACHE_PATH = os.environ.get(
+    'ISIN_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'isin_universe.json')
+)
+ISIN_CACHE_TTL = int(os.environ.get('ISIN_CACHE_TTL', str(24 * 3600)))
+# 解析欄位或快取格式改變時遞增，舊快取自動失效
+ISIN_CACHE_VERSION = 1
+ISIN_CATEGORIES = ('股票',)
+
+YAHOO_BASE_URL = os.environ.get('YAHOO_BASE_URL', 'https://query1.finance.yahoo.com').rstrip('/')
+QUOTE_CACHE_TTL = float(os.environ.get('QUOTE_CACHE_TTL', '60'))
+QUOTE_FETCH_WORKERS = int(os.environ.get('QUOTE_FETCH_WORKERS', '8'))
+TW_TZ = pytz.timezone('Asia/Taipei')
+
+# 所有 StockDataCollector 共用的記憶體快取
+_universe_cache = {'stocks': None, 'frame': None, 'fetched_at': 0.0, 'source': None}
+_universe_lock = threading.Lock()
+# 目前存在的 collector（弱參照），供記憶體報告統計各自的報價快取
+_collectors = weakref.WeakSet()
+
+
+def cache_snapshot():
+    """目前保留在記憶體中的快取（股票清單與各 collector 的報價快取），供記憶體報告估算用量"""
+    return {
+        'universe': dict(_universe_cache),
+        'quotes': [dict(collector._quotes) for collector in list(_collectors)]
+    }
+
+
+class IsinListParser(HTMLParser):
+    """逐段解析 ISIN 清單頁面，只保留需要的欄位，不建立完整 DOM
+
+    頁面為一個大表格：單一儲存格（colspan）的列是分類標題（股票、ETF...），
+    其餘資料列依序為「代號　名稱」、ISIN、上市日、市場別、產業別...
+    頁面的 td/tr 常未關閉，因此以下一個 td/tr 開頭視為前一個的結束。
+    """
+
+    def __init__(self, categories=ISIN_CATEGORIES):
+        super().__init__(convert_charrefs=True)
+        self.categories = set(categories) if categories else None
+        self.stocks = []
+        self._category = None
+        self._row = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'tr':
+            self._finish_row()
+            self._row = []
+        elif tag == 'td' and self._row is not None:
+            self._finish_cell()
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag == 'td':
+            self._finish_cell()
+        elif tag in ('tr', 'table'):
+            self._finish_row()
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+    def close(self):
+        super().close()
+        self._finish_row()
+
+    def _finish_cell(self):
+        if self._cell is not None and self._row is not None:
+            self._row.append(''.join(self._cell).strip())
+        self._cell = None
+
+    def _finish_row(self):
+        self._finish_cell()
+        row, self._row = self._row, None
+        if not row:
+            return
+        if len(row) == 1:
+            self._category = row[0]
+            return
+        if len(row) < 5 or (self.categories is not None and self._category not in self.categories):
+            return
+
+        code, separator, name = row[0].replace('　', ' ').partition(' ')
+        if not separator or not code.isalnum():
+            return  # 表頭列
+        self.stocks.append({
+            'stock_id': code,
+            'stock_name': name.strip(),
+            'isin': row[1],
+            'listing_date': row[2].replace('/', '-'),
+            'market': row[3],
+            'industry': row[4],
+            'category': self._category
+        })
+
 
 class StockDataCollector:
-    def __init__(self):
+    def __init__(self, cache_path=ISIN_CACHE_PATH, cache_ttl=ISIN_CACHE_TTL,
+                 quote_ttl=QUOTE_CACHE_TTL, fetch_workers=QUOTE_FETCH_WORKERS):
         self.logger = logging.getLogger(__name__)
+        self.cache_path = cache_path
+        self.cache_ttl = cache_ttl
+        self.quote_ttl = quote_ttl
+        self.fetch_workers = max(1, fetch_workers)
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
-        
-    def get_taiwan_stock_list(self):
-        """獲取台灣股票清單"""
-        try:
-            # 嘗試從網路獲取
-            stock_list = self._get_stock_list_from_web()
-            if not stock_list.empty:
-                return stock_list
-        except Exception as e:
-            self.logger.warning(f"從網路獲取股票清單失敗: {e}")
-        
+        # 連線池大小與並行下載數一致，並行請求不會因池滿而重新建立連線
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.fetch_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # 代碼 -> (取得時間, 報價)
+        self._quotes = {}
+        self._quotes_lock = threading.Lock()
+        _collectors.add(self)
+
+    def get_taiwan_stock_list(self, force_refresh=False):
+        """獲取台灣股票清單（記憶體 → 磁碟快取 → 網路，快取過期才重新下載）"""
+        with _universe_lock:
+            if not force_refresh and self._cache_fresh():
+                return _universe_cache['frame'].copy()
+
+            if not force_refresh and self._load_disk_cache() and self._cache_fresh():
+                return _universe_cache['frame'].copy()
+
+            try:
+                # 嘗試從網路獲取
+                stock_list = self._get_stock_list_from_web()
+                if not stock_list.empty:
+                    return stock_list.copy()
+            except Exception as e:
+                self.logger.warning(f"從網路獲取股票清單失敗: {e}")
+
+            # 網路失敗時，過期的快取仍比預設清單完整
+            if _universe_cache['frame'] is not None:
+                age = time.time() - _universe_cache['fetched_at']
+                self.logger.warning(f"使用過期的股票清單快取（{age / 3600:.1f} 小時前）")
+                return _universe_cache['frame'].copy()
+
         # 使用預設清單
         return self._get_default_stock_list()
-    
+
+    def _cache_fresh(self):
+        return (_universe_cache['frame'] is not None
+                and time.time() - _universe_cache['fetched_at'] < self.cache_ttl)
+
+    def _set_cache(self, stocks, fetched_at, source):
+        _universe_cache.update({
+            'stocks': stocks,
+            'frame': pd.DataFrame(stocks),
+            'fetched_at': fetched_at,
+            'source': source
+        })
+
+    def _load_disk_cache(self):
+        """讀取磁碟快取；版本不符或格式錯誤時忽略"""
+        if not self.cache_path:
+            return False
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"讀取股票清單快取失敗: {e}")
+            return False
+
+        if payload.get('version') != ISIN_CACHE_VERSION or not payload.get('stocks'):
+            self.logger.info(f"股票清單快取版本不符（{payload.get('version')}），忽略")
+            return False
+        if payload.get('fetched_at', 0) <= _universe_cache['fetched_at']:
+            return True
+        self._set_cache(payload['stocks'], payload.get('fetched_at', 0), payload.get('source'))
+        self.logger.info(f"載入股票清單快取，共 {len(payload['stocks'])} 支股票")
+        return True
+
+    def _save_disk_cache(self):
+        if not self.cache_path:
+            return
+        payload = {
+            'version': ISIN_CACHE_VERSION,
+            'fetched_at': _universe_cache['fetched_at'],
+            'source': _universe_cache['source'],
+            'stocks': _universe_cache['stocks']
+        }
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            self.logger.warning(f"寫入股票清單快取失敗: {e}")
+
     def _get_stock_list_from_web(self):
-        """嘗試從網路獲取股票清單"""
+        """從 ISIN 頁面串流解析股票清單，成功時更新快取"""
         try:
-            url = "https://isin.twse.com.tw/isin/C_public.jsp?strMode=2"
-            response = self.session.get(url, timeout=10)
-            
+            url = ISIN_LIST_URL
+            response = self.session.get(url, timeout=10, stream=True)
+
             if response.status_code == 200:
-                soup = BeautifulSoup(response.text, 'html.parser')
-                # 簡化的解析邏輯
-                return pd.DataFrame()  # 返回空DataFrame，觸發使用預設清單
-            
+                stocks = self.parse_isin_stream(response.iter_content(chunk_size=65536), response.encoding)
+                if stocks:
+                    self._set_cache(stocks, time.time(), url)
+                    self._save_disk_cache()
+                    self.logger.info(f"從 ISIN 頁面取得 {len(stocks)} 支股票")
+                    return _universe_cache['frame']
+                self.logger.warning("ISIN 頁面沒有解析出任何股票")
+
         except Exception as e:
             self.logger.error(f"網路獲取失敗: {e}")
-        
+
         return pd.DataFrame()
-    
+
+    @staticmethod
+    def parse_isin_stream(chunks, encoding=None, categories=ISIN_CATEGORIES):
+        """逐塊解碼並解析 ISIN 頁面（bytes 迭代器），回傳股票 dict 的 list"""
+        # 頁面宣告 charset=MS950，Python 沒有此名稱；未宣告時 requests 會回報 ISO-8859-1
+        try:
+            if not encoding or encoding.lower() == 'iso-8859-1':
+                raise LookupError(encoding)
+            codecs.lookup(encoding)
+        except LookupError:
+            encoding = 'cp950'
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        parser = IsinListParser(categories)
+        for chunk in chunks:
+            if chunk:
+                parser.feed(decoder.decode(chunk))
+        parser.feed(decoder.decode(b'', final=True))
+        parser.close()
+        return parser.stocks
+
     def _get_default_stock_list(self):
         """獲取預設股票清單"""
         default_stocks = [
@@ -64,21 +277,96 @@ class StockDataCollector:
             {'stock_id': '2382', 'stock_name': '廣達'},
             {'stock_id': '2308', 'stock_name': '台達電'}
         ]
-        
+
         self.logger.info(f"使用預設股票清單，共 {len(default_stocks)} 支股票")
         return pd.DataFrame(default_stocks)
-    
+
     def get_stock_data(self, stock_code):
-        """獲取單支股票資料（簡化版）"""
+        """獲取單支股票的最新報價（經由批次介面與快取）"""
+        return self.get_stocks_data([stock_code]).get(stock_code)
+
+    def get_stocks_data(self, stock_codes, max_age=None):
+        """批次獲取多支股票的最新報價，回傳 {代碼: 報價}
+
+        max_age 秒內取得的報價直接由快取回傳（預設 QUOTE_CACHE_TTL），
+        只有未命中的代碼會以 session 連線池並行下載；取得失敗的代碼不會出現在結果中。
+        """
+        max_age = self.quote_ttl if max_age is None else max_age
+        codes = list(dict.fromkeys(stock_codes))
+        now = time.time()
+        results = {}
+        misses = []
+        with self._quotes_lock:
+            for code in codes:
+                cached = self._quotes.get(code)
+                if cached and now - cached[0] < max_age:
+                    results[code] = cached[1]
+                else:
+                    misses.append(code)
+
+        if misses:
+            workers = min(self.fetch_workers, len(misses))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='quote') as executor:
+                fetched = list(executor.map(self._fetch_quote, misses))
+            fetched_at = time.time()
+            with self._quotes_lock:
+                for code, quote in zip(misses, fetched):
+                    if quote is not None:
+                        self._quotes[code] = (fetched_at, quote)
+                        results[code] = quote
+
+        self.logger.debug(f"報價批次：{len(codes)} 支，快取命中 {len(codes) - len(misses)}，"
+                          f"下載 {len(misses)}，失敗 {len(codes) - len(results)}")
+        return results
+
+    def clear_quote_cache(self):
+        with self._quotes_lock:
+            self._quotes = {}
+
+    def _fetch_quote(self, code):
+        """下載並解析單支股票的 Yahoo Finance chart（最近兩個交易日）"""
+        url = f'{YAHOO_BASE_URL}/v8/finance/chart/{code}.TW'
         try:
-            # 返回模擬資料
-            return {
-                'code': stock_code,
-                'close_price': 100.0,
-                'change_percent': 0.0,
-                'volume': 1000
-            }
+            response = upstream_get('collector_quote', url, session=self.session,
+                                    params={'interval': '1d', 'range': '2d'}, timeout=10)
+            if response.status_code != 200:
+                return None
+            return self.parse_chart_quote(code, response.json())
         except Exception as e:
-            self.logger.error(f"獲取股票 {stock_code} 資料失敗: {e}")
+            self.logger.debug(f"獲取股票 {code} 資料失敗: {e}")
+            return None
+
+    @staticmethod
+    def parse_chart_quote(code, data):
+        """從 chart 回應取出最後一個交易日的報價；資料不足時回傳 None"""
+        chart_result = ((data.get('chart') or {}).get('result') or [None])[0]
+        if not chart_result:
             return None
+        quote = (chart_result.get('indicators', {}).get('quote') or [{}])[0]
+        timestamps = chart_result.get('timestamp') or []
+        closes = quote.get('close') or []
+        if not timestamps or not closes or closes[-1] is None:
+            return None
+
+        close_price = float(closes[-1])
+        meta = chart_result.get('meta', {})
+        previous = closes[-2] if len(closes) >= 2 and closes[-2] is not None else meta.get('chartPreviousClose')
+        previous = float(previous) if previous else close_price
+        change = close_price - previous
+
+        def last(field):
+            values = quote.get(field) or []
+            return float(values[-1]) if values and values[-1] is not None else close_price
 
+        return {
+            'code': code,
+            'name': meta.get('shortName') or meta.get('longName') or '',
+            'close_price': close_price,
+            'open_price': last('open'),
+            'high_price': last('high'),
+            'low_price': last('low'),
+            'change': round(change, 4),
+            'change_percent': round(change / previous * 100, 4) if previous else 0.0,
+            'volume': int((quote.get('volume') or [0])[-1] or 0),
+            'date': datetime.fromtimestamp(timestamps[-1], tz=TW_TZ).strftime('%Y-%m-%d')
+        }
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+股票清單（universe）快取
+
+上市股票清單存於磁碟 JSON 檔，重新啟動後直接沿用。查詢永遠不對外連線：
+依序使用記憶體 → 磁碟快取 → 內建清單，快取過期或不存在時才在背景執行緒
+重新取得；每次取得新清單時記錄新增與移除的代碼，保留最近幾次的變動。
+
+探測新代碼時不逐一嘗試 1101~9998：discovery_candidates() 只挑出最近有變動的
+百位區段中的未知代碼、各區段最大代碼之後的幾個代碼，以及已知代碼之間的小空隙，
+並略過近期探測過確認不存在的代碼；探測結果連同清單一起寫回快取。
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 快取格式改變時遞增，舊檔自動忽略
+FORMAT_VERSION = 1
+
+
+class StockUniverse:
+    """磁碟備份、背景更新的股票清單
+
+    fetch() 回傳 (source, {代碼: 名稱})，取得失敗時回傳 None 或拋出例外；
+    fallback() 回傳內建清單，只有在沒有任何快取時才會呼叫。
+    """
+
+    def __init__(self, path, fetch, fallback, ttl=86400, retry_interval=300, max_changes=20):
+        self.path = path
+        self.fetch = fetch
+        self.fallback = fallback
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self.max_changes = max_changes
+        self.stocks = None
+        self.source = None
+        self.fetched_at = 0.0
+        self.changes = []
+        # 探測過但不存在的代碼 -> 探測時間
+        self.probed = {}
+        self.last_error = None
+        self.last_attempt_at = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._thread = None
+        self._loaded = False
+
+    def get(self):
+        """回傳目前的股票清單（不會等待網路）；過期時在背景重新取得"""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+                    self._loaded = True
+        if self.stale() and self._may_retry():
+            self.refresh_in_background()
+        stocks = self.stocks
+        if stocks is None:
+            stocks = self.fallback()
+            self.stocks, self.source = stocks, 'builtin'
+            logger.info(f"使用內建上市股票清單（{len(stocks)} 支）")
+        return stocks
+
+    def stale(self):
+        return self.source in (None, 'builtin') or time.time() - self.fetched_at >= self.ttl
+
+    def _may_retry(self):
+        # 上次更新失敗時（上游無法連線），retry_interval 內不再重試
+        return self.last_error is None or time.time() - self.last_attempt_at >= self.retry_interval
+
+    def refresh_in_background(self):
+        """啟動背景更新（已有更新在執行時不重複啟動）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.refresh, name='stock-universe', daemon=True)
+                self._thread.start()
+
+    def refresh(self):
+        """同步取得最新清單並寫入快取，回傳是否成功"""
+        with self._refresh_lock:
+            self.last_attempt_at = time.time()
+            error = None
+            try:
+                fetched = self.fetch()
+            except Exception as e:
+                fetched = None
+                error = str(e)
+            if not fetched:
+                self.last_error = error or '無法取得股票清單'
+                logger.warning(f"更新股票清單失敗，沿用{'快取' if self.source != 'builtin' else '內建'}清單：{self.last_error}")
+                return False
+
+            source, stocks = fetched
+            with self._lock:
+                # 與內建清單比較沒有意義，只記錄兩次實際取得之間的差異
+                if self.stocks is not None and self.source != 'builtin':
+                    self._record_change(self.stocks, stocks, source)
+                self.stocks, self.source, self.fetched_at = stocks, source, time.time()
+                self.last_error = None
+                self._save()
+            logger.info(f"股票清單已更新：{len(stocks)} 支（{source}）")
+            return True
+
+    def _record_change(self, previous, current, source):
+        added = sorted(set(current) - set(previous))
+        removed = sorted(set(previous) - set(current))
+        if not added and not removed:
+            return
+        self.changes.append({
+            'at': time.time(),
+            'source': source,
+            'added': {code: current[code] for code in added},
+            'removed': {code: previous[code] for code in removed}
+        })
+        del self.changes[:-self.max_changes]
+        logger.info(f"股票清單變動：新增 {len(added)} 支 {added[:10]}，移除 {len(removed)} 支 {removed[:10]}")
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"讀取股票清單快取失敗: {e}")
+            return
+        if payload.get('version') != FORMAT_VERSION or not payload.get('stocks'):
+            logger.info(f"股票清單快取版本不符（{payload.get('version')}），忽略")
+            return
+        self.stocks = payload['stocks']
+        self.source = payload.get('source')
+        self.fetched_at = payload.get('fetched_at', 0.0)
+        self.changes = payload.get('changes', [])
+        self.probed = payload.get('probed', {})
+        logger.info(f"載入股票清單快取：{len(self.stocks)} 支（{self.source}，"
+                    f"{(time.time() - self.fetched_at) / 3600:.1f} 小時前）")
+
+    def _save(self):
+        payload = {
+            'version': FORMAT_VERSION,
+            'source': self.source,
+            'fetched_at': self.fetched_at,
+            'stocks': self.stocks,
+            'changes': self.changes,
+            'probed': self.probed
+        }
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"寫入股票清單快取失敗: {e}")
+
+    def discovery_candidates(self, max_probes=100, recheck_seconds=7 * 86400,
+                             change_window=30 * 86400, frontier=3, max_gap=2):
+        """挑出值得探測的未知代碼（依優先順序，最多 max_probes 個）"""
+        known = set(self.get())
+        now = time.time()
+        blocks = {}
+        for code in known:
+            if code.isdigit():
+                blocks.setdefault(int(code) // 100, []).append(int(code))
+
+        def usable(number):
+            code = str(number)
+            return (1000 <= number <= 9999 and code not in known
+                    and now - self.probed.get(code, 0) >= recheck_seconds)
+
+        candidates = []
+        # 1. 最近有新增或移除的百位區段：整段的未知代碼
+        changed_blocks = sorted({
+            int(code) // 100
+            for change in self.changes if now - change['at'] < change_window
+            for code in list(change['added']) + list(change['removed']) if code.isdigit()
+        })
+        for block in changed_blocks:
+            candidates.extend(number for number in range(block * 100, block * 100 + 100) if usable(number))
+        # 2. 各區段最大代碼之後（新上市常接續編號）
+        for block, numbers in sorted(blocks.items()):
+            top = max(numbers)
+            candidates.extend(number for number in range(top + 1, min(top + 1 + frontier, block * 100 + 100))
+                              if usable(number))
+        # 3. 已知代碼之間的小空隙
+        for block, numbers in sorted(blocks.items()):
+            numbers.sort()
+            for low, high in zip(numbers, numbers[1:]):
+                if 1 < high - low <= max_gap + 1:
+                    candidates.extend(number for number in range(low + 1, high) if usable(number))
+
+        return [str(number) for number in dict.fromkeys(candidates)][:max_probes]
+
+    def merge_discovered(self, found, probed):
+        """併入探測結果：found 為 {代碼: 名稱}，probed 為本次探測過的所有代碼"""
+        with self._lock:
+            now = time.time()
+            for code in probed:
+                if code in found:
+                    self.probed.pop(code, None)
+                else:
+                    self.probed[code] = now
+            current = self.stocks if self.stocks is not None else self.fallback()
+            added = {code: name for code, name in found.items() if code not in current}
+            if added:
+                merged = dict(current)
+                merged.update(added)
+                self._record_change(current, merged, 'discovery')
+                self.stocks = merged
+            self._save()
+        logger.info(f"代碼探測完成：探測 {len(probed)} 個，新增 {len(added)} 支 {sorted(added)[:10]}")
+        return added
+
+    def status(self):
+        with self._lock:
+            return {
+                'count': len(self.stocks) if self.stocks else 0,
+                'source': self.source,
+                'fetched_at': self.fetched_at or None,
+                'age_seconds': round(time.time() - self.fetched_at, 1) if self.fetched_at else None,
+                'ttl_seconds': self.ttl,
+                'stale': self.stale(),
+                'refreshing': self._thread is not None and self._thread.is_alive(),
+                'last_attempt_at': self.last_attempt_at,
+                'last_error': self.last_error,
+                'recent_changes': [
+                    {'at': change['at'], 'source': change.get('source'),
+                     'added': sorted(change['added']), 'removed': sorted(change['removed'])}
+                    for change in self.changes[-5:]
+                ]
+            }
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上游資料來源請求與結果統計
+
+所有對 Yahoo Finance / TWSE 的請求都經過 upstream_get()，逐次記錄：
+結果類別（成功、逾時、429 限流、404 查無代碼、5xx、連線錯誤、JSON 錯誤...）、
+延遲、回應大小與重試次數。各來源保留最近一段時間的延遲樣本以計算滾動百分位數，
+供狀態 API 與 /api/metrics 使用，讓並行數與逾時設定可以依實際資料調整。
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+import requests
+
+from metrics import registry as metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# 可重試的結果類別
+RETRYABLE_OUTCOMES = ('timeout', 'rate_limited', 'server_error', 'connection_error')
+
+UPSTREAM_DURATION = metrics_registry.histogram(
+    'twse_screener_upstream_request_duration_seconds', '上游資料來源 HTTP 請求耗時（秒，含重試）', ['source'])
+UPSTREAM_REQUESTS = metrics_registry.counter(
+    'twse_screener_upstream_requests_total', '上游資料來源請求數（依結果類別）', ['source', 'outcome'])
+UPSTREAM_DECODE_FAILURES = metrics_registry.counter(
+    'twse_screener_upstream_decode_failures_total', 'HTTP 成功但解析失敗的上游回應數（依結果類別）', ['source', 'outcome'])
+UPSTREAM_BYTES = metrics_registry.counter(
+    'twse_screener_upstream_response_bytes_total', '上游資料來源回應大小（bytes）', ['source'])
+UPSTREAM_RETRIES = metrics_registry.counter(
+    'twse_screener_upstream_retries_total', '上游資料來源重試次數', ['source'])
+
+
+def classify_response(response):
+    """依 HTTP 狀態碼判斷結果類別"""
+    status = response.status_code
+    if status == 200:
+        return 'ok'
+    if status == 429:
+        return 'rate_limited'
+    if status == 404:
+        return 'not_found'
+    if status >= 500:
+        return 'server_error'
+    return 'http_error'
+
+
+def classify_exception(error):
+    """依例外類型判斷結果類別"""
+    if isinstance(error, requests.exceptions.Timeout):
+        return 'timeout'
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return 'connection_error'
+    if isinstance(error, ValueError):
+        return 'json_error'
+    return 'error'
+
+
+class SourceStats:
+    """單一來源的請求統計"""
+
+    def __init__(self, window=500):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = {}
+        self.status_codes = {}
+        self.requests = 0
+        self.bytes = 0
+        self.retries = 0
+        self.last_error = None
+        self.last_request_at = None
+
+    def snapshot(self):
+        samples = sorted(self.latencies)
+
+        def percentile(p):
+            if not samples:
+                return None
+            index = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+            return round(samples[index], 4)
+
+        return {
+            'requests': self.requests,
+            'outcomes': dict(self.outcomes),
+            'status_codes': dict(self.status_codes),
+            'bytes': self.bytes,
+            'avg_bytes': round(self.bytes / self.requests) if self.requests else 0,
+            'retries': self.retries,
+            'latency_seconds': {
+                'samples': len(samples),
+                'p50': percentile(50),
+                'p90': percentile(90),
+                'p95': percentile(95),
+                'p99': percentile(99),
+                'max': round(samples[-1], 4) if samples else None
+            },
+            'last_error': self.last_error,
+            'last_request_at': self.last_request_at
+        }
+
+
+class UpstreamStats:
+    """各上游來源的滾動統計"""
+
+    def __init__(self, window=500):
+        self.window = window
+        self._sources = {}
+        self._lock = threading.Lock()
+
+    def _source(self, source):
+        stats = self._sources.get(source)
+        if stats is None:
+            stats = self._sources[source] = SourceStats(self.window)
+        return stats
+
+    def record(self, source, outcome, latency, nbytes=0, retries=0, status_code=None, error=None):
+        with self._lock:
+            stats = self._source(source)
+            stats.requests += 1
+            stats.outcomes[outcome] = stats.outcomes.get(outcome, 0) + 1
+            if status_code is not None:
+                stats.status_codes[str(status_code)] = stats.status_codes.get(str(status_code), 0) + 1
+            stats.latencies.append(latency)
+            stats.bytes += nbytes
+            stats.retries += retries
+            stats.last_request_at = time.time()
+            if outcome != 'ok':
+                stats.last_error = {'outcome': outcome, 'detail': error, 'at': stats.last_request_at}
+        UPSTREAM_DURATION.observe(latency, source=source)
+        UPSTREAM_REQUESTS.inc(source=source, outcome=outcome)
+        if nbytes:
+            UPSTREAM_BYTES.inc(nbytes, source=source)
+        if retries:
+            UPSTREAM_RETRIES.inc(retries, source=source)
+
+    def reclassify(self, source, outcome, detail=None):
+        """將一筆已記錄為成功的請求改記為解析階段發現的失敗（例如 JSON 錯誤、無資料）"""
+        with self._lock:
+            stats = self._source(source)
+            if stats.outcomes.get('ok', 0) > 0:
+                stats.outcomes['ok'] -= 1
+            stats.outcomes[outcome] = stats.outcomes.get(outcome, 0) + 1
+            stats.last_error = {'outcome': outcome, 'detail': detail, 'at': time.time()}
+        # Prometheus 計數器不可遞減，解析失敗另以獨立計數器記錄
+        UPSTREAM_DECODE_FAILURES.inc(source=source, outcome=outcome)
+
+    def outcome_counts(self):
+        """各來源目前的結果類別計數（供計算單次執行期間的差異）"""
+        with self._lock:
+            return {source: dict(stats.outcomes) for source, stats in self._sources.items()}
+
+    def snapshot(self):
+        with self._lock:
+            return {source: stats.snapshot() for source, stats in sorted(self._sources.items())}
+
+    def reset(self):
+        with self._lock:
+            self._sources = {}
+
+
+upstream_stats = UpstreamStats()
+
+
+def outcome_delta(before, after):
+    """兩次 outcome_counts() 之間各來源非 ok 結果的增加數"""
+    delta = {}
+    for source, outcomes in after.items():
+        previous = before.get(source, {})
+        changed = {outcome: count - previous.get(outcome, 0) for outcome, count in outcomes.items()
+                   if outcome != 'ok' and count > previous.get(outcome, 0)}
+        if changed:
+            delta[source] = changed
+    return delta
+
+# 預設重試設定（可由應用程式覆寫）
+max_retries = 0
+retry_backoff = 0.5
+
+
+def _retry_delay(response, attempt):
+    """429 時優先採用 Retry-After（最多 5 秒），否則指數退避"""
+    if response is not None:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return min(5.0, float(retry_after))
+    return retry_backoff * (2 ** attempt)
+
+
+def upstream_get(source, url, retries=None, session=None, **kwargs):
+    """對上游資料來源發出 GET 請求，可重試的失敗會自動重試，並記錄結果
+
+    回傳最後一次的 Response；所有嘗試都以例外結束時拋出最後的例外，
+    與直接呼叫 requests.get 的行為一致。傳入 session 時重用其連線池。
+    """
+    retries = max_retries if retries is None else retries
+    get = session.get if session is not None else requests.get
+    start = time.perf_counter()
+    attempt = 0
+    while True:
+        response = None
+        error = None
+        try:
+            response = get(url, **kwargs)
+            outcome = classify_response(response)
+        except requests.exceptions.RequestException as e:
+            error = e
+            outcome = classify_exception(e)
+
+        if outcome in RETRYABLE_OUTCOMES and attempt < retries:
+            time.sleep(_retry_delay(response, attempt))
+            attempt += 1
+            continue
+
+        upstream_stats.record(
+            source,
+            outcome,
+            time.perf_counter() - start,
+            nbytes=len(response.content) if response is not None else 0,
+            retries=attempt,
+            status_code=response.status_code if response is not None else None,
+            error=str(error) if error else (f'HTTP {response.status_code}' if outcome != 'ok' else None)
+        )
+        if error is not None:
+            raise error
+        return response